@@ -1,13 +1,36 @@
+import atexit
 import hashlib
 import json
+import os
 import sqlite3
 import secrets
-from contextlib import closing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from io import BytesIO
-from typing import Dict
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
-from flask import Flask, request, g, make_response, jsonify
+from flask import (
+    Flask,
+    Response,
+    request,
+    g,
+    has_app_context,
+    make_response,
+    jsonify,
+    stream_with_context,
+)
 from flask_jwt_extended import (
     create_access_token,
     set_access_cookies,
@@ -19,68 +42,382 @@ from flask_jwt_extended import (
 )
 
 import config
+from app.cache import course_cache, render_cache
 from app.courses.assessment import Assessment
 from app.courses.clo import Clo
 from app.courses.course import Course
-from app.courses.io import PDFWriter, JSONWriter
+from app.courses.io import Writer, PDFWriter, JSONWriter, get_pdf_styles
 from app.database import (
-    get_course_n_from_db,
+    list_courses_from_db,
     update_course_in_db,
-    load_all_courses_from_db,
-    load_last_course_from_db,
+    iter_courses_from_db,
+    iter_cached_courses_from_db,
+    get_last_course_from_db,
+    get_cached_course_from_db,
+    get_course_version_from_db,
     get_user_from_db,
     get_course_id_from_db,
     add_clo_to_db,
+    add_clos_to_db,
     delete_clo_from_db,
+    delete_clos_from_db,
     add_assessment_to_db,
+    add_assessments_to_db,
     delete_assessment_from_db,
+    delete_assessments_from_db,
     add_course_to_db,
+    RATING_STATS_ORDERS,
+    get_clo_rating_stats_from_db,
+    get_top_clo_rating_stats_from_db,
+    get_assessment_rating_stats_from_db,
+    get_top_assessment_rating_stats_from_db,
+)
+from app.evaluations import (
+    EvaluatorTimeout,
+    evaluate_clo,
+    evaluate_clos,
+    evaluation_cache,
+    evaluator_pool,
+    prune_evaluations,
 )
-from app.evaluation.evaluator import evaluate
+from app.export import course_exporter
+from app.jobs import QueueFull, render_jobs
+from app.metrics import (
+    TimedConnection,
+    registry,
+    request_count,
+    request_seconds,
+    sql_query_count,
+    sql_seconds,
+    sql_timer,
+)
+from app.migrations import migrate
+from app.query_log import query_log
+from app.pool import ConnectionPool
 from app.question import parse_answers
 from app.user import User
+from app.write_behind import WriteBehindBuffer
 
 current_user: User
 
+T = TypeVar("T")
+
+# ratings the frontend gives, besides numbers
+RATINGS = ("positive", "neutral", "negative")
+
 app = Flask(__name__)
 
 # TODO: appropriate handling of secrets
 app.config["JWT_TOKEN_LOCATION"] = ["cookies"]
-app.config["JWT_SECRET_KEY"] = secrets.token_urlsafe(20)
+# every worker of a server shares the key, set it to keep sessions across restarts
+app.config["JWT_SECRET_KEY"] = os.environ.get(
+    "JWT_SECRET_KEY"
+) or secrets.token_urlsafe(20)
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
 
 jwt = JWTManager(app)
 
+# writers of each filetype courses can be downloaded as
+WRITER_CLASSES: Dict[str, Type[Writer]] = {"pdf": PDFWriter, "json": JSONWriter}
+
+# connections which time their statements for the request's metrics and the
+# slow query log
+CONNECTION_CLASS = (
+    TimedConnection
+    if config.METRICS_ENABLED or config.SLOW_QUERY_LOG_ENABLED
+    else sqlite3.Connection
+)
+
+# every write of a worker goes through its one writer connection, one at a time,
+# so writers queue here rather than polling SQLite's lock
+pool = ConnectionPool(
+    config.DATABASE,
+    1,
+    config.DATABASE_PRAGMAS,
+    max_open=1,
+    timeout=config.DATABASE_WRITER_TIMEOUT,
+    factory=CONNECTION_CLASS,
+)
+# routes marked read_only read with these, never waiting for the writer
+read_pool = ConnectionPool(
+    config.DATABASE,
+    config.DATABASE_POOL_SIZE,
+    config.DATABASE_PRAGMAS,
+    read_only=True,
+    factory=CONNECTION_CLASS,
+)
+# endpoints served with a connection from read_pool
+READ_ONLY_ENDPOINTS: Set[str] = set()
+# endpoints served without a database connection
+NO_DB_ENDPOINTS: Set[str] = set()
+
+# ratings and feedback waiting to be written, see insert_event
+write_buffer = WriteBehindBuffer(
+    pool,
+    config.WRITE_BEHIND_BATCH_SIZE,
+    config.WRITE_BEHIND_FLUSH_INTERVAL,
+    config.WRITE_BEHIND_MAX_QUEUE,
+    app.logger,
+)
+
+
+@atexit.register
+def drain_write_buffer():
+    """Write the queued ratings and feedback before the process exits"""
+    write_buffer.shutdown(config.WRITE_BEHIND_SHUTDOWN_TIMEOUT)
+
+
+# renders changed courses into the render cache after their request commits
+prewarm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prewarm")
+prewarm_lock = threading.Lock()
+prewarm_pending: Set[Tuple[int, int]] = set()
+
+warm_up_lock = threading.Lock()
+warm_up_thread: Optional[threading.Thread] = None
+# set once the warm-up has finished, whether or not it succeeded
+warmed_up = threading.Event()
+
+
+def warm_up() -> threading.Thread:
+    """Load the dependencies which are slow to import in the background, so the
+    server can start taking requests while they load. Only the first call starts
+    loading them.
+    """
+    global warm_up_thread
+    with warm_up_lock:
+        if warm_up_thread is None:
+            warm_up_thread = threading.Thread(
+                target=load_slow_dependencies, name="warm-up", daemon=True
+            )
+            warm_up_thread.start()
+    return warm_up_thread
+
+
+def load_slow_dependencies():
+    """Start the evaluator's processes and import reportlab"""
+    start = time.perf_counter()
+    try:
+        evaluator_pool.start()
+        get_pdf_styles()
+    except Exception:
+        app.logger.exception("Could not warm up dependencies")
+        return
+    finally:
+        warmed_up.set()
+    app.logger.info("Warmed up dependencies in %.2fs", time.perf_counter() - start)
+
+
+def prepare_server():
+    """Migrate the database, prune stale evaluations and import the slow
+    dependencies once, in a server's master process before it forks its workers,
+    which inherit what was imported
+
+    Starts no threads or processes, a forked worker would only get the thread
+    which forked it and a broken handle on the processes.
+    """
+    create_tables_in_db()
+    prune_stale_evaluations()
+    registry.clear()
+    get_pdf_styles()
+    if evaluator_pool.workers < 1:
+        evaluator_pool.start()
+    # the workers open their own connections
+    pool.close()
+    read_pool.close()
+
+
+def prune_stale_evaluations():
+    """Delete the stored results of other versions of the evaluator. Imports the
+    evaluator's module to get its version, without loading its models.
+    """
+    try:
+        with writing() as cursor:
+            pruned = prune_evaluations(cursor)
+    except Exception:
+        # only a cache, the server can run without pruning it
+        app.logger.exception("Could not prune stale evaluations")
+        return
+    app.logger.info("Pruned %d results of other evaluator versions", pruned)
+
+
+def init_worker():
+    """Open a server worker's database connections and start its warm-up, in the
+    worker right after it is forked
+    """
+    pool.fill()
+    read_pool.fill()
+    warm_up()
+
+
+def shutdown_worker():
+    """Write the queued ratings and feedback, stop the worker's processes and
+    close its connections, when a server worker exits
+    """
+    write_buffer.shutdown(config.WRITE_BEHIND_SHUTDOWN_TIMEOUT)
+    render_jobs.shutdown()
+    course_exporter.shutdown()
+    evaluator_pool.shutdown()
+    prewarm_executor.shutdown(wait=False, cancel_futures=True)
+    pool.close()
+    read_pool.close()
+    registry.write()
+
+
+def retire_worker(pid: int):
+    """Add up the metrics of a server worker which has exited with those of the
+    workers which exited before it, in the server's master process
+    """
+    try:
+        registry.retire(pid)
+    except (OSError, ValueError):
+        app.logger.exception("Could not retire the metrics of worker %d", pid)
+
+
+@app.before_first_request
+def start_warm_up():
+    """Warm up when the server did not do so as soon as it started"""
+    warm_up()
+
 
 @app.before_first_request
 def create_tables_in_db():
-    """Create table if they don't exist"""
-    with closing(sqlite3.connect(config.DATABASE)) as db:
-        app.logger.info("Creating tables if they do not exist...")
-        with open(config.CREATE_TABLES_SQL) as f:
-            db.executescript(f.read())
-        db.commit()
+    """Create table if they don't exist and apply any pending migrations"""
+    db = pool.acquire()
+    app.logger.info("Creating tables if they do not exist...")
+    with open(config.CREATE_TABLES_SQL) as f:
+        db.executescript(f.read())
+    app.logger.info("Migrating database to the latest schema version...")
+    version = migrate(db, config.MIGRATIONS_DIR)
+    app.logger.info("Database is at schema version %d", version)
+    pool.release(db)
+
+
+def read_only(view: Callable) -> Callable:
+    """Serve a route with a read-only connection, for routes which never write
+    to the database. Goes below the route's @app.route.
+    """
+    READ_ONLY_ENDPOINTS.add(view.__name__)
+    return view
+
+
+def no_db(view: Callable) -> Callable:
+    """Serve a route without a database connection, for routes which never use
+    the database. Goes below the route's @app.route.
+    """
+    NO_DB_ENDPOINTS.add(view.__name__)
+    return view
+
+
+@app.before_request
+def start_request_metrics():
+    """Note when the request started, before it waits for a connection"""
+    if config.METRICS_ENABLED:
+        g.started_at = time.perf_counter()
+        sql_timer.take()
+
+
+@app.after_request
+def remember_status(response):
+    """Remember the response's status for the request's metrics"""
+    g.status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request_metrics(exception):
+    """Count the request, the seconds it took and its SQL statements by route.
+    Teardowns run last to first, so this runs after the connection is released.
+    """
+    started_at = g.pop("started_at", None)
+    if started_at is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    status = 500 if exception is not None else g.pop("status", 500)
+    request_count.inc(route, request.method, str(status))
+    request_seconds.observe(time.perf_counter() - started_at, route, request.method)
+    queries, seconds = sql_timer.take()
+    sql_query_count.inc(route, amount=queries)
+    sql_seconds.inc(route, amount=seconds)
+    registry.write_every(config.METRICS_WRITE_INTERVAL, app.logger)
 
 
 @app.before_request
 def connect_db():
-    """Connect to database before each request"""
-    app.logger.info("Connecting to database: %s...", config.DATABASE)
-    g.db = sqlite3.connect(config.DATABASE)
-    g.db.row_factory = sqlite3.Row
+    """Get a pooled database connection before each request, a read-only one for
+    read_only routes and otherwise the worker's writer connection
+    """
+    if request.endpoint in NO_DB_ENDPOINTS:
+        return
+    app.logger.info("Acquiring connection to database: %s...", config.DATABASE)
+    g.pool = read_pool if request.endpoint in READ_ONLY_ENDPOINTS else pool
+    g.db = g.pool.acquire()
     g.cursor = g.db.cursor()
 
 
 @app.teardown_request
 def commit_and_close_db(exception):
-    """Commit transactions and close the current connection"""
+    """Commit (or roll back on error) and return the connection to the pool"""
     if exception is not None:
         app.logger.error("Got exception: %s...", exception)
     if hasattr(g, "db"):
-        app.logger.info("Closing database: %s...", config.DATABASE)
+        app.logger.info("Releasing connection to database: %s...", config.DATABASE)
         g.cursor.close()
-        g.db.commit()
-        g.db.close()
+        g.pool.release(g.db, exception)
+    changed_courses = g.pop("changed_courses", None)
+    if exception is None and changed_courses and config.RENDER_CACHE_PREWARM:
+        for user_id, course_id in changed_courses:
+            prewarm_render(user_id, course_id)
+
+
+@course_cache.on_invalidate
+def remember_changed_course(user_id: int, course_id: int):
+    """Remember the courses a request changes to pre-warm their renders"""
+    if has_app_context():
+        g.setdefault("changed_courses", set()).add((user_id, course_id))
+
+
+def prewarm_render(user_id: int, course_id: int):
+    """Render a course into the render cache in the background, so its next
+    download does not have to wait for it
+    """
+    key = (user_id, course_id)
+    with prewarm_lock:
+        if key in prewarm_pending:
+            return
+        prewarm_pending.add(key)
+    prewarm_executor.submit(render_in_background, user_id, course_id)
+
+
+def render_in_background(user_id: int, course_id: int):
+    """Render a course with every writer whose renders are cached"""
+    with prewarm_lock:
+        prewarm_pending.discard((user_id, course_id))
+    db = read_pool.acquire()
+    try:
+        cached = get_cached_course_from_db(user_id, course_id, db.cursor())
+        if cached is None:
+            return
+        for writer_class in Writer.__subclasses__():
+            if writer_class.CACHE_RENDERS:
+                render_cache.render(writer_class, cached.course)
+    except Exception:
+        app.logger.exception("Could not pre-warm renders of course %s", course_id)
+    finally:
+        read_pool.release(db)
+
+
+@contextmanager
+def writing() -> Iterator[sqlite3.Cursor]:
+    """Cursor of the writer connection in a transaction of its own, committed at
+    the end of the block, for read_only routes which have something to write
+    """
+    db = pool.acquire()
+    try:
+        yield db.cursor()
+    except BaseException as exception:
+        pool.release(db, exception)
+        raise
+    pool.release(db)
 
 
 @app.after_request
@@ -101,6 +438,36 @@ def refresh_expiring_jwts(response):
         return response
 
 
+@app.route("/health", methods=["GET"])
+@no_db
+def health() -> str:
+    """Check the worker is up, without touching the database"""
+    return json.dumps({"success": True, "result": {"pid": os.getpid()}})
+
+
+@app.route("/ready", methods=["GET"])
+@no_db
+def ready() -> Response:
+    """Check the worker has warmed up and should be sent requests, without
+    touching the database
+    """
+    status = {"pid": os.getpid(), "warmed_up": warmed_up.is_set()}
+    response = jsonify({"success": status["warmed_up"], "result": status})
+    if not warmed_up.is_set():
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+@no_db
+def metrics() -> Response:
+    """Get the request, SQL, render and evaluator metrics of every worker in the
+    Prometheus text format
+    """
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/register", methods=["POST"])
 def register():
     """Register a new user into the database"""
@@ -135,6 +502,7 @@ def register():
 
 
 @app.route("/login", methods=["POST"])
+@read_only
 def login():
     """Login for a user"""
     data = json.loads(request.data)
@@ -157,6 +525,7 @@ def login():
 
 
 @app.route("/logoff", methods=["GET"])
+@read_only
 @jwt_required()
 def logoff() -> Dict:
     """Logoff current user"""
@@ -175,28 +544,46 @@ def user_identity_lookup(user_: User):
 
 @jwt.user_lookup_loader
 def user_lookup_loader(_jwt_header, jwt_data):
-    """Lookup current user and get the last course in the database for the user"""
+    """Lookup current user, their last course in the database is only loaded
+    when `current_user.course` is first used
+    """
     username = jwt_data["sub"]
     app.logger.info("Getting User object for user '%s'...", username)
     user_ = get_user_from_db(username, g.cursor)
     if user_ is None:
         raise RuntimeError(f"Could not find user '{username}' in the database")
-    app.logger.info("Loading courses for user '%s'...", username)
-    if load_last_course_from_db(user_, g.cursor):
+
+    def load_last_course() -> Course:
+        app.logger.info("Loading courses for user '%s'...", username)
+        course = get_last_course_from_db(user_.id, g.cursor)
+        if course is None:
+            app.logger.info("No course found for user '%s'", username)
+            return Course()
         app.logger.info("Loaded course for user '%s'", username)
-    else:
-        app.logger.info("No course found for user '%s'", username)
+        return course
+
+    user_.set_course_loader(load_last_course)
     app.logger.info("Got User object '%s'", user_)
     return user_
 
 
-@jwt_required(optional=True)
 def add_message_to_db(id_: int, msg: str):
     """Adds user feedback to the database"""
-    g.db.execute("INSERT INTO FEEDBACK VALUES (?, ?)", (id_, msg))
+    insert_event("INSERT INTO FEEDBACK VALUES (?, ?)", (id_, msg))
+
+
+def insert_event(statement: str, params: Tuple):
+    """Run an INSERT nothing reads back straight away, such as a rating, through
+    the write-behind buffer when it is enabled and has room, otherwise in the
+    request's transaction. Callers check the parameters' types first, an event
+    which fails to write in the background is only logged.
+    """
+    if not (config.WRITE_BEHIND_ENABLED and write_buffer.add(statement, params)):
+        g.db.execute(statement, params)
 
 
 @app.route("/evaluate", methods=["POST"])
+@read_only
 @jwt_required()
 def evaluating() -> str:
     """Evaluates a clo, returning feedback
@@ -211,12 +598,124 @@ def evaluating() -> str:
     """
     data = json.loads(request.data)
     app.logger.info(data)
+    text = data["inputs"]
+    if not isinstance(text, str):
+        return json.dumps({"success": False, "result": "Error: Invalid text"})
     course = current_user.course
     course_description = course.get_description()
-    result = evaluate(data["inputs"], course_description)
+    try:
+        result = evaluate_clo(text, course_description, g.cursor, writing)
+    except (QueueFull, EvaluatorTimeout) as exception:
+        app.logger.warning("Could not evaluate: %s", exception)
+        return evaluator_unavailable()
+    return json.dumps({"success": True, "result": result})
+
+
+@app.route("/evaluate_batch", methods=["POST"])
+@read_only
+@jwt_required()
+def evaluating_batch() -> str:
+    """Evaluates many clos against the course's description in one go
+
+    Input JSON with a inputs field (list of CLOs as strings)
+
+    Returns:
+        output JSON with a result field (list of feedback, in the order of the
+        inputs)
+    """
+    data = json.loads(request.data)
+    app.logger.info(data)
+    texts = data["inputs"]
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return json.dumps(
+            {"success": False, "result": "Error: Inputs must be a list of strings"}
+        )
+    if len(texts) > config.EVALUATE_BATCH_MAX_SIZE:
+        return json.dumps(
+            {
+                "success": False,
+                "result": f"At most {config.EVALUATE_BATCH_MAX_SIZE} CLOs can be "
+                "evaluated at once",
+            }
+        )
+    course_description = current_user.course.get_description()
+    try:
+        result = evaluate_clos(texts, course_description, g.cursor, writing)
+    except (QueueFull, EvaluatorTimeout) as exception:
+        app.logger.warning("Could not evaluate: %s", exception)
+        return evaluator_unavailable()
     return json.dumps({"success": True, "result": result})
 
 
+def evaluator_unavailable() -> Response:
+    """Response telling the client the evaluator is too busy right now"""
+    return service_unavailable(
+        "The evaluator is busy, please try again", config.EVALUATOR_RETRY_AFTER
+    )
+
+
+def service_unavailable(message: str, retry_after: int) -> Response:
+    """503 response asking the client to try again after `retry_after` seconds"""
+    response = jsonify({"success": False, "result": message})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+@app.route("/evaluator_stats", methods=["GET"])
+@no_db
+def evaluator_stats() -> str:
+    """Get the counters and utilisation of the evaluator's processes"""
+    return json.dumps({"success": True, "result": evaluator_pool.stats()})
+
+
+@app.route("/write_buffer_stats", methods=["GET"])
+@no_db
+def write_buffer_stats() -> str:
+    """Get the depth, counters, batch sizes and flush times of the write-behind
+    buffer of ratings and feedback
+    """
+    stats = {"enabled": config.WRITE_BEHIND_ENABLED, **write_buffer.stats()}
+    return json.dumps({"success": True, "result": stats})
+
+
+@app.route("/query_stats", methods=["GET"])
+@no_db
+def query_stats() -> str:
+    """Get the SQL statements this worker spent the most time running, added up
+    by their normalised SQL, with the slow query log enabled
+
+    Query parameters
+        limit: how many of the top statements to get
+
+    Returns:
+        output JSON with success (bool) and result, a JSON object with enabled
+        (bool) and, if enabled, threshold_seconds, statements (int, how many
+        distinct statements were run), logged (int, how many runs were slow)
+        and top, a list of JSON objects with sql, count (int), total_seconds,
+        mean_seconds, max_seconds and slow (int)
+
+    Every worker answers for itself; the slow runs of every worker are in
+    SLOW_QUERY_LOG_DIR, which benchmarks/slow_query_report.py adds up.
+    """
+    try:
+        limit = int(request.args.get("limit", config.QUERY_STATS_DEFAULT_LIMIT))
+    except ValueError:
+        return json.dumps({"success": False, "result": "Error: Invalid number"})
+    if not 0 < limit <= config.QUERY_STATS_MAX_LIMIT:
+        return json.dumps(
+            {
+                "success": False,
+                "result": "Error: limit must be between 1 and "
+                f"{config.QUERY_STATS_MAX_LIMIT}",
+            }
+        )
+    if query_log is None:
+        return json.dumps({"success": True, "result": {"enabled": False}})
+    stats = {"enabled": True, **query_log.stats(), "top": query_log.report(limit)}
+    return json.dumps({"success": True, "result": stats})
+
+
 # allows users to upload a file
 @app.route("/upload", methods=["POST"])
 @jwt_required()
@@ -280,7 +779,8 @@ def add_assessment() -> str:
     Weight field (assessment weight as int)
 
     Returns:
-        output JSON with success (bool) and result (bool)
+        output JSON with success (bool), result (bool) and id (id of the new
+        assessment as int)
     """
     data = json.loads(request.data)
     course_id = get_course_id_from_db(current_user.id, g.cursor)
@@ -291,22 +791,21 @@ def add_assessment() -> str:
                 "result": "Error: Could not add assessment as course could not be found",
             }
         )
-    result = add_assessment_to_db(
-        current_user.id,
-        course_id,
-        Assessment(data["text"], int(data["weight"])),
-        g.cursor,
-    )
-    return json.dumps({"success": True, "result": result})
+    assessment = Assessment(data["text"], int(data["weight"]))
+    result = add_assessment_to_db(current_user.id, course_id, assessment, g.cursor)
+    return json.dumps({"success": True, "result": result, "id": assessment.id})
 
 
 @app.route("/remove_assessment", methods=["POST"])
 @jwt_required()
 def remove_assessment() -> str:
-    """Removes a clo of the course input JSON text field (CLO to remove as string)
+    """Removes an assessment of the course input JSON text field (assessment to
+    remove as string), weight field (assessment weight as int) and optional id
+    field (id of the assessment to remove as int). With an id that assessment is
+    removed, otherwise one with the same text and weight.
 
     Returns:
-        output JSON with success (bool) and result (bool)
+        output JSON with success (bool) and result (bool, whether one was removed)
     """
     data = json.loads(request.data)
     course_id = get_course_id_from_db(current_user.id, g.cursor)
@@ -317,13 +816,13 @@ def remove_assessment() -> str:
                 "result": "Error: Could not remove assessment as course could not be found",
             }
         )
-    delete_assessment_from_db(
+    result = delete_assessment_from_db(
         current_user.id,
         course_id,
-        Assessment(data["text"], int(data["weight"])),
+        Assessment(data["text"], int(data["weight"]), optional_id(data)),
         g.cursor,
     )
-    return json.dumps({"success": True, "result": True})
+    return json.dumps({"success": True, "result": result})
 
 
 @app.route("/set_assessment_rating", methods=["POST"])
@@ -331,9 +830,17 @@ def remove_assessment() -> str:
 def set_assessment_rating():
     """Set rating for an assessment"""
     data = json.loads(request.data)
-    g.db.execute(
+    if not valid_rating(data.get("rating")):
+        return json.dumps({"success": False, "result": "Error: Invalid rating"})
+    if not valid_text(data.get("text")):
+        return json.dumps({"success": False, "result": "Error: Invalid text"})
+    try:
+        weight = int(data["weight"])
+    except (KeyError, TypeError, ValueError):
+        return json.dumps({"success": False, "result": "Error: Invalid weight"})
+    insert_event(
         "INSERT INTO ASSESSMENT_RATINGS VALUES (?, ?, ?, ?)",
-        (current_user.id, data["text"], int(data["weight"]), data["rating"]),
+        (current_user.id, data["text"], weight, data["rating"]),
     )
     return json.dumps({"success": True, "result": True})
 
@@ -344,7 +851,8 @@ def add_clo() -> str:
     """Adds clo to course input JSON text field (CLO as string)
 
     Returns:
-        output JSON with success (bool) and result (bool)
+        output JSON with success (bool), result (bool) and id (id of the new CLO
+        as int)
     """
     data = json.loads(request.data)
     course_id = get_course_id_from_db(current_user.id, g.cursor)
@@ -355,17 +863,20 @@ def add_clo() -> str:
                 "result": "Error: Could not add clo as course could not be found",
             }
         )
-    result = add_clo_to_db(current_user.id, course_id, Clo(data["text"]), g.cursor)
-    return json.dumps({"success": True, "result": result})
+    clo = Clo(data["text"])
+    result = add_clo_to_db(current_user.id, course_id, clo, g.cursor)
+    return json.dumps({"success": True, "result": result, "id": clo.id})
 
 
 @app.route("/remove_clo", methods=["POST"])
 @jwt_required()
 def remove_clo() -> str:
     """Removes a clo of the course input JSON and text field (CLO to remove as string)
+    and optional id field (id of the CLO to remove as int). With an id that CLO is
+    removed, otherwise one with the same text.
 
     Returns:
-        output JSON with success (bool) and result (bool)
+        output JSON with success (bool) and result (bool, whether one was removed)
     """
     data = json.loads(request.data)
     course_id = get_course_id_from_db(current_user.id, g.cursor)
@@ -376,8 +887,10 @@ def remove_clo() -> str:
                 "result": "Error: Could not remove clo as course could not be found",
             }
         )
-    delete_clo_from_db(current_user.id, course_id, Clo(data["text"]), g.cursor)
-    return json.dumps({"success": True, "result": True})
+    result = delete_clo_from_db(
+        current_user.id, course_id, Clo(data["text"], optional_id(data)), g.cursor
+    )
+    return json.dumps({"success": True, "result": result})
 
 
 @app.route("/set_clo_rating", methods=["POST"])
@@ -385,18 +898,220 @@ def remove_clo() -> str:
 def set_clo_rating():
     """Update database with the CLO rating"""
     data = json.loads(request.data)
-    g.db.execute(
+    if not valid_rating(data.get("rating")):
+        return json.dumps({"success": False, "result": "Error: Invalid rating"})
+    if not valid_text(data.get("text")):
+        return json.dumps({"success": False, "result": "Error: Invalid text"})
+    insert_event(
         "INSERT INTO CLO_RATINGS VALUES (?,?,?)",
         (current_user.id, data["text"], data["rating"]),
     )
     return json.dumps({"success": True, "result": True})
 
 
+def valid_rating(rating) -> bool:
+    """Whether a rating is one of RATINGS or a whole number SQLite can store"""
+    return rating in RATINGS or (type(rating) is int and -(2**63) <= rating < 2**63)
+
+
+def valid_text(text) -> bool:
+    """Whether rated or feedback text is a string, or null as it always could be"""
+    return text is None or isinstance(text, str)
+
+
+@app.route("/rating_stats", methods=["GET"])
+@read_only
+@jwt_required()
+def rating_stats() -> str:
+    """Get statistics of the ratings every user has given to CLOs or assessments
+
+    Query parameters
+        type: clo (default) or assessment
+        text: the rated text, to get the statistics of just that item
+        weight: the rated weight, along with text when type is assessment
+        limit: without text, how many of the top items to get
+        order: without text, rank the top items by mean (default) or count
+
+    Returns:
+        output JSON with success (bool) and result, a list of JSON objects with
+        text, weight (int or null for CLOs), count (int), sum and mean of the
+        scores of the ratings (positive, neutral and negative score 1, 0 and -1)
+        and ratings (JSON object of how many times each rating was given)
+
+    With the write-behind buffer enabled, ratings given in the last
+    WRITE_BEHIND_FLUSH_INTERVAL seconds may not be counted yet.
+    """
+    kind = request.args.get("type", "clo")
+    text = request.args.get("text")
+    order = request.args.get("order", "mean")
+    try:
+        weight = request.args.get("weight", type=int)
+        limit = int(request.args.get("limit", config.RATING_STATS_DEFAULT_LIMIT))
+    except ValueError:
+        return json.dumps({"success": False, "result": "Error: Invalid number"})
+    if kind not in ("clo", "assessment"):
+        return json.dumps({"success": False, "result": f"Error: Unknown type {kind}"})
+    if order not in RATING_STATS_ORDERS:
+        return json.dumps({"success": False, "result": f"Error: Unknown order {order}"})
+    if not 0 < limit <= config.RATING_STATS_MAX_LIMIT:
+        return json.dumps(
+            {
+                "success": False,
+                "result": "Error: limit must be between 1 and "
+                f"{config.RATING_STATS_MAX_LIMIT}",
+            }
+        )
+    if text is None:
+        if kind == "clo":
+            stats = get_top_clo_rating_stats_from_db(limit, order, g.cursor)
+        else:
+            stats = get_top_assessment_rating_stats_from_db(limit, order, g.cursor)
+    else:
+        if kind == "clo":
+            found = get_clo_rating_stats_from_db(text, g.cursor)
+        elif weight is None:
+            return json.dumps({"success": False, "result": "Error: Missing weight"})
+        else:
+            found = get_assessment_rating_stats_from_db(text, weight, g.cursor)
+        stats = [] if found is None else [found]
+    return json.dumps({"success": True, "result": [item._asdict() for item in stats]})
+
+
+@app.route("/update_course_items", methods=["POST"])
+@jwt_required()
+def update_course_items() -> str:
+    """Adds and removes many clos and assessments of the course at once
+
+    Input JSON with optional fields
+        clos: JSON object with optional add and remove fields, each a list of
+            JSON objects with a text field (CLO as string)
+        assessments: JSON object with optional add and remove fields, each a
+            list of JSON objects with a text field (assessment as string) and a
+            weight field (assessment weight as int)
+    Items to remove may also have an id field (id of the item as int), in which
+    case the item with that id is removed rather than one with the same fields.
+
+    Removals match the course as it was before the request and are applied
+    before additions. Everything is applied in one transaction.
+
+    Returns:
+        output JSON with success (bool) and result, shaped like the input with
+        the id (int) of each item added and a boolean per item removed saying
+        whether it was. Items which are not valid, and removals matching
+        nothing, are false. Changes not shaped like the input fail as a whole.
+    """
+    data = json.loads(request.data)
+    if not isinstance(data, dict):
+        return json.dumps({"success": False, "result": "Error: Invalid changes"})
+    clos = data.get("clos", {})
+    assessments = data.get("assessments", {})
+    if not valid_changes(clos) or not valid_changes(assessments):
+        return json.dumps({"success": False, "result": "Error: Invalid changes"})
+    add_clos = [parse_clo(item) for item in clos.get("add", [])]
+    remove_clos = [parse_clo(item) for item in clos.get("remove", [])]
+    add_assessments = [parse_assessment(item) for item in assessments.get("add", [])]
+    remove_assessments = [
+        parse_assessment(item) for item in assessments.get("remove", [])
+    ]
+    count = sum(map(len, [add_clos, remove_clos, add_assessments, remove_assessments]))
+    if count > config.COURSE_ITEMS_BATCH_MAX_SIZE:
+        return json.dumps(
+            {
+                "success": False,
+                "result": f"At most {config.COURSE_ITEMS_BATCH_MAX_SIZE} items can "
+                "be changed at once",
+            }
+        )
+    course_id = get_course_id_from_db(current_user.id, g.cursor)
+    if course_id is None:
+        return json.dumps(
+            {
+                "success": False,
+                "result": "Error: Could not update items as course could not be found",
+            }
+        )
+    user_id = current_user.id
+    removed_clos = iter(
+        delete_clos_from_db(user_id, course_id, valid(remove_clos), g.cursor)
+    )
+    removed_assessments = iter(
+        delete_assessments_from_db(
+            user_id, course_id, valid(remove_assessments), g.cursor
+        )
+    )
+    add_clos_to_db(user_id, course_id, valid(add_clos), g.cursor)
+    add_assessments_to_db(user_id, course_id, valid(add_assessments), g.cursor)
+    result = {
+        "clos": {
+            "add": [clo is not None and clo.id for clo in add_clos],
+            "remove": [clo is not None and next(removed_clos) for clo in remove_clos],
+        },
+        "assessments": {
+            "add": [
+                assessment is not None and assessment.id
+                for assessment in add_assessments
+            ],
+            "remove": [
+                assessment is not None and next(removed_assessments)
+                for assessment in remove_assessments
+            ],
+        },
+    }
+    return json.dumps({"success": True, "result": result})
+
+
+def valid_changes(changes) -> bool:
+    """Whether changes to clos or assessments are a JSON object whose add and
+    remove fields, if it has them, are lists
+    """
+    return isinstance(changes, dict) and all(
+        isinstance(changes.get(field, []), list) for field in ("add", "remove")
+    )
+
+
+def valid(items: List[Optional[T]]) -> List[T]:
+    """Get the items which could be parsed"""
+    return [item for item in items if item is not None]
+
+
+def optional_id(item: dict) -> Optional[int]:
+    """Get the id field of a JSON object, or None if it has none"""
+    return None if item.get("id") is None else int(item["id"])
+
+
+def parse_clo(item) -> Optional[Clo]:
+    """Get the Clo of a JSON object with a text field and optional id field, or
+    None if it is not one
+    """
+    if not isinstance(item, dict) or not isinstance(item.get("text"), str):
+        return None
+    try:
+        return Clo(item["text"], optional_id(item))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_assessment(item) -> Optional[Assessment]:
+    """Get the Assessment of a JSON object with text and weight fields and an
+    optional id field, or None if it is not one
+    """
+    if not isinstance(item, dict) or not isinstance(item.get("text"), str):
+        return None
+    try:
+        return Assessment(item["text"], int(item["weight"]), optional_id(item))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 @app.route("/course_info", methods=["GET"])
+@read_only
 @jwt_required()
 def course_info() -> Dict:
     """Gets the info of the current course for the user
 
+    A request whose If-None-Match matches the course's current ETag gets a 304
+    without the course being loaded.
+
     Returns:
         outputs JSON containing course info as follows
             success: boolean
@@ -407,17 +1122,75 @@ def course_info() -> Dict:
             clos: all clos as an array of strings
             assessments:  all assessments as an array of strings
     """
-    course = current_user.course
-    return course.publish()
+    version = get_course_version_from_db(current_user.id, None, g.cursor)
+    if version is None:
+        return Course.empty()
+    updated_at = to_datetime(version.updated_at)
+    etag = course_etag(version.id, version.version)
+    if not_modified(etag, updated_at):
+        return conditional(Response(status=304), etag, updated_at)
+    cached = get_cached_course_from_db(current_user.id, version.id, g.cursor)
+    if cached is None:
+        return Course.empty()
+    return conditional(
+        make_response(cached.payload),
+        course_etag(version.id, cached.version),
+        updated_at,
+    )
 
 
 @app.route("/all_course_info", methods=["GET"])
+@read_only
 @jwt_required()
-def all_course_info() -> Dict:
-    """Get all course detail info for the current user"""
-    courses = load_all_courses_from_db(current_user.id, g.cursor)
-    app.logger.info("Found courses %s for user %s", courses, current_user)
-    return {"courses": courses}
+def all_course_info() -> Response:
+    """Get all course detail info for the current user
+
+    The courses are streamed a page at a time as they are read from the
+    database, so memory use does not grow with the number of courses
+    """
+    user_id = current_user.id
+
+    def generate() -> Iterator[str]:
+        yield '{"courses": ['
+        separator = ""
+        for courses in iter_courses_from_db(
+            user_id, config.COURSES_STREAM_PAGE_SIZE, g.cursor
+        ):
+            # the courses are already JSON, join them in rather than encoding again
+            yield separator + ", ".join(courses)
+            separator = ", "
+        yield "]}"
+
+    app.logger.info("Streaming courses for user %s", current_user)
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+@app.route("/courses", methods=["GET"])
+@read_only
+@jwt_required()
+def courses_page() -> Response:
+    """Get a page of the current user's courses, ordered by course id
+
+    Query parameters
+        after: only courses with an id greater than this are returned
+        limit: the maximum number of courses to return
+
+    Returns:
+        outputs JSON containing
+            success: boolean
+            courses: the courses on this page, as returned by /course_info
+            next: the `after` of the next page, null on the last page
+    """
+    after = request.args.get("after", 0, type=int)
+    limit = request.args.get("limit", config.COURSES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, config.COURSES_MAX_PAGE_SIZE))
+    courses, next_after = list_courses_from_db(current_user.id, after, limit, g.cursor)
+    # the courses are already JSON, join them in rather than encoding them again
+    body = (
+        f'{{"success": true, "courses": [{", ".join(courses)}], '
+        f'"next": {json.dumps(next_after)}}}'
+    )
+    return Response(body, mimetype="application/json")
 
 
 @app.route("/modify_course", methods=["POST"])
@@ -449,6 +1222,7 @@ def modify_course() -> str:
 
 
 @app.route("/question", methods=["POST"])
+@read_only
 @jwt_required()
 def question() -> str:
     """Converts user input into course description for CLO generation purposes
@@ -481,11 +1255,14 @@ def question() -> str:
 def send_message() -> str:
     """Save feedback message to database"""
     data = json.loads(request.data)
+    if not valid_text(data.get("text")):
+        return json.dumps({"success": False, "result": "Error: Invalid text"})
     add_message_to_db(current_user.id, data["text"])
     return json.dumps({"success": True, "result": "Success: Feedback submitted!"})
 
 
 @app.route("/login_status", methods=["GET"])
+@read_only
 @jwt_required(optional=True)
 def login_status() -> str:
     """Check if a user is currently logged in"""
@@ -493,32 +1270,201 @@ def login_status() -> str:
     return json.dumps({"success": True, "result": bool(current_user)})
 
 
+@app.route("/cache_stats", methods=["GET"])
+@no_db
+def cache_stats() -> str:
+    """Get the hit, miss and eviction counters of the course, render and
+    evaluation caches
+    """
+    stats = {
+        "courses": course_cache.stats(),
+        "renders": render_cache.stats(),
+        "evaluations": evaluation_cache.stats(),
+    }
+    return json.dumps({"success": True, "result": stats})
+
+
 @app.route("/download/<string:filetype>", methods=["GET"])
 @app.route("/download/<string:filetype>/<int:course_id>", methods=["GET"])
+@read_only
 @jwt_required()
 def download(filetype: str, course_id: int = None):
-    """Download course object as a file. Supported filetypes are pdf, json."""
-    # create in memory buffer
-    if course_id is None:
-        course = current_user.course
-    else:
-        course = get_course_n_from_db(current_user.id, course_id, g.cursor)
-        if course is None:
-            raise RuntimeError(
-                f"Got a request for the {course_id}th course for the user but could not find it"
-            )
-    buffer = BytesIO()
-    if filetype == "pdf":
-        writer = PDFWriter(course)
-    elif filetype == "json":
-        writer = JSONWriter(course)
+    """Download course object as a file. Supported filetypes are pdf, json.
+
+    Without a course id the user's most recently created course is downloaded.
+    A request whose If-None-Match matches the course's current ETag gets a 304
+    without the course being loaded or rendered. With `?job=1` the course is
+    rendered in a separate process and the response is the id of a job to get
+    the file from with /render_jobs/<job_id>.
+    """
+    writer_class = get_writer_class(filetype)
+    version = get_course_version_from_db(current_user.id, course_id, g.cursor)
+    if version is None and course_id is not None:
+        raise RuntimeError(f"Could not find course {course_id} for the user")
+    if version is None:
+        # the user has no courses yet, export an empty one
+        course, etag, updated_at = Course(), None, None
     else:
+        updated_at = to_datetime(version.updated_at)
+        etag = course_etag(version.id, version.version, filetype, writer_class.VERSION)
+        if not_modified(etag, updated_at):
+            return conditional(Response(status=304), etag, updated_at)
+        cached = get_cached_course_from_db(current_user.id, version.id, g.cursor)
+        if cached is None:
+            raise RuntimeError(f"Could not find course {version.id} for the user")
+        # writers only read the course, so the shared cached course is not copied
+        course = cached.course
+        etag = course_etag(version.id, cached.version, filetype, writer_class.VERSION)
+    if request.args.get("job", 0, type=int):
+        return submit_render_job(writer_class, course)
+    # slow writers' output is cached on disk by the course's content
+    data = render_cache.render(writer_class, course)
+    # send binary data to frontend
+    response = make_response(data)
+    if etag is None:
+        return response
+    return conditional(response, etag, updated_at)
+
+
+@app.route("/export", methods=["GET"])
+@read_only
+@jwt_required()
+def export() -> Response:
+    """Download all of the current user's courses as a zip archive
+
+    Query parameters
+        filetypes: comma separated filetypes to include each course as, pdf and
+            json by default
+
+    The courses are rendered in parallel and the archive is streamed as each
+    render completes
+    """
+    writer_classes = {
+        filetype: get_writer_class(filetype)
+        for filetype in request.args.get("filetypes", "pdf,json").split(",")
+    }
+    user_id = current_user.id
+    courses = (
+        cached.course
+        for page in iter_cached_courses_from_db(
+            user_id, config.COURSES_STREAM_PAGE_SIZE, g.cursor
+        )
+        for cached in page
+    )
+    app.logger.info("Exporting courses for user %s", current_user)
+    response = Response(
+        stream_with_context(
+            course_exporter.export(courses, writer_classes, app.logger)
+        ),
+        mimetype="application/zip",
+    )
+    response.headers["Content-Disposition"] = "attachment; filename=courses.zip"
+    return response
+
+
+def get_writer_class(filetype: str) -> Type[Writer]:
+    """Get the writer of a filetype"""
+    if filetype not in WRITER_CLASSES:
         raise RuntimeError(
-            f"Invalid filetype option '{filetype}', please give one of ['pdf', 'json']"
+            f"Invalid filetype option '{filetype}', please give one of "
+            f"{list(WRITER_CLASSES)}"
         )
-    # write to buffer
-    writer.save(buffer)
-    # get underlying buffer content
-    data = buffer.getvalue()
-    # send binary data to frontend
-    return make_response(data)
+    return WRITER_CLASSES[filetype]
+
+
+def submit_render_job(writer_class: Type[Writer], course: Course) -> Response:
+    """Render a course in the background, answering with the id of the job to
+    get it from /render_jobs
+    """
+    try:
+        job_id = render_jobs.submit(current_user.id, writer_class, course)
+    except QueueFull:
+        app.logger.warning("Render queue is full, rejecting job for %s", current_user)
+        return service_unavailable(
+            "Too many downloads in progress, try again", config.RENDER_JOB_RETRY_AFTER
+        )
+    response = jsonify({"success": True, "result": job_id})
+    response.status_code = 202
+    response.headers["Location"] = f"/render_jobs/{job_id}"
+    return response
+
+
+@app.route("/render_jobs/<string:job_id>", methods=["GET"])
+@read_only
+@jwt_required()
+def render_job(job_id: str):
+    """Get a download submitted as a job with /download/<filetype>?job=1
+
+    Returns:
+        the rendered file once the job is done, otherwise JSON with
+            success: boolean
+            result: "queued" or "running" while the job is not done (status
+                202), why the job failed (status 500) or that there is no such
+                job (status 404)
+    """
+    status = render_jobs.status(current_user.id, job_id)
+    if status is None:
+        response = jsonify({"success": False, "result": f"No render job {job_id}"})
+        response.status_code = 404
+    elif status.status == "done":
+        return make_response(status.data)
+    elif status.status == "failed":
+        response = jsonify({"success": False, "result": status.error})
+        response.status_code = 500
+    else:
+        response = jsonify({"success": True, "result": status.status})
+        response.status_code = 202
+        response.headers["Retry-After"] = str(config.RENDER_JOB_RETRY_AFTER)
+    return response
+
+
+@app.route("/render_job_stats", methods=["GET"])
+@no_db
+def render_job_stats() -> str:
+    """Get the counters of render jobs and the time they spent queued and
+    rendering
+    """
+    return json.dumps({"success": True, "result": render_jobs.stats()})
+
+
+def course_etag(course_id: int, version: int, *variant) -> str:
+    """ETag of a representation of a course at a version, `variant` tells
+    different representations of the same course apart
+    """
+    return "-".join(str(part) for part in (course_id, version, *variant))
+
+
+def to_datetime(timestamp: Optional[int]) -> Optional[datetime]:
+    """Convert a unix time from the database to a datetime"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def not_modified(etag: str, updated_at: Optional[datetime]) -> bool:
+    """Check if the client's cached copy, going by the request's If-None-Match
+    or else its If-Modified-Since, is still current
+
+    UPDATED_AT, like HTTP dates, is only precise to the second, and the course
+    may have changed again later in the second the client's copy is from, so
+    only a copy from a later second is known to be current.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since is not None and updated_at is not None:
+        return updated_at < request.if_modified_since
+    return False
+
+
+def conditional(
+    response: Response, etag: str, updated_at: Optional[datetime]
+) -> Response:
+    """Add the validators for conditional requests to a response, clients must
+    revalidate their cached copy before every use
+    """
+    response.set_etag(etag)
+    if updated_at is not None:
+        response.last_modified = updated_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
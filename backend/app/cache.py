@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from io import BytesIO
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+import config
+from app.courses.course import Course
+from app.courses.io import Writer, course_content
+from app.metrics import render_seconds
+
+# temporary files older than this were left by a worker that died mid write
+STALE_TEMPORARY_SECONDS = 60 * 60
+# keys are hex sha256 digests, anything else must not be used as a file name
+RENDER_KEY = re.compile("[0-9a-f]{64}")
+
+
+class CachedCourse(NamedTuple):
+    version: int
+    course: Course
+    payload: str
+    size: int
+
+
+class CourseCache:
+    """A thread-safe LRU cache of courses and their published payloads,
+    keyed by (user id, course id)
+
+    Each entry remembers the version of the course it was made from and a lookup
+    for any other version is a miss, so a course changed by another worker is
+    never served stale. Entries are evicted once there are more than
+    `max_entries` of them or their payloads add up to more than `max_bytes`.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self.__lock = threading.Lock()
+        self.__entries: "OrderedDict[Tuple[int, int], CachedCourse]" = OrderedDict()
+        self.__bytes: int = 0
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__evictions: int = 0
+        self.__invalidations: int = 0
+        self.__listeners: List[Callable[[int, int], None]] = []
+
+    def __repr__(self) -> str:
+        return f"<CourseCache {self.max_entries=}, {self.max_bytes=}>"
+
+    def get(self, user_id: int, course_id: int, version: int) -> Optional[CachedCourse]:
+        """Get the cached course, or None if it is not cached at this version"""
+        key = (user_id, course_id)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry.version != version:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry
+
+    def put(
+        self, user_id: int, course_id: int, version: int, course: Course
+    ) -> CachedCourse:
+        """Cache a course at the given version, the course must not be changed
+        afterwards as it is shared by everyone who gets it from the cache
+        """
+        payload = course.publish()
+        entry = CachedCourse(version, course, payload, len(payload))
+        key = (user_id, course_id)
+        with self.__lock:
+            self.__remove(key)
+            if entry.size > self.max_bytes or self.max_entries < 1:
+                return entry
+            self.__entries[key] = entry
+            self.__bytes += entry.size
+            while (
+                len(self.__entries) > self.max_entries or self.__bytes > self.max_bytes
+            ):
+                _, evicted = self.__entries.popitem(last=False)
+                self.__bytes -= evicted.size
+                self.__evictions += 1
+        return entry
+
+    def invalidate(self, user_id: int, course_id: int):
+        """Drop a course from the cache and tell the listeners it changed"""
+        with self.__lock:
+            if self.__remove((user_id, course_id)):
+                self.__invalidations += 1
+        for listener in self.__listeners:
+            listener(user_id, course_id)
+
+    def on_invalidate(
+        self, listener: Callable[[int, int], None]
+    ) -> Callable[[int, int], None]:
+        """Register a function to call with the user and course id of every
+        course that is invalidated, usable as a decorator
+        """
+        self.__listeners.append(listener)
+        return listener
+
+    def clear(self):
+        """Drop every course from the cache"""
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache's counters for monitoring"""
+        with self.__lock:
+            return {
+                "entries": len(self.__entries),
+                "bytes": self.__bytes,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "invalidations": self.__invalidations,
+            }
+
+    def __remove(self, key: Tuple[int, int]) -> bool:
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return False
+        self.__bytes -= entry.size
+        return True
+
+
+course_cache = CourseCache(
+    config.COURSE_CACHE_MAX_ENTRIES, config.COURSE_CACHE_MAX_BYTES
+)
+
+
+class RenderCache:
+    """A content-addressed cache of rendered courses in a directory on disk,
+    shared by every worker using the same directory
+
+    Files are named after a hash of the course's content and the writer and its
+    version, so a changed course or writer is simply never looked up again and
+    nothing needs invalidating. Files are written under a temporary name and
+    renamed into place, so a partly written file is never read. A hit bumps the
+    file's modification time and once the files add up to more than
+    `max_bytes` the least recently used are removed.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.__lock = threading.Lock()
+        # estimate of the bytes in the directory, None until it is first scanned
+        self.__bytes: Optional[int] = None
+        self.__hits: int = 0
+        self.__misses: int = 0
+        self.__writes: int = 0
+        self.__evictions: int = 0
+
+    def __repr__(self) -> str:
+        return f"<RenderCache {self.directory=}, {self.max_bytes=}>"
+
+    @staticmethod
+    def key(writer_class: Type[Writer], course: Course) -> str:
+        """Get the key of a course rendered by a writer"""
+        content = json.dumps(
+            {
+                "writer": writer_class.__name__,
+                "version": writer_class.VERSION,
+                "course": course_content(course),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def render(self, writer_class: Type[Writer], course: Course) -> bytes:
+        """Render a course, using the cached output of an earlier render of the
+        same content if there is one
+        """
+        if not writer_class.CACHE_RENDERS:
+            return self.__render(writer_class, course)
+        key = self.key(writer_class, course)
+        data = self.get(key)
+        if data is None:
+            data = self.__render(writer_class, course)
+            self.put(key, data)
+        return data
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Get the cached output with the given key, or None if it is not cached"""
+        if not RENDER_KEY.fullmatch(key):
+            return None
+        path = self.__path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self.__lock:
+                self.__misses += 1
+            return None
+        # the file may have been evicted since it was read
+        with suppress(FileNotFoundError):
+            os.utime(path)
+        with self.__lock:
+            self.__hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Cache output under the given key, replacing any output already there"""
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.directory, prefix=f".{key}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temporary, self.__path(key))
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.unlink(temporary)
+            raise
+        with self.__lock:
+            self.__writes += 1
+            if self.__bytes is not None:
+                self.__bytes += len(data)
+            if self.__bytes is None or self.__bytes > self.max_bytes:
+                self.__evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the cache's counters for monitoring, counted by this worker only"""
+        with self.__lock:
+            return {
+                "bytes": self.__bytes or 0,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "writes": self.__writes,
+                "evictions": self.__evictions,
+            }
+
+    def __render(self, writer_class: Type[Writer], course: Course) -> bytes:
+        """Render a course in this process, recording how long it took"""
+        data, seconds = timed_render(writer_class, course)
+        render_seconds.observe(seconds, writer_class.__name__)
+        return data
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def __evict(self):
+        """Remove the least recently used files until they take up at most 90% of
+        `max_bytes`, leaving room for a few more writes before scanning again
+        """
+        files = []
+        total = 0
+        now = time.time()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith("."):
+                    if now - stat.st_mtime > STALE_TEMPORARY_SECONDS:
+                        with suppress(FileNotFoundError):
+                            os.unlink(entry.path)
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            # another worker may be evicting the same file
+            with suppress(FileNotFoundError):
+                os.unlink(path)
+                self.__evictions += 1
+            total -= size
+        self.__bytes = total
+
+
+def render(writer_class: Type[Writer], course: Course) -> bytes:
+    """Render a course with a writer"""
+    buffer = BytesIO()
+    writer_class(course).save(buffer)
+    return buffer.getvalue()
+
+
+def timed_render(writer_class: Type[Writer], course: Course) -> Tuple[bytes, float]:
+    """Render a course with a writer, returning the output and the seconds it
+    took, for renders in pool processes whose metrics are never reported
+    """
+    start = time.perf_counter()
+    data = render(writer_class, course)
+    return data, time.perf_counter() - start
+
+
+render_cache = RenderCache(config.RENDER_CACHE_DIR, config.RENDER_CACHE_MAX_BYTES)
@@ -1,13 +1,17 @@
+from typing import Optional
+
 from app.courses.element import Element
 
 
 class Assessment(Element):
-    def __init__(self, text: str, weight: int):
+    def __init__(self, text: str, weight: int, id_: Optional[int] = None):
         super().__init__(text)
         self.weight: int = weight
+        # the id of the assessment in the database, None if it was not loaded from it
+        self.id: Optional[int] = id_
 
     def __repr__(self) -> str:
-        return f"<Assessment {self.text=}, {self.weight=}>"
+        return f"<Assessment {self.id=}, {self.text=}, {self.weight=}>"
 
     def get_weight(self) -> int:
         return self.weight
@@ -1,12 +1,16 @@
+from typing import Optional
+
 from app.courses.element import Element
 
 
 class Clo(Element):
-    def __init__(self, text: str):
+    def __init__(self, text: str, id_: Optional[int] = None):
         super().__init__(text)
+        # the id of the clo in the database, None if it was not loaded from it
+        self.id: Optional[int] = id_
 
     def __repr__(self) -> str:
-        return f"<Clo {self.text=}>"
+        return f"<Clo {self.id=}, {self.text=}>"
 
     def valid(self) -> bool:
         # Should this just be type(get_text()) == str?
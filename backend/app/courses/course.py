@@ -1,5 +1,6 @@
 # a container for the CLO's and assessments associated with a course
 # allows for them to be saved and manipulated
+import copy
 import json
 from typing import Dict, List, Optional, Union
 
@@ -17,7 +18,10 @@ class Course:
         description: str = "",
         clos: List[Union[Clo, Dict]] = None,
         assessments: List[Union[Assessment, Dict]] = None,
+        id_: Optional[int] = None,
     ):
+        # the id of the course in the database, None if it was not loaded from it
+        self.id: Optional[int] = id_
         self.title: str = title
         self.discipline: str = discipline
         self.code: str = code
@@ -26,13 +30,19 @@ class Course:
         self.clos = [] if clos is None else clos
         self.assessments = [] if assessments is None else assessments
         if self.clos and type(self.clos[0]) is dict:
-            self.clos = [Clo(**_) for _ in self.clos]
+            self.clos = [Clo(_["text"], _.get("id")) for _ in self.clos]
         if self.assessments and type(self.assessments[0]) is dict:
-            self.assessments = [Assessment(**_) for _ in self.assessments]
+            self.assessments = [
+                Assessment(_["text"], _["weight"], _.get("id"))
+                for _ in self.assessments
+            ]
+        self.__index_clos()
+        self.__index_assessments()
 
     def __repr__(self) -> str:
         return (
             f"<Course "
+            f"{self.id=}, "
             f"{self.title=}, "
             f"{self.discipline=}, "
             f"{self.code=}, "
@@ -42,6 +52,10 @@ class Course:
             f"{self.assessments=}>"
         )
 
+    # returns a deep copy of the course that can be changed independently
+    def copy(self) -> "Course":
+        return copy.deepcopy(self)
+
     def set_title(self, title: str):
         self.title = title
 
@@ -72,58 +86,108 @@ class Course:
     def get_description(self) -> str:
         return self.description
 
+    # indexes the positions of the clos by text and the clos by database id
+    def __index_clos(self):
+        self.__clo_positions: Dict[str, List[int]] = {}
+        self.__clos_by_id: Dict[int, Clo] = {}
+        for i, clo in enumerate(self.clos):
+            self.__index_clo(i, clo)
+
+    def __index_clo(self, position: int, clo: Clo):
+        self.__clo_positions.setdefault(clo.get_text(), []).append(position)
+        if clo.id is not None:
+            self.__clos_by_id[clo.id] = clo
+
+    # indexes the positions of the assessments by text and the assessments by
+    # database id
+    def __index_assessments(self):
+        self.__assessment_positions: Dict[str, List[int]] = {}
+        self.__assessments_by_id: Dict[int, Assessment] = {}
+        for i, assessment in enumerate(self.assessments):
+            self.__index_assessment(i, assessment)
+
+    def __index_assessment(self, position: int, assessment: Assessment):
+        positions = self.__assessment_positions.setdefault(assessment.get_text(), [])
+        positions.append(position)
+        if assessment.id is not None:
+            self.__assessments_by_id[assessment.id] = assessment
+
     def add_clo(self, clo: Clo) -> bool:
         if clo.valid():
             self.clos.append(clo)
+            self.__index_clo(len(self.clos) - 1, clo)
             return True
         else:
             return False
 
-    # TODO: consider better id then just the index
-    def fetch_clo(self, id: int) -> Clo:
-        return self.clos[id]
-
-    def remove_clo(self, id: int) -> Clo:
-        return self.clos.pop(id)
+    # returns the clo with the given database id, None if there is none
+    def fetch_clo(self, id_: int) -> Optional[Clo]:
+        return self.__clos_by_id.get(id_)
+
+    # removes and returns the clo with the given database id, None if there is none
+    def remove_clo(self, id_: int) -> Optional[Clo]:
+        clo = self.__clos_by_id.get(id_)
+        if clo is None:
+            return None
+        position = next(
+            i for i in self.__clo_positions[clo.get_text()] if self.clos[i] is clo
+        )
+        self.clos.pop(position)
+        # the clos after it have moved down a position
+        self.__index_clos()
+        return clo
 
     def add_assessment(self, assessment: Assessment) -> bool:
         if assessment.valid():
             self.assessments.append(assessment)
+            self.__index_assessment(len(self.assessments) - 1, assessment)
             return True
         else:
             return False
 
-    # determine how to uniquely id a assessment
-    def fetch_assessment(self, id):
-        return
-
-    # determine how to uniquely id a clo
-    def remove_assessment(self, id):
-        return self.assessments.pop(id)
+    # returns the assessment with the given database id, None if there is none
+    def fetch_assessment(self, id_: int) -> Optional[Assessment]:
+        return self.__assessments_by_id.get(id_)
+
+    # removes and returns the assessment with the given database id, None if
+    # there is none
+    def remove_assessment(self, id_: int) -> Optional[Assessment]:
+        assessment = self.__assessments_by_id.get(id_)
+        if assessment is None:
+            return None
+        position = next(
+            i
+            for i in self.__assessment_positions[assessment.get_text()]
+            if self.assessments[i] is assessment
+        )
+        self.assessments.pop(position)
+        # the assessments after it have moved down a position
+        self.__index_assessments()
+        return assessment
 
+    # returns the position of the first clo with the text, -1 if there is none
     def find_clo(self, search: str) -> int:
-        for i, clo in enumerate(self.clos):
-            if clo.matches(search):
-                return i
-        # no clo found
-        return -1
+        positions = self.__clo_positions.get(search)
+        return positions[0] if positions else -1
 
-    # returns all clos that match the search
+    # returns all clos with the text
     def find_clos(self, search: str) -> List[Clo]:
-        matching = [clo for clo in self.clos if clo.matches(search)]
-        return matching
+        return [self.clos[i] for i in self.__clo_positions.get(search, [])]
 
+    # returns the position of the first assessment with the text and weight, -1 if
+    # there is none
     def find_assessment(self, search: str, weight: int) -> int:
-        for i, ass in enumerate(self.assessments):
-            if ass.matches(search, weight):
+        for i in self.__assessment_positions.get(search, []):
+            if self.assessments[i].get_weight() == weight:
                 return i
         # no assessment found
         return -1
 
-    # returns assessments that match the search
+    # returns all assessments with the text
     def find_assessments(self, search: str) -> List[Assessment]:
-        matching = [ass for ass in self.assessments if ass.matches(search)]
-        return matching
+        return [
+            self.assessments[i] for i in self.__assessment_positions.get(search, [])
+        ]
 
     # returns an empty JSON container
     @staticmethod
@@ -135,6 +199,7 @@ class Course:
     def encode(self, clos: Dict, assessments: Dict) -> dict:
         return {
             "success": True,
+            "id": self.id,
             "title": self.title,
             "discipline": self.discipline,
             "code": self.code,
@@ -155,8 +220,9 @@ class Course:
             clos = self.clos
         if assessments is None:
             assessments = self.assessments
-        clos = [{"text": x.get_text()} for x in clos]
+        clos = [{"id": x.id, "text": x.get_text()} for x in clos]
         assessments = [
-            {"text": x.get_text(), "weight": x.get_weight()} for x in assessments
+            {"id": x.id, "text": x.get_text(), "weight": x.get_weight()}
+            for x in assessments
         ]
         return json.dumps(self.encode(clos, assessments))
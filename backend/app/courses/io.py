@@ -1,17 +1,42 @@
 import json
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from io import BytesIO
 from typing import Union
 
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
-
 from app.courses.course import Course
 
 
+def course_content(course: Course) -> dict:
+    """The content of a course which writers render, without its id"""
+    return {
+        "title": course.get_title(),
+        "faculty": course.get_faculty(),
+        "discipline": course.get_discipline(),
+        "code": course.get_code(),
+        "description": course.get_description(),
+        "clos": [
+            {
+                "text": clo.get_text(),
+            }
+            for clo in course.clos
+        ],
+        "assessments": [
+            {
+                "text": assessment.get_text(),
+                "weight": assessment.get_weight(),
+            }
+            for assessment in course.assessments
+        ],
+    }
+
+
 class Writer(ABC):
+    # bump whenever a change to save changes its output
+    VERSION: int = 1
+    # whether output is worth keeping in the render cache, for slow writers
+    CACHE_RENDERS: bool = False
+
     def __init__(self, course: Course):
         self._course: Course = course
 
@@ -25,26 +50,7 @@ class JSONWriter(Writer):
         super().__init__(course)
 
     def save(self, path: Union[BytesIO, str]):
-        out = {
-            "title": self._course.get_title(),
-            "faculty": self._course.get_faculty(),
-            "discipline": self._course.get_discipline(),
-            "code": self._course.get_code(),
-            "description": self._course.get_description(),
-            "clos": [
-                {
-                    "text": clo.get_text(),
-                }
-                for clo in self._course.clos
-            ],
-            "assessments": [
-                {
-                    "text": assessment.get_text(),
-                    "weight": assessment.get_weight(),
-                }
-                for assessment in self._course.assessments
-            ],
-        }
+        out = course_content(self._course)
         if isinstance(path, BytesIO):
             path.write(json.dumps(out).encode())
         else:
@@ -53,49 +59,59 @@ class JSONWriter(Writer):
                 json.dump(out, f)
 
 
+@lru_cache(maxsize=None)
+def get_pdf_styles():
+    """Get reportlab's sample style sheet, importing reportlab on first use as
+    it is slow to import and only needed to render PDFs
+    """
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    return getSampleStyleSheet()
+
+
 class PDFWriter(Writer):
-    __styles = getSampleStyleSheet()
-    __styleT = __styles["Title"]
-    __styleN = __styles["Normal"]
-    __styleH1 = __styles["Heading1"]
-    __styleH2 = __styles["Heading2"]
-    __styleBullet = __styles["Bullet"]
+    CACHE_RENDERS = True
 
     def __init__(self, course: Course):
         super().__init__(course)
 
     def save(self, path: Union[BytesIO, str]):
+        from reportlab.lib import colors
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+
+        styles = get_pdf_styles()
         doc = SimpleDocTemplate(path)
         story = []
         story.append(
-            Paragraph(self._course.title or "PLACEHOLDER TITLE", PDFWriter.__styleT)
+            Paragraph(self._course.title or "PLACEHOLDER TITLE", styles["Title"])
         )
         story.append(
             Paragraph(
                 f"{self._course.faculty or 'PLACEHOLDER FACULTY'}: "
                 f"{self._course.discipline or 'PLACEHOLDER DISCIPLINE'} "
                 f"{self._course.code or 'PLACEHOLDER CODE'}",
-                PDFWriter.__styleH1,
+                styles["Heading1"],
             )
         )
         story.append(Spacer(1, 0.1 * inch))
         story.append(
             Paragraph(
                 self._course.description or "PLACEHOLDER DESCRIPTION",
-                PDFWriter.__styleN,
+                styles["Normal"],
             )
         )
         story.append(Spacer(1, 0.1 * inch))
-        story.append(Paragraph("Course Learning Outcomes", PDFWriter.__styleH2))
+        story.append(Paragraph("Course Learning Outcomes", styles["Heading2"]))
         for clo in self._course.clos:
             story.append(
                 Paragraph(
                     f"{clo.text or 'PLACEHOLDER CLO TEXT'}",
-                    PDFWriter.__styleBullet,
+                    styles["Bullet"],
                     bulletText="*",
                 )
             )
-        story.append(Paragraph("Assessments", PDFWriter.__styleH2))
+        story.append(Paragraph("Assessments", styles["Heading2"]))
         data = [["Assessment Type", "Assessment Weights"]]
         data += [
             [
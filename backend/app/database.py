@@ -1,32 +1,119 @@
 import sqlite3
-from typing import Optional, List, Dict
+from difflib import SequenceMatcher
+from typing import Optional, Iterator, List, Dict, NamedTuple, Set, Tuple
 
+from app.cache import CachedCourse, course_cache
 from app.courses.course import Course
 from app.courses.clo import Clo
 from app.courses.assessment import Assessment
 from app.user import User
 
+# stays well under SQLITE_MAX_VARIABLE_NUMBER on every SQLite version
+MAX_COURSES_PER_QUERY = 500
+MAX_VARIABLES_PER_QUERY = 999
 
-def get_course_n_from_db(
+
+class CourseVersion(NamedTuple):
+    id: int
+    # bumped on every change to the course, see scripts/migrations
+    version: int
+    # unix time of the last change to the course
+    updated_at: Optional[int]
+
+
+class RatingStats(NamedTuple):
+    # the rated text, normalised as lower(trim(text))
+    text: str
+    # None for clos
+    weight: Optional[int]
+    count: int
+    # of the scores of the ratings, see scripts/migrations
+    sum: int
+    mean: Optional[float]
+    # the number of times each rating was given
+    ratings: Dict[str, int]
+
+
+# ways to rank the top rating statistics, by name
+RATING_STATS_ORDERS = {
+    "mean": "MEAN DESC, COUNT DESC",
+    "count": "COUNT DESC, MEAN DESC",
+}
+
+
+def get_cached_course_from_db(
     user_id: int, course_id: int, cursor: sqlite3.Cursor
-) -> Optional[Course]:
-    """Get the Nth course for a user from the database"""
-    cursor.execute("SELECT * FROM COURSES WHERE USER_ID=?", (user_id,))
-    rows = cursor.fetchall()
-    if course_id > len(rows):
+) -> Optional[CachedCourse]:
+    """Given a user id and a course id, get the cache entry of the course,
+    loading it from the database if it is not cached
+    """
+    cursor.execute(
+        "SELECT * FROM COURSES WHERE ID=? AND USER_ID=?", (course_id, user_id)
+    )
+    row = cursor.fetchone()
+    if row is None:
         return None
+    return get_cached_courses_from_db(user_id, [row], cursor)[0]
+
+
+def get_course_version_from_db(
+    user_id: int, course_id: Optional[int], cursor: sqlite3.Cursor
+) -> Optional[CourseVersion]:
+    """Given a user id and a course id, or None for the users' most recently
+    created course, get the version of the course without loading it
+    """
+    if course_id is None:
+        cursor.execute(
+            """
+            SELECT ID, VERSION, UPDATED_AT FROM COURSES
+            WHERE USER_ID=? ORDER BY ID DESC LIMIT 1
+            """,
+            (user_id,),
+        )
     else:
-        row = rows[course_id]
-        course = Course(
-            row["TITLE"],
-            row["DISCIPLINE"],
-            row["CODE"],
-            row["FACULTY"],
-            row["DESCRIPTION"],
+        cursor.execute(
+            "SELECT ID, VERSION, UPDATED_AT FROM COURSES WHERE ID=? AND USER_ID=?",
+            (course_id, user_id),
         )
-        load_course_clos_from_db(user_id, row["ID"], course, cursor)
-        load_course_assessments_from_db(user_id, row["ID"], course, cursor)
-        return course
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return CourseVersion(*row)
+
+
+def list_courses_from_db(
+    user_id: int, after: int, limit: int, cursor: sqlite3.Cursor
+) -> Tuple[List[str], Optional[int]]:
+    """Given a user id, get a page of at most `limit` of the users' courses
+    published as JSON, ordered by course id and starting after the course id
+    `after`.
+
+    Returns:
+        (the published courses, the `after` for the next page or None if this
+        is the last page)
+    """
+    cached, next_after = page_cached_courses_from_db(user_id, after, limit, cursor)
+    return [entry.payload for entry in cached], next_after
+
+
+def page_cached_courses_from_db(
+    user_id: int, after: int, limit: int, cursor: sqlite3.Cursor
+) -> Tuple[List[CachedCourse], Optional[int]]:
+    """Given a user id, get the cache entries of a page of at most `limit` of
+    the users' courses, ordered by course id and starting after the course id
+    `after`.
+
+    Returns:
+        (the cache entries, the `after` for the next page or None if this is
+        the last page)
+    """
+    cursor.execute(
+        "SELECT * FROM COURSES WHERE USER_ID=? AND ID>? ORDER BY ID LIMIT ?",
+        (user_id, after, limit + 1),
+    )
+    rows = cursor.fetchall()
+    next_after = rows[limit - 1]["ID"] if len(rows) > limit else None
+    return get_cached_courses_from_db(user_id, rows[:limit], cursor), next_after
 
 
 def update_course_in_db(
@@ -34,12 +121,19 @@ def update_course_in_db(
 ):
     """Given a user id, a course id, and a course object,
     update that course id with the details of the course object
+
+    Only what changed is written: the stored course learning outcomes and
+    assessments are diffed against the course object's, and rows whose content
+    is unchanged are left alone
     """
     cursor.execute(
         """
         UPDATE COURSES
         SET TITLE = ?, DISCIPLINE = ?, CODE = ?, FACULTY = ?, DESCRIPTION = ?
-        WHERE ID = ? AND USER_ID = ?
+        WHERE ID = ? AND USER_ID = ? AND NOT (
+            TITLE IS ?1 AND DISCIPLINE IS ?2 AND CODE IS ?3
+            AND FACULTY IS ?4 AND DESCRIPTION IS ?5
+        )
         """,
         (
             course.title,
@@ -51,85 +145,224 @@ def update_course_in_db(
             user_id,
         ),
     )
-    delete_all_clos_from_db(user_id, course_id, cursor)
-    delete_all_assessments_from_db(user_id, course_id, cursor)
-    for clo in course.clos:
-        add_clo_to_db(user_id, course_id, clo, cursor)
-    for assessment in course.assessments:
-        add_assessment_to_db(user_id, course_id, assessment, cursor)
+    _update_course_children_in_db(
+        "CLOS",
+        ("TEXT",),
+        user_id,
+        course_id,
+        [(clo.text,) for clo in course.clos],
+        cursor,
+    )
+    _update_course_children_in_db(
+        "ASSESSMENTS",
+        ("TEXT", "WEIGHT"),
+        user_id,
+        course_id,
+        [(assessment.text, assessment.weight) for assessment in course.assessments],
+        cursor,
+    )
+    course_cache.invalidate(user_id, course_id)
 
 
-def load_all_courses_from_db(user_id: int, cursor: sqlite3.Cursor) -> List[Dict]:
-    """Given a user object, populate the users' course object
-    with the necessary details from the database
+def _update_course_children_in_db(
+    table: str,
+    columns: Tuple[str, ...],
+    user_id: int,
+    course_id: int,
+    wanted: List[Tuple],
+    cursor: sqlite3.Cursor,
+):
+    """Make the rows of a course's child table (CLOS or ASSESSMENTS) hold the
+    `wanted` values of `columns`, in order, with as few writes as possible
     """
-    cursor.execute("SELECT * FROM COURSES WHERE USER_ID=?", (user_id,))
-    rows = cursor.fetchall()
-    courses = []
-    for row in rows:
-        course = Course(
-            row["TITLE"],
-            row["DISCIPLINE"],
-            row["CODE"],
-            row["FACULTY"],
-            row["DESCRIPTION"],
+    names = ", ".join(columns)
+    cursor.execute(
+        f"SELECT ID, {names} FROM {table} WHERE USER_ID=? AND COURSE_ID=? ORDER BY ID",
+        (user_id, course_id),
+    )
+    stored = [(row[0], tuple(row[1:])) for row in cursor.fetchall()]
+    updates, deletes, inserts = _diff_rows(stored, wanted)
+    if deletes:
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE ID=?", [(id_,) for id_ in deletes]
+        )
+    if updates:
+        assignments = ", ".join(f"{column}=?" for column in columns)
+        cursor.executemany(
+            f"UPDATE {table} SET {assignments} WHERE ID=?",
+            [(*values, id_) for id_, values in updates],
+        )
+    if inserts:
+        placeholders = ", ".join("?" * len(columns))
+        cursor.executemany(
+            f"""
+            INSERT INTO {table} (USER_ID, COURSE_ID, {names})
+            VALUES (?, ?, {placeholders})
+            """,
+            [(user_id, course_id, *values) for values in inserts],
         )
-        load_course_clos_from_db(user_id, row["ID"], course, cursor)
-        load_course_assessments_from_db(user_id, row["ID"], course, cursor)
-        courses.append(course.publish())
-    return courses
 
 
-def load_last_course_from_db(user_: User, cursor: sqlite3.Cursor) -> bool:
-    """Given a user object, populate the users' course object
-    with the necessary details from the database
+def _diff_rows(
+    stored: List[Tuple[int, Tuple]], wanted: List[Tuple]
+) -> Tuple[List[Tuple[int, Tuple]], List[int], List[Tuple]]:
+    """Work out the writes that turn the `stored` (id, values) rows, ordered by
+    id, into the `wanted` values in the same order.
+
+    Rows are read back ordered by id and new rows always get the largest ids,
+    so new values can only be inserted after every kept row. A value added
+    before the end of the stored rows is written by updating the rows that
+    follow it in place instead.
+
+    Returns:
+        (updates as (id, values), ids to delete, values to insert)
+    """
+    ids = [id_ for id_, _ in stored]
+    matcher = SequenceMatcher(None, [values for _, values in stored], wanted, False)
+    updates, deletes, inserts = [], [], []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        paired = min(i2 - i1, j2 - j1)
+        updates += zip(ids[i1 : i1 + paired], wanted[j1 : j1 + paired])
+        deletes += ids[i1 + paired : i2]
+        if j1 + paired == j2:
+            continue
+        if i2 == len(stored):
+            inserts += wanted[j1 + paired : j2]
+            continue
+        # an insertion before the last stored row, rewrite everything after it
+        remaining, rest = stored[i2:], wanted[j1 + paired :]
+        for (id_, values), new_values in zip(remaining, rest):
+            if values != new_values:
+                updates.append((id_, new_values))
+        deletes += [id_ for id_, _ in remaining[len(rest) :]]
+        inserts += rest[len(remaining) :]
+        break
+    return updates, deletes, inserts
+
+
+def get_last_course_from_db(user_id: int, cursor: sqlite3.Cursor) -> Optional[Course]:
+    """Given a user id, get the users' most recently created course
+    from the database
+    """
+    cached = get_cached_last_course_from_db(user_id, cursor)
+    return None if cached is None else cached.course.copy()
+
+
+def get_cached_last_course_from_db(
+    user_id: int, cursor: sqlite3.Cursor
+) -> Optional[CachedCourse]:
+    """Given a user id, get the cache entry of the users' most recently created
+    course, loading it from the database if it is not cached
     """
     cursor.execute(
-        "SELECT * FROM COURSES WHERE USER_ID=? ORDER BY ID DESC LIMIT 1", (user_.id,)
+        "SELECT * FROM COURSES WHERE USER_ID=? ORDER BY ID DESC LIMIT 1", (user_id,)
     )
     row = cursor.fetchone()
     if row is None:
-        return False
-    course = user_.course
-    course.title = row["TITLE"]
-    course.discipline = row["DISCIPLINE"]
-    course.code = row["CODE"]
-    course.faculty = row["FACULTY"]
-    course.description = row["DESCRIPTION"]
-    load_course_clos_from_db(user_.id, row["ID"], course, cursor)
-    load_course_assessments_from_db(user_.id, row["ID"], course, cursor)
-    return True
+        return None
+    return get_cached_courses_from_db(user_id, [row], cursor)[0]
 
 
-def load_course_clos_from_db(
-    user_id: int, course_id: int, course: Course, cursor: sqlite3.Cursor
-):
-    """Given a user id and a course id, populate the course object
-    with found course learning outcomes from the database
+def get_cached_courses_from_db(
+    user_id: int, rows: List[sqlite3.Row], cursor: sqlite3.Cursor
+) -> List[CachedCourse]:
+    """Given a user id and rows of the COURSES table, get the cache entries of
+    the courses. Courses that are not cached at the row's VERSION are loaded
+    from the database together and cached.
+
+    The entries are shared, copy an entry's course before changing it
     """
-    cursor.execute(
-        "SELECT * FROM CLOS WHERE USER_ID=? AND COURSE_ID=?", (user_id, course_id)
-    )
-    rows = cursor.fetchall()
-    course.clos = []
-    for row in rows:
-        course.add_clo(Clo(row["TEXT"]))
+    entries = [course_cache.get(user_id, row["ID"], row["VERSION"]) for row in rows]
+    missing = [row for row, entry in zip(rows, entries) if entry is None]
+    if missing:
+        loaded = iter(
+            course_cache.put(user_id, row["ID"], row["VERSION"], course)
+            for row, course in zip(
+                missing, load_courses_from_db(user_id, missing, cursor)
+            )
+        )
+        entries = [next(loaded) if entry is None else entry for entry in entries]
+    return entries
 
 
-def load_course_assessments_from_db(
-    user_id: int, course_id: int, course: Course, cursor: sqlite3.Cursor
-):
-    """Given a user id and a course id, populate the course object
-    with found assessments from the database
+def iter_courses_from_db(
+    user_id: int, page_size: int, cursor: sqlite3.Cursor
+) -> Iterator[List[str]]:
+    """Given a user id, lazily get all of the users' courses published as JSON,
+    a page of at most `page_size` courses at a time, so only one page is ever
+    held in memory
     """
+    for cached in iter_cached_courses_from_db(user_id, page_size, cursor):
+        yield [entry.payload for entry in cached]
+
+
+def iter_cached_courses_from_db(
+    user_id: int, page_size: int, cursor: sqlite3.Cursor
+) -> Iterator[List[CachedCourse]]:
+    """Given a user id, lazily get the cache entries of all of the users'
+    courses, a page of at most `page_size` courses at a time
+    """
+    after: Optional[int] = 0
+    while after is not None:
+        cached, after = page_cached_courses_from_db(user_id, after, page_size, cursor)
+        if cached:
+            yield cached
+
+
+def load_courses_from_db(
+    user_id: int, rows: List[sqlite3.Row], cursor: sqlite3.Cursor
+) -> List[Course]:
+    """Given a user id and rows of the COURSES table, create the Course objects
+    along with their course learning outcomes and assessments.
+
+    The children of every course are fetched together, so this always costs two
+    queries no matter how many rows are given. Past MAX_COURSES_PER_QUERY rows
+    all of the users' children are fetched and the unwanted ones skipped, rather
+    than binding a parameter per course.
+    """
+    courses = {
+        row["ID"]: Course(
+            row["TITLE"],
+            row["DISCIPLINE"],
+            row["CODE"],
+            row["FACULTY"],
+            row["DESCRIPTION"],
+            id_=row["ID"],
+        )
+        for row in rows
+    }
+    if not courses:
+        return []
+    if len(courses) > MAX_COURSES_PER_QUERY:
+        condition, params = "USER_ID=?", (user_id,)
+    else:
+        placeholders = ", ".join("?" * len(courses))
+        condition = f"USER_ID=? AND COURSE_ID IN ({placeholders})"
+        params = (user_id, *courses)
     cursor.execute(
-        "SELECT * FROM ASSESSMENTS WHERE USER_ID=? AND COURSE_ID=?",
-        (user_id, course_id),
+        f"""
+        SELECT ID, COURSE_ID, TEXT FROM CLOS WHERE {condition} ORDER BY COURSE_ID, ID
+        """,
+        params,
     )
-    rows = cursor.fetchall()
-    course.assessments = []
-    for row in rows:
-        course.add_assessment(Assessment(row["TEXT"], row["WEIGHT"]))
+    for row in cursor:
+        course = courses.get(row["COURSE_ID"])
+        if course is not None:
+            course.add_clo(Clo(row["TEXT"], row["ID"]))
+    cursor.execute(
+        f"""
+        SELECT ID, COURSE_ID, TEXT, WEIGHT FROM ASSESSMENTS WHERE {condition}
+        ORDER BY COURSE_ID, ID
+        """,
+        params,
+    )
+    for row in cursor:
+        course = courses.get(row["COURSE_ID"])
+        if course is not None:
+            course.add_assessment(Assessment(row["TEXT"], row["WEIGHT"], row["ID"]))
+    return list(courses.values())
 
 
 def get_user_from_db(username: str, cursor: sqlite3.Cursor) -> Optional[User]:
@@ -159,7 +392,9 @@ def get_course_id_from_db(user_id: int, cursor: sqlite3.Cursor) -> Optional[int]
 def add_clo_to_db(
     user_id: int, course_id: int, clo: Clo, cursor: sqlite3.Cursor
 ) -> bool:
-    """Given a user id and course id, add the Clo object to the database"""
+    """Given a user id and course id, add the Clo object to the database and set
+    its id
+    """
     cursor.execute(
         """
         INSERT INTO CLOS (USER_ID, COURSE_ID, TEXT)
@@ -167,42 +402,76 @@ def add_clo_to_db(
     """,
         (user_id, course_id, clo.text),
     )
+    clo.id = cursor.lastrowid
+    course_cache.invalidate(user_id, course_id)
     return True
 
 
 def delete_clo_from_db(
     user_id: int, course_id: int, clo: Clo, cursor: sqlite3.Cursor
 ) -> bool:
-    """Given a user id and course id, delete the Assessment object from the database"""
-    cursor.execute(
-        """
-        DELETE FROM CLOS
-        WHERE ID IN
-        (
-            SELECT ID FROM CLOS
-            WHERE USER_ID=? AND COURSE_ID=? AND TEXT=?
-            LIMIT 1
+    """Given a user id and course id, delete the Clo object from the database by
+    its id, or if it has none a clo with the same text. Returns whether one was
+    found.
+    """
+    if clo.id is not None:
+        cursor.execute(
+            "DELETE FROM CLOS WHERE ID=? AND USER_ID=? AND COURSE_ID=?",
+            (clo.id, user_id, course_id),
         )
-    """,
-        (user_id, course_id, clo.text),
+    else:
+        cursor.execute(
+            """
+            DELETE FROM CLOS
+            WHERE ID IN
+            (
+                SELECT ID FROM CLOS
+                WHERE USER_ID=? AND COURSE_ID=? AND TEXT=?
+                LIMIT 1
+            )
+        """,
+            (user_id, course_id, clo.text),
+        )
+    course_cache.invalidate(user_id, course_id)
+    return cursor.rowcount > 0
+
+
+def add_clos_to_db(
+    user_id: int, course_id: int, clos: List[Clo], cursor: sqlite3.Cursor
+):
+    """Given a user id and course id, add the Clo objects to the database
+    together and set their ids
+    """
+    ids = _add_course_children_to_db(
+        "CLOS", ("TEXT",), user_id, course_id, [(clo.text,) for clo in clos], cursor
     )
-    return True
+    for clo, id_ in zip(clos, ids):
+        clo.id = id_
 
 
-def delete_all_clos_from_db(user_id: int, course_id: int, cursor: sqlite3.Cursor):
-    """Delete all course learning outcomes that match a user_id and course_id"""
-    cursor.execute(
-        """
-        DELETE FROM CLOS WHERE USER_ID=? AND COURSE_ID=?
-    """,
-        (user_id, course_id),
+def delete_clos_from_db(
+    user_id: int, course_id: int, clos: List[Clo], cursor: sqlite3.Cursor
+) -> List[bool]:
+    """Given a user id and course id, delete each Clo object from the database
+    together, by its id or if it has none a clo with the same text, returning
+    whether each one was found
+    """
+    return _delete_course_children_from_db(
+        "CLOS",
+        ("TEXT",),
+        user_id,
+        course_id,
+        [(clo.id, (clo.text,)) for clo in clos],
+        cursor,
     )
 
 
 def add_assessment_to_db(
     user_id: int, course_id: int, assessment: Assessment, cursor: sqlite3.Cursor
 ) -> bool:
-    """Given a user id and course id, add the Assessment object to the database"""
+    """Given a user id and course id, add the Assessment object to the database
+    and set its id
+    """
     cursor.execute(
         """
         INSERT INTO ASSESSMENTS (USER_ID, COURSE_ID, TEXT, WEIGHT)
@@ -210,38 +479,158 @@ def add_assessment_to_db(
     """,
         (user_id, course_id, assessment.text, assessment.weight),
     )
+    assessment.id = cursor.lastrowid
+    course_cache.invalidate(user_id, course_id)
     return True
 
 
 def delete_assessment_from_db(
     user_id: int, course_id: int, assessment: Assessment, cursor: sqlite3.Cursor
 ) -> bool:
-    """Given a user id and course id, delete the Assessment object from the database"""
-    cursor.execute(
-        """
-        DELETE FROM ASSESSMENTS
-        WHERE ID IN
-        (
-            SELECT ID FROM ASSESSMENTS
-            WHERE USER_ID=? AND COURSE_ID=? AND TEXT=? AND WEIGHT=?
-            LIMIT 1
+    """Given a user id and course id, delete the Assessment object from the
+    database by its id, or if it has none an assessment with the same text and
+    weight. Returns whether one was found.
+    """
+    if assessment.id is not None:
+        cursor.execute(
+            "DELETE FROM ASSESSMENTS WHERE ID=? AND USER_ID=? AND COURSE_ID=?",
+            (assessment.id, user_id, course_id),
         )
-    """,
-        (user_id, course_id, assessment.text, assessment.weight),
-    )
-    return True
+    else:
+        cursor.execute(
+            """
+            DELETE FROM ASSESSMENTS
+            WHERE ID IN
+            (
+                SELECT ID FROM ASSESSMENTS
+                WHERE USER_ID=? AND COURSE_ID=? AND TEXT=? AND WEIGHT=?
+                LIMIT 1
+            )
+        """,
+            (user_id, course_id, assessment.text, assessment.weight),
+        )
+    course_cache.invalidate(user_id, course_id)
+    return cursor.rowcount > 0
 
 
-def delete_all_assessments_from_db(
-    user_id: int, course_id: int, cursor: sqlite3.Cursor
+def add_assessments_to_db(
+    user_id: int,
+    course_id: int,
+    assessments: List[Assessment],
+    cursor: sqlite3.Cursor,
 ):
-    """Delete all course learning outcomes that match a user_id and course_id"""
+    """Given a user id and course id, add the Assessment objects to the database
+    together and set their ids
+    """
+    ids = _add_course_children_to_db(
+        "ASSESSMENTS",
+        ("TEXT", "WEIGHT"),
+        user_id,
+        course_id,
+        [(assessment.text, assessment.weight) for assessment in assessments],
+        cursor,
+    )
+    for assessment, id_ in zip(assessments, ids):
+        assessment.id = id_
+
+
+def delete_assessments_from_db(
+    user_id: int,
+    course_id: int,
+    assessments: List[Assessment],
+    cursor: sqlite3.Cursor,
+) -> List[bool]:
+    """Given a user id and course id, delete each Assessment object from the
+    database together, by its id or if it has none an assessment with the same
+    text and weight, returning whether each one was found
+    """
+    return _delete_course_children_from_db(
+        "ASSESSMENTS",
+        ("TEXT", "WEIGHT"),
+        user_id,
+        course_id,
+        [
+            (assessment.id, (assessment.text, assessment.weight))
+            for assessment in assessments
+        ],
+        cursor,
+    )
+
+
+def _add_course_children_to_db(
+    table: str,
+    columns: Tuple[str, ...],
+    user_id: int,
+    course_id: int,
+    rows: List[Tuple],
+    cursor: sqlite3.Cursor,
+) -> List[int]:
+    """Insert rows holding the values of `columns` into a course's child table
+    (CLOS or ASSESSMENTS), returning the id of each row
+    """
+    if not rows:
+        return []
+    names = ", ".join(("USER_ID", "COURSE_ID", *columns))
+    placeholders = "(" + ", ".join("?" * (len(columns) + 2)) + ")"
+    rows_per_query = MAX_VARIABLES_PER_QUERY // (len(columns) + 2)
+    ids: List[int] = []
+    for start in range(0, len(rows), rows_per_query):
+        chunk = rows[start : start + rows_per_query]
+        cursor.execute(
+            f"INSERT INTO {table} ({names}) VALUES "
+            + ", ".join([placeholders] * len(chunk)),
+            [value for row in chunk for value in (user_id, course_id, *row)],
+        )
+        # the rows of one statement get consecutive ids, as nothing else can
+        # write to the table in the middle of it
+        ids.extend(range(cursor.lastrowid - len(chunk) + 1, cursor.lastrowid + 1))
+    course_cache.invalidate(user_id, course_id)
+    return ids
+
+
+def _delete_course_children_from_db(
+    table: str,
+    columns: Tuple[str, ...],
+    user_id: int,
+    course_id: int,
+    unwanted: List[Tuple[Optional[int], Tuple]],
+    cursor: sqlite3.Cursor,
+) -> List[bool]:
+    """Delete a row of a course's child table (CLOS or ASSESSMENTS) for each
+    `unwanted` pair of an id and values of `columns`. The row with the id is
+    deleted, or when the id is None the first row by id holding the values.
+    Returns whether each one was found.
+    """
+    if not unwanted:
+        return []
+    names = ", ".join(columns)
     cursor.execute(
-        """
-        DELETE FROM ASSESSMENTS WHERE USER_ID=? AND COURSE_ID=?
-    """,
+        f"SELECT ID, {names} FROM {table} WHERE USER_ID=? AND COURSE_ID=? ORDER BY ID",
         (user_id, course_id),
     )
+    rows = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    ids: Dict[Tuple, List[int]] = {}
+    for id_, values in rows.items():
+        ids.setdefault(values, []).append(id_)
+    deleted: Set[int] = set()
+    found = []
+    for id_, values in unwanted:
+        if id_ is None:
+            matching = ids.get(values, [])
+            while matching and matching[0] in deleted:
+                matching.pop(0)
+            id_ = matching.pop(0) if matching else None
+        elif id_ not in rows or id_ in deleted:
+            id_ = None
+        found.append(id_ is not None)
+        if id_ is not None:
+            deleted.add(id_)
+    if deleted:
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE ID=?", [(id_,) for id_ in deleted]
+        )
+        course_cache.invalidate(user_id, course_id)
+    return found
 
 
 def add_course_to_db(user_id: int, course: Course, cursor: sqlite3.Cursor):
@@ -270,7 +659,141 @@ def add_course_to_db(user_id: int, course: Course, cursor: sqlite3.Cursor):
         ),
     )
     course_id = get_course_id_from_db(user_id, cursor)
+    # ids of deleted courses can be reused, drop anything cached for this one
+    course_cache.invalidate(user_id, course_id)
     for clo in course.clos:
         add_clo_to_db(user_id, course_id, clo, cursor)
     for assessment in course.assessments:
         add_assessment_to_db(user_id, course_id, assessment, cursor)
+
+
+def get_clo_rating_stats_from_db(
+    text: str, cursor: sqlite3.Cursor
+) -> Optional[RatingStats]:
+    """Given the text of a clo, get the statistics of its ratings, or None if it
+    has not been rated
+    """
+    stats = _get_rating_stats_from_db(
+        "CLO", ("TEXT",), "WHERE TEXT=lower(trim(?))", (text,), cursor
+    )
+    return stats[0] if stats else None
+
+
+def get_top_clo_rating_stats_from_db(
+    limit: int, order: str, cursor: sqlite3.Cursor
+) -> List[RatingStats]:
+    """Get the statistics of the ratings of the `limit` top clos, ranked by one
+    of RATING_STATS_ORDERS
+    """
+    return _get_rating_stats_from_db(
+        "CLO",
+        ("TEXT",),
+        f"ORDER BY {RATING_STATS_ORDERS[order]} LIMIT ?",
+        (limit,),
+        cursor,
+    )
+
+
+def get_assessment_rating_stats_from_db(
+    text: str, weight: int, cursor: sqlite3.Cursor
+) -> Optional[RatingStats]:
+    """Given the text and weight of an assessment, get the statistics of its
+    ratings, or None if it has not been rated
+    """
+    stats = _get_rating_stats_from_db(
+        "ASSESSMENT",
+        ("TEXT", "WEIGHT"),
+        "WHERE TEXT=lower(trim(?)) AND WEIGHT=?",
+        (text, weight),
+        cursor,
+    )
+    return stats[0] if stats else None
+
+
+def get_top_assessment_rating_stats_from_db(
+    limit: int, order: str, cursor: sqlite3.Cursor
+) -> List[RatingStats]:
+    """Get the statistics of the ratings of the `limit` top assessments, ranked
+    by one of RATING_STATS_ORDERS
+    """
+    return _get_rating_stats_from_db(
+        "ASSESSMENT",
+        ("TEXT", "WEIGHT"),
+        f"ORDER BY {RATING_STATS_ORDERS[order]} LIMIT ?",
+        (limit,),
+        cursor,
+    )
+
+
+def _get_rating_stats_from_db(
+    kind: str,
+    columns: Tuple[str, ...],
+    clause: str,
+    params: Tuple,
+    cursor: sqlite3.Cursor,
+) -> List[RatingStats]:
+    """Get the rows of the <kind>_RATING_STATS table picked by `clause`, which
+    are keyed by `columns`, along with how many times each rating was given to
+    them from <kind>_RATING_COUNTS
+    """
+    names = ", ".join(columns)
+    cursor.execute(
+        f"SELECT {names}, COUNT, SUM, MEAN FROM {kind}_RATING_STATS {clause}", params
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+    keys = [tuple(row[:-3]) for row in rows]
+    key = "(" + " AND ".join(f"{column}=?" for column in columns) + ")"
+    cursor.execute(
+        f"SELECT {names}, RATING, COUNT FROM {kind}_RATING_COUNTS WHERE "
+        + " OR ".join([key] * len(keys)),
+        [value for key in keys for value in key],
+    )
+    ratings: Dict[Tuple, Dict[str, int]] = {key: {} for key in keys}
+    for row in cursor:
+        ratings[tuple(row[:-2])][str(row["RATING"])] = row["COUNT"]
+    return [
+        RatingStats(
+            row["TEXT"],
+            row["WEIGHT"] if "WEIGHT" in columns else None,
+            row["COUNT"],
+            row["SUM"],
+            row["MEAN"],
+            ratings[key],
+        )
+        for row, key in zip(rows, keys)
+    ]
+
+
+def get_evaluations_from_db(keys: List[str], cursor: sqlite3.Cursor) -> Dict[str, str]:
+    """Given keys of evaluator results, get the results stored under them as
+    JSON, keyed by key. Keys with no result are left out.
+    """
+    if not keys:
+        return {}
+    placeholders = ", ".join("?" * len(keys))
+    cursor.execute(
+        f"SELECT KEY, RESULT FROM EVALUATIONS WHERE KEY IN ({placeholders})", keys
+    )
+    return {row["KEY"]: row["RESULT"] for row in cursor.fetchall()}
+
+
+def add_evaluations_to_db(
+    version: str, results: Dict[str, str], cursor: sqlite3.Cursor
+):
+    """Store results of a version of the evaluator as JSON under their keys"""
+    cursor.executemany(
+        "INSERT OR REPLACE INTO EVALUATIONS (KEY, RESULT, VERSION) VALUES (?, ?, ?)",
+        ((key, result, version) for key, result in results.items()),
+    )
+
+
+def prune_evaluations_from_db(version: str, cursor: sqlite3.Cursor) -> int:
+    """Delete the stored results of every version of the evaluator but the given
+    one, returning how many were deleted
+    """
+    cursor.execute(
+        "DELETE FROM EVALUATIONS WHERE VERSION < ? OR VERSION > ?", (version, version)
+    )
+    return cursor.rowcount
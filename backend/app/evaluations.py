@@ -0,0 +1,415 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from types import ModuleType
+from typing import Any, Callable, ContextManager, Dict, List, NamedTuple, Optional
+
+import config
+from app.database import (
+    get_evaluations_from_db,
+    add_evaluations_to_db,
+    prune_evaluations_from_db,
+)
+from app.jobs import QueueFull, get_process_context, time_limit
+from app.metrics import evaluator_seconds
+
+
+def get_evaluator() -> ModuleType:
+    """Get the evaluator module, importing it on first use as it is slow to
+    import
+    """
+    from app.evaluation import evaluator
+
+    return evaluator
+
+
+@lru_cache(maxsize=None)
+def get_evaluator_version() -> str:
+    """Get the evaluator's VERSION, or a hash of its source if it has none, so
+    remembered results are dropped whenever the evaluator changes. An evaluator
+    whose results also depend on data outside its module should set VERSION.
+    """
+    evaluator = get_evaluator()
+    version = getattr(evaluator, "VERSION", None)
+    if version is not None:
+        return str(version)
+    with open(evaluator.__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_evaluator():
+    """Import the evaluator and let it load any models or data of its own"""
+    evaluator = get_evaluator()
+    evaluator_warm_up = getattr(evaluator, "warm_up", None)
+    if callable(evaluator_warm_up):
+        evaluator_warm_up()
+
+
+def run_evaluator(texts: List[str], description: str) -> List[Any]:
+    """Evaluate CLOs against the same course description with the evaluator
+
+    An evaluator with an `evaluate_batch(texts, description)` is given all of
+    them at once, so it can work out what it needs from the description once
+    and score the CLOs together. Otherwise `evaluate` is called once per CLO.
+    """
+    evaluator = get_evaluator()
+    evaluate_batch = getattr(evaluator, "evaluate_batch", None)
+    if callable(evaluate_batch):
+        return list(evaluate_batch(texts, description))
+    return [evaluator.evaluate(text, description) for text in texts]
+
+
+class EvaluatorTimeout(Exception):
+    """Raised when the evaluator takes too long"""
+
+
+class EvaluatorResult(NamedTuple):
+    results: List[Any]
+    # unix times the evaluator process started and finished evaluating
+    started_at: float
+    finished_at: float
+
+
+def run_evaluator_task(
+    texts: List[str], description: str, submitted_at: float, timeout: float
+) -> EvaluatorResult:
+    """Run the evaluator in a pool process, giving up once `timeout` seconds
+    have passed since the task was submitted
+    """
+    started_at = time.time()
+    remaining = timeout - (started_at - submitted_at)
+    if remaining <= 0:
+        raise EvaluatorTimeout("Timed out waiting in the queue")
+    with time_limit(remaining, EvaluatorTimeout("Timed out evaluating")):
+        results = run_evaluator(texts, description)
+    return EvaluatorResult(results, started_at, time.time())
+
+
+class EvaluatorPool:
+    """Runs the evaluator in a pool of `workers` processes which each load the
+    evaluator once when they start, so neither loading it nor its CPU work
+    lands on the threads serving requests
+
+    At most `max_queue` evaluations may be queued or running at a time, and an
+    evaluation which is not done `timeout` seconds after it was submitted fails.
+    With no workers the evaluator runs in the calling thread, unbounded.
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers: int = workers
+        self.max_queue: int = max_queue
+        self.timeout: float = timeout
+        self.__lock = threading.Lock()
+        self.__pid: int = os.getpid()
+        self.__executor: Optional[ProcessPoolExecutor] = None
+        self.__started_at: Optional[float] = None
+        self.__version: Optional[str] = None
+        self.__in_flight: int = 0
+        self.__submitted: int = 0
+        self.__rejected: int = 0
+        self.__completed: int = 0
+        self.__failed: int = 0
+        self.__timed_out: int = 0
+        self.__queue_wait: float = 0.0
+        self.__busy: float = 0.0
+
+    def __repr__(self) -> str:
+        return f"<EvaluatorPool {self.workers=}, {self.max_queue=}, {self.timeout=}>"
+
+    def start(self):
+        """Start every process of the pool, so they load the evaluator before the
+        first evaluation is asked for
+        """
+        if self.workers < 1:
+            load_evaluator()
+            return
+        for future in [self.__submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def version(self) -> str:
+        """Get the version of the evaluator the pool's processes run"""
+        if self.workers < 1:
+            return get_evaluator_version()
+        if self.__version is None:
+            future = self.__submit(get_evaluator_version)
+            self.__version = future.result(timeout=self.timeout)
+        return self.__version
+
+    def evaluate(self, texts: List[str], description: str) -> List[Any]:
+        """Evaluate CLOs against the same course description, returning the
+        results in the order of `texts`
+
+        Raises:
+            QueueFull: if `max_queue` evaluations are already queued or running
+            EvaluatorTimeout: if the evaluation took longer than `timeout`
+        """
+        if self.workers < 1:
+            start = time.perf_counter()
+            results = run_evaluator(texts, description)
+            evaluator_seconds.observe(time.perf_counter() - start)
+            return results
+        with self.__lock:
+            if self.__in_flight >= self.max_queue:
+                self.__rejected += 1
+                raise QueueFull(f"{self.__in_flight} evaluations are already queued")
+            self.__in_flight += 1
+            self.__submitted += 1
+        submitted_at = time.time()
+        try:
+            future = self.__submit(
+                run_evaluator_task, texts, description, submitted_at, self.timeout
+            )
+            # the process gives up on its own, this only covers it being stuck
+            result = future.result(timeout=self.timeout + 1)
+        except (EvaluatorTimeout, FutureTimeoutError):
+            future.cancel()
+            with self.__lock:
+                self.__timed_out += 1
+            raise EvaluatorTimeout(f"Evaluating took over {self.timeout}s")
+        except Exception:
+            with self.__lock:
+                self.__failed += 1
+            raise
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+        evaluator_seconds.observe(result.finished_at - result.started_at)
+        with self.__lock:
+            self.__completed += 1
+            self.__queue_wait += max(result.started_at - submitted_at, 0.0)
+            self.__busy += result.finished_at - result.started_at
+        return result.results
+
+    def stats(self) -> Dict[str, float]:
+        """Get the pool's counters, the total seconds evaluations spent queued and
+        running, and the share of the processes' time spent evaluating
+        """
+        with self.__lock:
+            uptime = time.time() - self.__started_at if self.__started_at else 0.0
+            capacity = uptime * self.workers
+            return {
+                "workers": self.workers,
+                "in_flight": self.__in_flight,
+                "submitted": self.__submitted,
+                "rejected": self.__rejected,
+                "completed": self.__completed,
+                "failed": self.__failed,
+                "timed_out": self.__timed_out,
+                "queue_wait_seconds": self.__queue_wait,
+                "busy_seconds": self.__busy,
+                "utilisation": self.__busy / capacity if capacity else 0.0,
+            }
+
+    def shutdown(self):
+        """Stop the pool's processes, cancelling any queued evaluations"""
+        with self.__lock:
+            if self.__executor is not None and os.getpid() == self.__pid:
+                self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+
+    def __submit(self, function: Callable, *args) -> Future:
+        """Run a function in the pool, starting the pool on first use, after a
+        fork and after one of its processes died and took the pool with it
+        """
+        with self.__lock:
+            if self.__executor is None or os.getpid() != self.__pid:
+                self.__start()
+            executor = self.__executor
+        try:
+            return executor.submit(function, *args)
+        except BrokenProcessPool:
+            with self.__lock:
+                if self.__executor is executor:
+                    self.__start()
+                executor = self.__executor
+            return executor.submit(function, *args)
+
+    def __start(self):
+        """Start a new pool, must hold the lock"""
+        # the processes of a pool inherited from a parent belong to the parent
+        self.__executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_process_context(),
+            initializer=load_evaluator,
+        )
+        self.__pid = os.getpid()
+        self.__started_at = time.time()
+
+
+evaluator_pool = EvaluatorPool(
+    config.EVALUATOR_WORKERS, config.EVALUATOR_MAX_QUEUE, config.EVALUATOR_TIMEOUT
+)
+
+
+def evaluation_key(version: str, text: str, description: Optional[str]) -> str:
+    """Key of the result of evaluating a CLO against a course description,
+    ignoring differences in whitespace, a course without a description is
+    keyed as if its description were empty
+    """
+    inputs = [version, " ".join(text.split()), " ".join((description or "").split())]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+class EvaluationCache:
+    """Remembers evaluator results in an in-process LRU of at most
+    `max_entries` results, in front of the EVALUATIONS table which survives
+    restarts and is shared by every worker
+
+    Results are stored as JSON, so the evaluator's results must be JSON
+    serialisable, as they are sent to the client as JSON anyway.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries: int = max_entries
+        self.__lock = threading.Lock()
+        self.__entries: "OrderedDict[str, Any]" = OrderedDict()
+        # the evaluator version the database was last checked against
+        self.__version: Optional[str] = None
+        self.__memory_hits: int = 0
+        self.__database_hits: int = 0
+        self.__misses: int = 0
+
+    def __repr__(self) -> str:
+        return f"<EvaluationCache {self.max_entries=}>"
+
+    def get_many(
+        self, version: str, keys: List[str], cursor: sqlite3.Cursor
+    ) -> Dict[str, Any]:
+        """Get the remembered results of the keys, keyed by key. Keys with no
+        result are left out.
+
+        Only reads from `cursor`. Keys include the evaluator's version, so the
+        results of other versions are never found, prune_evaluations deletes
+        them.
+        """
+        found = {}
+        with self.__lock:
+            for key in keys:
+                if key in self.__entries:
+                    self.__entries.move_to_end(key)
+                    found[key] = self.__entries[key]
+            self.__memory_hits += len(found)
+        missing = [key for key in keys if key not in found]
+        stored = {
+            key: json.loads(result)
+            for key, result in get_evaluations_from_db(missing, cursor).items()
+        }
+        with self.__lock:
+            self.__database_hits += len(stored)
+            self.__misses += len(missing) - len(stored)
+            self.__remember(stored)
+        return {**found, **stored}
+
+    def put_many(self, version: str, results: Dict[str, Any], cursor: sqlite3.Cursor):
+        """Remember results by their keys"""
+        self.__check_version(version)
+        add_evaluations_to_db(
+            version,
+            {key: json.dumps(result) for key, result in results.items()},
+            cursor,
+        )
+        with self.__lock:
+            self.__remember(results)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the cache's counters and hit rates for monitoring"""
+        with self.__lock:
+            lookups = self.__memory_hits + self.__database_hits + self.__misses
+            return {
+                "entries": len(self.__entries),
+                "memory_hits": self.__memory_hits,
+                "database_hits": self.__database_hits,
+                "misses": self.__misses,
+                "memory_hit_rate": self.__memory_hits / lookups if lookups else 0.0,
+                "hit_rate": (
+                    (self.__memory_hits + self.__database_hits) / lookups
+                    if lookups
+                    else 0.0
+                ),
+            }
+
+    def __check_version(self, version: str):
+        """Forget the results of this process once the evaluator's version
+        changes, those in the database are kept for other workers still running
+        the old version
+        """
+        if version == self.__version:
+            return
+        with self.__lock:
+            self.__entries.clear()
+            self.__version = version
+
+    def __remember(self, results: Dict[str, Any]):
+        """Add results to the LRU, must hold the lock"""
+        for key, result in results.items():
+            self.__entries[key] = result
+            self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+
+
+evaluation_cache = EvaluationCache(config.EVALUATION_CACHE_MAX_ENTRIES)
+
+
+def prune_evaluations(cursor: sqlite3.Cursor) -> int:
+    """Delete the stored results of every version of the evaluator but this
+    one, returning how many were deleted
+
+    Meant to run once when a server starts, before its workers do, as workers of
+    the previous version may still be running next to them.
+    """
+    return prune_evaluations_from_db(get_evaluator_version(), cursor)
+
+
+def evaluate_clo(
+    text: str,
+    description: Optional[str],
+    cursor: sqlite3.Cursor,
+    writing: Callable[[], ContextManager[sqlite3.Cursor]],
+) -> Any:
+    """Evaluate a CLO against a course description"""
+    return evaluate_clos([text], description, cursor, writing)[0]
+
+
+def evaluate_clos(
+    texts: List[str],
+    description: Optional[str],
+    cursor: sqlite3.Cursor,
+    writing: Callable[[], ContextManager[sqlite3.Cursor]],
+) -> List[Any]:
+    """Evaluate CLOs against the same course description, returning the results
+    in the order of `texts`
+
+    Results are remembered by evaluation_cache, so only CLOs which have not been
+    evaluated against the description before are given to the evaluator pool,
+    all of them in one go. Remembered results are read with `cursor` and new
+    ones are written with the cursor of a `writing()` block, so nothing holds
+    the database's writer while the evaluator runs.
+
+    Raises:
+        QueueFull: if the evaluator pool is too busy to take more work
+        EvaluatorTimeout: if the evaluator took too long
+    """
+    version = evaluator_pool.version()
+    keys = [evaluation_key(version, text, description) for text in texts]
+    results = evaluation_cache.get_many(version, list(dict.fromkeys(keys)), cursor)
+    # one of each CLO which differs only in whitespace is evaluated
+    missing = {key: text for key, text in zip(keys, texts) if key not in results}
+    if missing:
+        evaluated = evaluator_pool.evaluate(list(missing.values()), description)
+        evaluated_by_key = dict(zip(missing, evaluated))
+        with writing() as write_cursor:
+            evaluation_cache.put_many(version, evaluated_by_key, write_cursor)
+        results.update(evaluated_by_key)
+    return [results[key] for key in keys]
@@ -0,0 +1,197 @@
+import logging
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import config
+from app.cache import RenderCache, render_cache, timed_render
+from app.courses.course import Course
+from app.courses.io import Writer
+from app.jobs import get_process_context
+from app.metrics import render_seconds
+
+
+class ChunkStream:
+    """A write-only file which hands back what was written to it in chunks, for
+    writing a zip archive while it is streamed to a client
+    """
+
+    def __init__(self):
+        self.__chunks: List[bytes] = []
+        self.__position: int = 0
+
+    def write(self, data: bytes) -> int:
+        self.__chunks.append(bytes(data))
+        self.__position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.__position
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        """Get everything written since the last call"""
+        data = b"".join(self.__chunks)
+        self.__chunks.clear()
+        return data
+
+
+def entry_name(course: Course, extension: str) -> str:
+    """Name of a course's file in an export, unique by the course's id"""
+    title = re.sub(r"[^\w.-]+", "_", course.get_title() or "").strip("_.")
+    return f"{course.id}_{title or 'course'}.{extension}"
+
+
+class CourseExporter:
+    """Exports courses as a zip archive, rendering them in parallel in a pool of
+    `workers` processes and streaming the archive out as renders complete
+
+    Renders of slow writers are taken from the render cache when they are there
+    and put there when they are not. At most `workers` * 2 renders are in
+    flight at a time, so neither the renders nor the archive are ever held in
+    memory in full. With no workers every course is rendered in this process.
+
+    By the time a render fails part of the archive has been sent, so a course
+    which cannot be rendered is logged and exported as a `.error.txt` file
+    saying so instead.
+    """
+
+    def __init__(self, workers: int, cache: RenderCache):
+        self.workers: int = workers
+        self.cache: RenderCache = cache
+        self.__lock = threading.Lock()
+        self.__pid: int = os.getpid()
+        self.__executor: Optional[ProcessPoolExecutor] = None
+
+    def __repr__(self) -> str:
+        return f"<CourseExporter {self.workers=}>"
+
+    def export(
+        self,
+        courses: Iterable[Course],
+        writer_classes: Dict[str, Type[Writer]],
+        logger: logging.Logger,
+    ) -> Iterator[bytes]:
+        """Lazily get a zip archive of the courses rendered by each writer, keyed
+        by the file extension of its output
+        """
+        stream = ChunkStream()
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, data in self.__render_all(courses, writer_classes, logger):
+                archive.writestr(name, data)
+                yield stream.take()
+        yield stream.take()
+
+    def shutdown(self):
+        """Stop the pool's processes"""
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False, cancel_futures=True)
+                self.__executor = None
+
+    def __render_all(
+        self,
+        courses: Iterable[Course],
+        writer_classes: Dict[str, Type[Writer]],
+        logger: logging.Logger,
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Render every course with every writer, yielding (file name, output) in
+        the order the renders complete
+        """
+        # future -> (file name, render cache key, writer name)
+        in_flight: Dict[Future, Tuple[str, str, str]] = {}
+        try:
+            for course in courses:
+                for extension, writer_class in writer_classes.items():
+                    name = entry_name(course, extension)
+                    if not writer_class.CACHE_RENDERS or self.workers < 1:
+                        # quick enough not to be worth sending to another process
+                        try:
+                            data = self.cache.render(writer_class, course)
+                        except Exception as exception:
+                            yield failed(name, exception, logger)
+                            continue
+                        yield name, data
+                        continue
+                    key = self.cache.key(writer_class, course)
+                    data = self.cache.get(key)
+                    if data is not None:
+                        yield name, data
+                        continue
+                    future = self.__submit(timed_render, writer_class, course)
+                    in_flight[future] = (name, key, writer_class.__name__)
+                    if len(in_flight) >= self.workers * 2:
+                        yield from self.__complete(in_flight, logger, FIRST_COMPLETED)
+            yield from self.__complete(in_flight, logger)
+        finally:
+            # the client went away, don't render what it will never get
+            for future in in_flight:
+                future.cancel()
+
+    def __complete(
+        self,
+        in_flight: Dict[Future, Tuple[str, str, str]],
+        logger: logging.Logger,
+        return_when=ALL_COMPLETED,
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Wait for renders to complete, yielding and caching their output"""
+        done, _ = wait(in_flight, return_when=return_when)
+        for future in done:
+            name, key, writer = in_flight.pop(future)
+            try:
+                data, seconds = future.result()
+            except Exception as exception:
+                yield failed(name, exception, logger)
+                continue
+            # here, as the pool's processes never report their metrics
+            render_seconds.observe(seconds, writer)
+            self.cache.put(key, data)
+            yield name, data
+
+    def __submit(self, function: Callable, *args) -> Future:
+        """Run a function in the pool, starting it again if one of its processes
+        died and took the pool with it
+        """
+        executor = self.__get_executor()
+        try:
+            return executor.submit(function, *args)
+        except BrokenProcessPool:
+            with self.__lock:
+                if self.__executor is executor:
+                    # its renders have failed already, only new ones need a pool
+                    self.__executor = None
+            return self.__get_executor().submit(function, *args)
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        """Get the pool, starting it on first use and again after a fork"""
+        with self.__lock:
+            if self.__executor is None or os.getpid() != self.__pid:
+                # the processes of a pool inherited from a parent belong to it
+                self.__executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_process_context()
+                )
+                self.__pid = os.getpid()
+            return self.__executor
+
+
+def failed(
+    name: str, exception: Exception, logger: logging.Logger
+) -> Tuple[str, bytes]:
+    """Log a render which failed and get the entry exported in its place"""
+    logger.error("Could not render %s for export: %r", name, exception)
+    return f"{name}.error.txt", f"Could not render {name}: {exception}\n".encode()
+
+
+course_exporter = CourseExporter(config.EXPORT_WORKERS, render_cache)
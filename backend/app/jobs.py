@@ -0,0 +1,333 @@
+import hmac
+import multiprocessing
+import os
+import secrets
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Tuple, Type
+
+import config
+from app.cache import RenderCache, render, render_cache
+from app.courses.course import Course
+from app.courses.io import Writer
+from app.metrics import render_seconds
+
+# imported by the forkserver before it forks worker processes
+PROCESS_PRELOAD = ["reportlab.lib.styles", "reportlab.platypus"]
+
+
+def get_process_context() -> multiprocessing.context.BaseContext:
+    """Get the multiprocessing context worker processes are started with
+
+    Forking a worker while one of its threads holds a lock, such as the import
+    lock while reportlab is loaded in the background, leaves the child
+    deadlocked, so by default processes are forked from a single threaded
+    forkserver instead
+    """
+    method = config.PROCESS_START_METHOD
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        context.set_forkserver_preload(PROCESS_PRELOAD)
+    return context
+
+
+@contextmanager
+def time_limit(seconds: float, exception: Exception) -> Iterator[None]:
+    """Raise `exception` in the block once it has run for `seconds`
+
+    Uses an alarm signal, so it must be used on a process's main thread, as
+    tasks in pool processes are. Where there are no alarms there is no limit.
+    """
+    if not hasattr(signal, "setitimer"):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise exception
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its limit"""
+
+
+class RenderJobTimeout(Exception):
+    """Raised in a render job's process when the job runs out of time"""
+
+
+class RenderResult(NamedTuple):
+    data: bytes
+    # unix times the job was taken off the queue and finished rendering
+    started_at: float
+    finished_at: float
+
+
+class RenderJob(NamedTuple):
+    id: str
+    user_id: int
+    submitted_at: float
+    future: Future
+
+
+class JobStatus(NamedTuple):
+    # one of "queued", "running", "done" or "failed"
+    status: str
+    data: Optional[bytes] = None
+    error: Optional[str] = None
+
+
+def run_render_job(
+    writer_class: Type[Writer], course: Course, submitted_at: float, timeout: float
+) -> RenderResult:
+    """Render a course in a pool process, giving up once `timeout` seconds have
+    passed since the job was submitted
+    """
+    started_at = time.time()
+    remaining = timeout - (started_at - submitted_at)
+    if remaining <= 0:
+        raise RenderJobTimeout("Timed out waiting in the queue")
+    with time_limit(remaining, RenderJobTimeout("Timed out rendering")):
+        data = render(writer_class, course)
+    return RenderResult(data, started_at, time.time())
+
+
+class RenderJobs:
+    """Renders courses in a bounded pool of processes, so a slow render does not
+    hold the GIL of the worker serving requests
+
+    Jobs are named after the render cache key of what they render, so
+    submitting a course that is already being rendered joins the existing job,
+    and a finished render is stored in the render cache where any worker can
+    serve it. Job ids are signed with `secret` to the user who submitted them,
+    so only they can get the output, from any worker sharing the secret. At most
+    `max_queue` jobs may be queued or running at a time and a job fails if it is
+    not done `timeout` seconds after it was submitted. Finished jobs are
+    forgotten after `result_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        timeout: float,
+        result_ttl: float,
+        cache: RenderCache,
+        secret: str,
+    ):
+        self.workers: int = workers
+        self.max_queue: int = max_queue
+        self.timeout: float = timeout
+        self.result_ttl: float = result_ttl
+        self.cache: RenderCache = cache
+        self.__secret: bytes = secret.encode()
+        self.__lock = threading.Lock()
+        self.__pid: int = os.getpid()
+        self.__executor: Optional[ProcessPoolExecutor] = None
+        self.__jobs: Dict[Tuple[int, str], RenderJob] = {}
+        self.__submitted: int = 0
+        self.__rejected: int = 0
+        self.__completed: int = 0
+        self.__failed: int = 0
+        self.__timed_out: int = 0
+        self.__queue_wait: float = 0.0
+        self.__queue_wait_max: float = 0.0
+        self.__render_time: float = 0.0
+        self.__render_time_max: float = 0.0
+
+    def __repr__(self) -> str:
+        return f"<RenderJobs {self.workers=}, {self.max_queue=}, {self.timeout=}>"
+
+    def submit(self, user_id: int, writer_class: Type[Writer], course: Course) -> str:
+        """Start rendering a course, returning the id of the job
+
+        Raises:
+            QueueFull: if `max_queue` jobs are already queued or running
+        """
+        key = self.cache.key(writer_class, course)
+        job_id = self.__sign(user_id, key)
+        with self.__lock:
+            self.__expire()
+            if (user_id, key) in self.__jobs:
+                return job_id
+            submitted_at = time.time()
+            rendering = self.cache.get(key) is None
+            if not rendering:
+                # already rendered, the job is done as soon as it is submitted
+                future = Future()
+                future.set_result(None)
+            else:
+                queued = sum(not job.future.done() for job in self.__jobs.values())
+                if queued >= self.max_queue:
+                    self.__rejected += 1
+                    raise QueueFull(f"{queued} render jobs are already queued")
+                future = self.__submit(
+                    run_render_job, writer_class, course, submitted_at, self.timeout
+                )
+                self.__submitted += 1
+            self.__jobs[(user_id, key)] = RenderJob(
+                job_id, user_id, submitted_at, future
+            )
+        if rendering:
+            # outside the lock, the callback runs straight away if the job is done
+            future.add_done_callback(
+                lambda done: self.__finish(key, writer_class, submitted_at, done)
+            )
+        return job_id
+
+    def status(self, user_id: int, job_id: str) -> Optional[JobStatus]:
+        """Get the status of a job, and its output once it is done, or None if the
+        job was not submitted by the user, or is not known to this worker and its
+        output is not cached
+        """
+        key = self.__verify(user_id, job_id)
+        if key is None:
+            return None
+        with self.__lock:
+            self.__expire()
+            job = self.__jobs.get((user_id, key))
+        if job is None:
+            # finished by another worker or before being forgotten here
+            data = self.cache.get(key)
+            return None if data is None else JobStatus("done", data)
+        if not job.future.done():
+            if time.time() - job.submitted_at > self.timeout:
+                # still waiting for a process, its process would give up anyway
+                job.future.cancel()
+            if job.future.running():
+                return JobStatus("running")
+            if not job.future.done():
+                return JobStatus("queued")
+        try:
+            result = job.future.result()
+        except (RenderJobTimeout, CancelledError):
+            return JobStatus("failed", error="Timed out rendering the course")
+        except Exception as exception:
+            return JobStatus(
+                "failed", error=f"Could not render the course: {exception}"
+            )
+        data = self.cache.get(key) if result is None else result.data
+        if data is None:
+            # evicted from the render cache since the job was submitted
+            return JobStatus("failed", error="The rendered course has expired")
+        return JobStatus("done", data)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the job counters and the total and maximum seconds completed jobs
+        spent waiting in the queue and rendering, for monitoring
+        """
+        with self.__lock:
+            return {
+                "queued": sum(not job.future.done() for job in self.__jobs.values()),
+                "submitted": self.__submitted,
+                "rejected": self.__rejected,
+                "completed": self.__completed,
+                "failed": self.__failed,
+                "timed_out": self.__timed_out,
+                "queue_wait_seconds": self.__queue_wait,
+                "queue_wait_seconds_max": self.__queue_wait_max,
+                "render_seconds": self.__render_time,
+                "render_seconds_max": self.__render_time_max,
+            }
+
+    def shutdown(self):
+        """Stop the pool's processes, cancelling any queued jobs"""
+        with self.__lock:
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=False, cancel_futures=True)
+                self.__executor = None
+
+    def __submit(self, function: Callable, *args) -> Future:
+        """Run a function in the pool, must hold the lock. Starts the pool again
+        if one of its processes died and took the pool with it.
+        """
+        try:
+            return self.__get_executor().submit(function, *args)
+        except BrokenProcessPool:
+            # its jobs have failed already, only new ones need a new pool
+            self.__executor = None
+            return self.__get_executor().submit(function, *args)
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        """Get the pool, starting it on first use and again after a fork"""
+        if self.__executor is None or os.getpid() != self.__pid:
+            # the processes of a pool inherited from a parent belong to the parent
+            self.__executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=get_process_context()
+            )
+            self.__pid = os.getpid()
+        return self.__executor
+
+    def __sign(self, user_id: int, key: str) -> str:
+        """Get the id of the job rendering `key` for a user"""
+        signature = hmac.new(self.__secret, f"{user_id}:{key}".encode(), "sha256")
+        return f"{key}.{signature.hexdigest()}"
+
+    def __verify(self, user_id: int, job_id: str) -> Optional[str]:
+        """Get the render cache key of a job the user submitted, or None if they
+        did not submit it
+        """
+        key = job_id.partition(".")[0]
+        expected = self.__sign(user_id, key).encode()
+        if not hmac.compare_digest(expected, job_id.encode()):
+            return None
+        return key
+
+    def __finish(
+        self,
+        key: str,
+        writer_class: Type[Writer],
+        submitted_at: float,
+        future: Future,
+    ):
+        """Record a finished job's timings and cache its output"""
+        try:
+            result = future.result()
+        except (RenderJobTimeout, CancelledError):
+            with self.__lock:
+                self.__timed_out += 1
+            return
+        except Exception:
+            with self.__lock:
+                self.__failed += 1
+            return
+        self.cache.put(key, result.data)
+        queue_wait = max(result.started_at - submitted_at, 0.0)
+        render_time = result.finished_at - result.started_at
+        # here, as the pool's processes never report their metrics
+        render_seconds.observe(render_time, writer_class.__name__)
+        with self.__lock:
+            self.__completed += 1
+            self.__queue_wait += queue_wait
+            self.__queue_wait_max = max(self.__queue_wait_max, queue_wait)
+            self.__render_time += render_time
+            self.__render_time_max = max(self.__render_time_max, render_time)
+
+    def __expire(self):
+        """Forget finished jobs older than `result_ttl`, must hold the lock"""
+        expired_before = time.time() - self.result_ttl
+        for key, job in list(self.__jobs.items()):
+            if job.future.done() and job.submitted_at < expired_before:
+                del self.__jobs[key]
+
+
+render_jobs = RenderJobs(
+    config.RENDER_JOB_WORKERS,
+    config.RENDER_JOB_MAX_QUEUE,
+    config.RENDER_JOB_TIMEOUT,
+    config.RENDER_JOB_RESULT_TTL,
+    render_cache,
+    # every worker of a server shares it, like the JWT key, set it to keep jobs
+    # across restarts
+    os.environ.get("RENDER_JOB_SECRET") or secrets.token_urlsafe(20),
+)
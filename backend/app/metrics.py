@@ -0,0 +1,493 @@
+import glob
+import json
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import suppress
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import config
+from app.query_log import query_log
+
+# upper bounds in seconds of the buckets of histograms of durations
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# the metrics of processes which exited, added up by `Metrics.retire`
+RETIRED_FILE = "retired.json"
+# how long a retired process's file is remembered after it was added up, for
+# `render` calls which read the file before it was removed
+RETIRED_NAME_SECONDS = 10 * 60
+
+LabelValues = Tuple[str, ...]
+Snapshot = Dict[str, List[list]]
+
+
+class Counter:
+    """A count which only goes up, one per combination of label values"""
+
+    TYPE = "counter"
+
+    def __init__(self, name: str, help_: str, labels: Sequence[str] = ()):
+        self.name: str = name
+        self.help: str = help_
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self.__lock = threading.Lock()
+        self.__values: Dict[LabelValues, float] = {}
+
+    def __repr__(self) -> str:
+        return f"<Counter {self.name=}, {self.labels=}>"
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self.__lock:
+            self.__values[label_values] = self.__values.get(label_values, 0) + amount
+
+    def snapshot(self) -> List[list]:
+        """Get [label values, count] of every combination of label values"""
+        with self.__lock:
+            return [[list(key), value] for key, value in self.__values.items()]
+
+
+class Histogram:
+    """Counts of observations falling in each of `buckets`, with their count and
+    sum, one per combination of label values
+    """
+
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        self.name: str = name
+        self.help: str = help_
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        self.__lock = threading.Lock()
+        # observations in each bucket, not cumulative, the last is +Inf, then sum
+        self.__values: Dict[LabelValues, List[float]] = {}
+
+    def __repr__(self) -> str:
+        return f"<Histogram {self.name=}, {self.labels=}, {self.buckets=}>"
+
+    def observe(self, value: float, *label_values: str):
+        bucket = bisect_left(self.buckets, value)
+        with self.__lock:
+            values = self.__values.get(label_values)
+            if values is None:
+                values = self.__values[label_values] = [0] * (len(self.buckets) + 2)
+            values[bucket] += 1
+            values[-1] += value
+
+    def snapshot(self) -> List[list]:
+        """Get [label values, bucket counts and sum] of every combination of
+        label values
+        """
+        with self.__lock:
+            return [[list(key), list(values)] for key, values in self.__values.items()]
+
+
+class Metrics:
+    """The metrics of this process, rendered in the Prometheus text format
+
+    With a `directory`, every process writes its metrics there with `write` and
+    `render` adds up the metrics of every process which ever wrote them, so any
+    worker can answer for the whole server. Those of other processes are up to
+    the seconds between their writes old. Each process writes a file named
+    after its pid and a random id, so a process reusing the pid of one which
+    exited never replaces its metrics. Once a process has exited, `retire` adds
+    its metrics to those of the processes which exited before it, so the files
+    do not pile up as workers are replaced.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory: Optional[str] = directory
+        self.__lock = threading.Lock()
+        self.__metrics: Dict[str, object] = {}
+        self.__writer: Optional[threading.Thread] = None
+        self.__writer_pid: Optional[int] = None
+        self.__file_pid: Optional[int] = None
+        self.__file_name: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"<Metrics {self.directory=}>"
+
+    def counter(self, name: str, help_: str, labels: Sequence[str] = ()) -> Counter:
+        return self.__add(Counter(name, help_, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        return self.__add(Histogram(name, help_, labels, buckets))
+
+    def snapshot(self) -> Snapshot:
+        """Get the values of every metric, keyed by name"""
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def write(self):
+        """Write this process's metrics to the directory for `render` to find"""
+        if self.directory is None:
+            return
+        self.__write_file(self.__own_file_name(), self.snapshot())
+
+    def retire(self, pid: int):
+        """Add the metrics written by a process which has exited to those of the
+        processes which exited before it, and remove its file
+
+        Only one process may retire others at a time. The retired metrics are
+        written before the files are removed, remembering which files they
+        include, so a file is never counted twice, even if this is interrupted.
+        """
+        if self.directory is None:
+            return
+        retired = self.__read_retired()
+        folded = retired["folded"]
+        now = time.time()
+        for name, folded_at in list(folded.items()):
+            gone = not os.path.exists(os.path.join(self.directory, name))
+            if gone and now - folded_at > RETIRED_NAME_SECONDS:
+                del folded[name]
+        paths = glob.glob(os.path.join(self.directory, f"worker-{pid}-*.json"))
+        snapshots = [retired["metrics"]]
+        for path in paths:
+            name = os.path.basename(path)
+            if name in folded:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+            folded[name] = now
+        retired["metrics"] = combine(snapshots)
+        self.__write_file(RETIRED_FILE, retired)
+        for path in paths:
+            with suppress(FileNotFoundError):
+                os.unlink(path)
+        # left by a write interrupted by the process exiting
+        for path in glob.glob(os.path.join(self.directory, f".worker-{pid}-*")):
+            with suppress(FileNotFoundError):
+                os.unlink(path)
+
+    def write_every(self, seconds: float, logger: logging.Logger):
+        """Write this process's metrics every `seconds` in the background, from
+        a thread started by the first call in each process
+        """
+        if self.directory is None or self.__writer_pid == os.getpid():
+            return
+        with self.__lock:
+            if self.__writer_pid == os.getpid():
+                return
+            self.__writer_pid = os.getpid()
+            self.__writer = threading.Thread(
+                target=self.__write_forever,
+                args=(seconds, logger),
+                name="metrics-writer",
+                daemon=True,
+            )
+            self.__writer.start()
+
+    def clear(self):
+        """Forget the metrics written by earlier processes, so counting starts
+        again from 0 when the server restarts
+        """
+        if self.directory is None:
+            return
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            os.unlink(path)
+
+    def render(self) -> str:
+        """Get the metrics in the Prometheus text format, added up across every
+        process which wrote them to the directory
+        """
+        snapshots = [self.snapshot()]
+        if self.directory is not None:
+            self.write()
+            snapshots = list(self.__read_all())
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            for key, value in sorted(merge(metric.name, snapshots).items()):
+                labels = list(zip(metric.labels, key))
+                if metric.TYPE == "counter":
+                    lines.append(sample(metric.name, labels, value))
+                    continue
+                cumulative = 0
+                for bound, count in zip([*metric.buckets, math.inf], value):
+                    cumulative += count
+                    le = [("le", "+Inf" if bound == math.inf else repr(bound))]
+                    lines.append(
+                        sample(f"{metric.name}_bucket", labels + le, cumulative)
+                    )
+                lines.append(sample(f"{metric.name}_sum", labels, value[-1]))
+                lines.append(sample(f"{metric.name}_count", labels, cumulative))
+        return "\n".join(lines) + "\n"
+
+    def __add(self, metric):
+        with self.__lock:
+            if metric.name in self.__metrics:
+                raise ValueError(f"Metric {metric.name} already exists")
+            self.__metrics[metric.name] = metric
+        return metric
+
+    def __write_forever(self, seconds: float, logger: logging.Logger):
+        while True:
+            time.sleep(seconds)
+            try:
+                self.write()
+            except OSError:
+                logger.exception("Could not write metrics to %s", self.directory)
+
+    def __own_file_name(self) -> str:
+        """Name of this process's file, a new one in a forked process"""
+        if self.__file_pid != os.getpid():
+            self.__file_pid = os.getpid()
+            self.__file_name = f"worker-{self.__file_pid}-{uuid.uuid4().hex}.json"
+        return self.__file_name
+
+    def __write_file(self, name: str, data: object):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(
+            dir=self.directory, prefix=f".{name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temporary, os.path.join(self.directory, name))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def __read_retired(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, RETIRED_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"metrics": {}, "folded": {}}
+
+    def __read_all(self) -> List[Snapshot]:
+        """Read the metrics of every process, those still running first, so any
+        retired since are left out rather than counted twice
+        """
+        snapshots = {}
+        for path in glob.glob(os.path.join(self.directory, "worker-*.json")):
+            try:
+                with open(path) as f:
+                    snapshots[os.path.basename(path)] = json.load(f)
+            except (OSError, ValueError):
+                # retired since it was found
+                continue
+        retired = self.__read_retired()
+        running = [
+            snapshot
+            for name, snapshot in snapshots.items()
+            if name not in retired["folded"]
+        ]
+        return [retired["metrics"], *running]
+
+
+def merge(name: str, snapshots: List[Snapshot]) -> Dict[tuple, object]:
+    """Add up a metric's values across snapshots, keyed by label values"""
+    merged: Dict[tuple, object] = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.get(name, []):
+            key = tuple(key)
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(value, list):
+                merged[key] = [a + b for a, b in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    return merged
+
+
+def combine(snapshots: List[Snapshot]) -> Snapshot:
+    """Add up every metric's values across snapshots into one snapshot"""
+    names = {name for snapshot in snapshots for name in snapshot}
+    return {
+        name: [[list(key), value] for key, value in merge(name, snapshots).items()]
+        for name in names
+    }
+
+
+def sample(name: str, labels: List[Tuple[str, str]], value: float) -> str:
+    """A line of the Prometheus text format"""
+    if not labels:
+        return f"{name} {value}"
+    pairs = ",".join(f'{label}="{escape(str(v))}"' for label, v in labels)
+    return f"{name}{{{pairs}}} {value}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+class SqlTimer(threading.local):
+    """Statements run and seconds spent in SQLite by the current thread since
+    the last `take`
+    """
+
+    def __init__(self):
+        self.queries: int = 0
+        self.seconds: float = 0.0
+
+    def take(self) -> Tuple[int, float]:
+        taken = (self.queries, self.seconds)
+        self.queries, self.seconds = 0, 0.0
+        return taken
+
+
+sql_timer = SqlTimer()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """A cursor adding the statements it runs and the time they and fetching
+    their rows take to sql_timer, and the statements to the query log if it is
+    enabled
+    """
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            sql_timer.queries += 1
+            sql_timer.seconds += elapsed
+            if query_log is not None:
+                query_log.record(self.connection, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        if query_log is not None:
+            # kept to log the first, and how many there were
+            seq_of_parameters = list(seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            sql_timer.queries += 1
+            sql_timer.seconds += elapsed
+            if query_log is not None:
+                query_log.record(
+                    self.connection,
+                    sql,
+                    seq_of_parameters[0] if seq_of_parameters else (),
+                    elapsed,
+                    len(seq_of_parameters),
+                )
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            elapsed = time.perf_counter() - start
+            sql_timer.queries += 1
+            sql_timer.seconds += elapsed
+            if query_log is not None:
+                query_log.record(self.connection, sql_script, (), elapsed)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            sql_timer.seconds += time.perf_counter() - start
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            sql_timer.seconds += time.perf_counter() - start
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            sql_timer.seconds += time.perf_counter() - start
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            sql_timer.seconds += time.perf_counter() - start
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection whose cursors, and the ones its shortcuts use, are
+    TimedCursors, and which adds the time its commits and rollbacks take to
+    sql_timer
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            sql_timer.seconds += time.perf_counter() - start
+
+    def rollback(self):
+        start = time.perf_counter()
+        try:
+            super().rollback()
+        finally:
+            sql_timer.seconds += time.perf_counter() - start
+
+
+registry = Metrics(config.METRICS_DIR)
+request_count = registry.counter(
+    "clog_requests_total", "Requests served", ["route", "method", "status"]
+)
+request_seconds = registry.histogram(
+    "clog_request_duration_seconds",
+    "Seconds from a request starting to its response being sent",
+    ["route", "method"],
+)
+sql_query_count = registry.counter(
+    "clog_sql_queries_total", "SQL statements run serving requests", ["route"]
+)
+sql_seconds = registry.counter(
+    "clog_sql_seconds_total",
+    "Seconds spent running SQL statements and fetching their rows serving requests",
+    ["route"],
+)
+render_seconds = registry.histogram(
+    "clog_render_duration_seconds", "Seconds taken to render a course", ["writer"]
+)
+evaluator_seconds = registry.histogram(
+    "clog_evaluator_duration_seconds",
+    "Seconds the evaluator took to evaluate a batch of CLOs",
+)
@@ -0,0 +1,56 @@
+import os
+import re
+import sqlite3
+from typing import List, Tuple
+
+MIGRATION_FILENAME = re.compile(r"^(\d+)_\w+\.sql$")
+
+
+def get_migrations(directory: str) -> List[Tuple[int, str]]:
+    """Find the migration scripts in a directory, sorted by version
+
+    Migration scripts are named `<version>_<description>.sql`, e.g.
+    `0001_lookup_indexes.sql`
+    """
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILENAME.match(filename)
+        if match is not None:
+            migrations.append((int(match[1]), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _ in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Found duplicate migration versions in '{directory}'")
+    return migrations
+
+
+def get_schema_version(db: sqlite3.Connection) -> int:
+    """Get the version of the last migration applied to the database"""
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db: sqlite3.Connection, directory: str) -> int:
+    """Apply every migration newer than the database's schema version
+
+    Each migration runs in its own transaction together with the version bump,
+    so a failed migration leaves the database at the previous version.
+
+    Returns:
+        The schema version of the database after migrating
+    """
+    version = get_schema_version(db)
+    for migration_version, path in get_migrations(directory):
+        if migration_version <= version:
+            continue
+        with open(path) as f:
+            script = f.read()
+        try:
+            db.executescript(
+                f"BEGIN;\n{script}\nPRAGMA user_version = {migration_version};\nCOMMIT;"
+            )
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        version = migration_version
+    return version
@@ -0,0 +1,205 @@
+import os
+import sqlite3
+import threading
+from collections import deque
+from queue import Empty, Full, LifoQueue
+from typing import Deque, Dict, Optional, Type, Union
+
+
+class FairSemaphore:
+    """A semaphore which hands each release to the longest waiting acquire
+
+    threading.Semaphore lets the thread that just released it take it straight
+    back, which under sustained load can starve the other waiters for seconds.
+    """
+
+    def __init__(self, value: int):
+        self.__lock = threading.Lock()
+        self.__available: int = value
+        self.__waiters: Deque[threading.Event] = deque()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the semaphore, returning False after `timeout` seconds"""
+        with self.__lock:
+            if self.__available and not self.__waiters:
+                self.__available -= 1
+                return True
+            granted = threading.Event()
+            self.__waiters.append(granted)
+        if granted.wait(timeout):
+            return True
+        with self.__lock:
+            if granted.is_set():
+                # released to us as we gave up
+                return True
+            self.__waiters.remove(granted)
+            return False
+
+    def release(self):
+        with self.__lock:
+            if self.__waiters:
+                self.__waiters.popleft().set()
+            else:
+                self.__available += 1
+
+
+class ConnectionPool:
+    """A pool of long-lived SQLite connections for a single worker process
+
+    Connections are opened lazily, configured once with the given pragmas and
+    then handed out to requests with `acquire` and given back with `release`.
+    At most `size` idle connections are kept around; a `size` of 0 disables
+    pooling and every connection is closed on release.
+
+    A `read_only` pool opens the database with `mode=ro` and `query_only`, so
+    its connections can never write, and ends their transactions without
+    committing. In WAL mode they read without ever waiting for a writer.
+
+    With `max_open`, at most that many connections are handed out at once and
+    `acquire` waits up to `timeout` seconds for one to be released. A pool with
+    a `max_open` of 1 serialises everything done with it.
+
+    Connections are opened as instances of `factory`, a subclass of
+    sqlite3.Connection.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        size: int,
+        pragmas: Optional[Dict[str, Union[str, int]]] = None,
+        read_only: bool = False,
+        max_open: Optional[int] = None,
+        timeout: Optional[float] = None,
+        factory: Type[sqlite3.Connection] = sqlite3.Connection,
+    ):
+        self.database: str = database
+        self.size: int = size
+        self.pragmas: Dict[str, Union[str, int]] = pragmas or {}
+        self.read_only: bool = read_only
+        self.max_open: Optional[int] = max_open
+        self.timeout: Optional[float] = timeout
+        self.factory: Type[sqlite3.Connection] = factory
+        self.__lock = threading.Lock()
+        self.__pid: int = os.getpid()
+        self.__idle: LifoQueue = LifoQueue(maxsize=max(size, 1))
+        self.__open: Optional[FairSemaphore] = self.__semaphore()
+
+    def __repr__(self) -> str:
+        return (
+            f"<ConnectionPool {self.database=}, {self.size=}, {self.read_only=}, "
+            f"{self.max_open=}>"
+        )
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a new connection and apply the configured pragmas to it"""
+        if self.read_only:
+            uri = f"file:{os.path.abspath(self.database)}?mode=ro"
+            db = sqlite3.connect(
+                uri, uri=True, check_same_thread=False, factory=self.factory
+            )
+            # the journal mode is the writer's to set, a reader cannot change it
+            pragmas = {**self.pragmas, "query_only": 1}
+            pragmas.pop("journal_mode", None)
+        else:
+            db = sqlite3.connect(
+                self.database, check_same_thread=False, factory=self.factory
+            )
+            pragmas = self.pragmas
+        db.row_factory = sqlite3.Row
+        for pragma, value in pragmas.items():
+            db.execute(f"PRAGMA {pragma}={value}")
+        return db
+
+    def acquire(self) -> sqlite3.Connection:
+        """Get an idle connection from the pool, opening one if none are idle
+
+        Raises:
+            sqlite3.OperationalError: if `max_open` connections are still in use
+                after `timeout` seconds
+        """
+        self.__check_pid()
+        semaphore = self.__open
+        if semaphore is not None and not semaphore.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"Timed out waiting for one of {self.max_open} connections to "
+                f"{self.database}"
+            )
+        try:
+            return self.__idle.get_nowait()
+        except Empty:
+            pass
+        try:
+            return self.connect()
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+
+    def release(
+        self, db: sqlite3.Connection, exception: Optional[BaseException] = None
+    ):
+        """End the connection's transaction and return it to the pool
+
+        The transaction is committed, or rolled back if the request failed or
+        the pool is read-only, so the next user of the connection always starts
+        outside a transaction.
+        """
+        try:
+            self.__end_transaction(db, exception)
+        finally:
+            if self.__open is not None and os.getpid() == self.__pid:
+                self.__open.release()
+
+    def __end_transaction(
+        self, db: sqlite3.Connection, exception: Optional[BaseException]
+    ):
+        try:
+            if exception is None and not self.read_only:
+                db.commit()
+            else:
+                db.rollback()
+        except sqlite3.Error:
+            db.close()
+            raise
+        if self.size == 0 or os.getpid() != self.__pid:
+            db.close()
+            return
+        try:
+            self.__idle.put_nowait(db)
+        except Full:
+            db.close()
+
+    def fill(self):
+        """Open connections until `size` are idle, so the first requests served do
+        not wait to connect
+        """
+        count = self.size if self.max_open is None else min(self.size, self.max_open)
+        connections = [self.acquire() for _ in range(count)]
+        for db in connections:
+            self.release(db)
+
+    def close(self):
+        """Close every idle connection held by the pool"""
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except Empty:
+                return
+
+    def __check_pid(self):
+        """Drop connections inherited from a parent process after a fork"""
+        if os.getpid() == self.__pid:
+            return
+        with self.__lock:
+            if os.getpid() != self.__pid:
+                # the inherited connections belong to the parent, never touch them
+                self.__idle = LifoQueue(maxsize=max(self.size, 1))
+                self.__open = self.__semaphore()
+                self.__pid = os.getpid()
+
+    def __semaphore(self) -> Optional[FairSemaphore]:
+        """Semaphore counting the connections handed out, if there is a limit"""
+        if self.max_open is None:
+            return None
+        return FairSemaphore(self.max_open)
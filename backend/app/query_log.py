@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+import config
+
+# statements EXPLAIN QUERY PLAN can be asked about
+PLANNED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+# most parameters whose shapes are recorded, the rest are only counted
+MAX_PARAMETER_SHAPES = 20
+# most distinct statements aggregated, later ones are added up as OTHER
+MAX_STATEMENTS = 1000
+OTHER = "OTHER"
+# source files of frames which are not the caller of a statement
+TRACING_FILES = ("metrics.py", "query_log.py")
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+# lists of placeholders, as bulk inserts and IN (...) vary in length
+PLACEHOLDERS = re.compile(r"\?(?:\s*,\s*\?)+")
+ROWS = re.compile(r"\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+")
+
+
+@lru_cache(maxsize=1024)
+def normalise(sql: str) -> str:
+    """Get a statement with its whitespace collapsed and its literals and lists
+    of placeholders replaced, so every run of the same query looks the same
+    """
+    sql = " ".join(sql.split())
+    sql = STRING.sub("?", sql)
+    sql = NUMBER.sub("?", sql)
+    sql = PLACEHOLDERS.sub("?, ...", sql)
+    return ROWS.sub("(?, ...), ...", sql)
+
+
+def parameter_shapes(parameters: Any) -> List[str]:
+    """Get the types of a statement's parameters, and the lengths of strings and
+    blobs, without their values
+    """
+    if isinstance(parameters, dict):
+        items = list(parameters.items())
+        shapes = [f"{key}: {shape(value)}" for key, value in items]
+    else:
+        shapes = [shape(value) for value in parameters or ()]
+    if len(shapes) > MAX_PARAMETER_SHAPES:
+        more = len(shapes) - MAX_PARAMETER_SHAPES
+        shapes = shapes[:MAX_PARAMETER_SHAPES] + [f"... {more} more"]
+    return shapes
+
+
+def shape(value: Any) -> str:
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def caller() -> str:
+    """Get the file, line and function which ran the statement being traced"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename.endswith(TRACING_FILES):
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    code = frame.f_code
+    path = os.path.relpath(code.co_filename)
+    return f"{path}:{frame.f_lineno} in {code.co_name}"
+
+
+def query_plan(
+    db: sqlite3.Connection, sql: str, parameters: Any
+) -> Optional[List[str]]:
+    """Get the lines of a statement's EXPLAIN QUERY PLAN, indented by depth, or
+    None if it has none
+    """
+    if not sql.lstrip().upper().startswith(PLANNED_STATEMENTS):
+        return None
+    try:
+        # a plain cursor, so the EXPLAIN is not traced itself
+        rows = (
+            sqlite3.Cursor(db)
+            .execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            .fetchall()
+        )
+    except sqlite3.Error:
+        return None
+    depths: Dict[int, int] = {0: -1}
+    lines = []
+    for id_, parent, _, detail in rows:
+        depths[id_] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[id_] + detail)
+    return lines
+
+
+class QueryLog:
+    """Times every statement run with a TimedConnection, adding them up by their
+    normalised SQL, and logs the ones taking `threshold` seconds or more as JSON
+    lines with their parameters' shapes, caller and EXPLAIN QUERY PLAN
+
+    Every process logs to its own file in `directory`, rotated after `max_bytes`
+    with `backups` old files kept, so workers never rotate each other's files.
+    """
+
+    def __init__(self, threshold: float, directory: str, max_bytes: int, backups: int):
+        self.threshold: float = threshold
+        self.directory: str = directory
+        self.max_bytes: int = max_bytes
+        self.backups: int = backups
+        self.__lock = threading.Lock()
+        self.__pid: Optional[int] = None
+        self.__logger: Optional[logging.Logger] = None
+        # normalised SQL -> [count, total seconds, max seconds, slow count]
+        self.__statements: Dict[str, List[float]] = {}
+        self.__logged: int = 0
+
+    def __repr__(self) -> str:
+        return f"<QueryLog {self.threshold=}, {self.directory=}>"
+
+    def record(
+        self,
+        db: sqlite3.Connection,
+        sql: str,
+        parameters: Any,
+        seconds: float,
+        rows: int = 1,
+    ):
+        """Add up a statement run `rows` times with `parameters` or, for more
+        than one, with `parameters` as the first. Logs it if it was slow.
+        """
+        statement = normalise(sql)
+        slow = seconds >= self.threshold
+        with self.__lock:
+            totals = self.__statements.get(statement)
+            if totals is None:
+                if len(self.__statements) >= MAX_STATEMENTS:
+                    statement = OTHER
+                totals = self.__statements.setdefault(statement, [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            totals[3] += slow
+        if slow:
+            self.__log(
+                {
+                    "time": time.time(),
+                    "pid": os.getpid(),
+                    "seconds": seconds,
+                    "sql": statement,
+                    "parameters": parameter_shapes(parameters),
+                    "rows": rows,
+                    "caller": caller(),
+                    "plan": query_plan(db, sql, parameters),
+                }
+            )
+
+    def report(self, limit: int) -> List[Dict[str, Any]]:
+        """Get the `limit` statements which took the most time in total"""
+        with self.__lock:
+            statements = [
+                (sql, list(totals)) for sql, totals in self.__statements.items()
+            ]
+        statements.sort(key=lambda item: item[1][1], reverse=True)
+        return [
+            {
+                "sql": sql,
+                "count": count,
+                "total_seconds": total,
+                "mean_seconds": total / count,
+                "max_seconds": max_,
+                "slow": slow,
+            }
+            for sql, (count, total, max_, slow) in statements[:limit]
+        ]
+
+    def stats(self) -> Dict[str, float]:
+        """Get the number of distinct statements and of slow ones logged"""
+        with self.__lock:
+            return {
+                "threshold_seconds": self.threshold,
+                "statements": len(self.__statements),
+                "logged": self.__logged,
+            }
+
+    def __log(self, record: Dict[str, Any]):
+        with self.__lock:
+            self.__logged += 1
+            if self.__pid != os.getpid():
+                # the file of a parent process is the parent's to write
+                self.__logger = self.__open_log()
+                self.__pid = os.getpid()
+            logger = self.__logger
+        logger.info(json.dumps(record))
+
+    def __open_log(self) -> logging.Logger:
+        os.makedirs(self.directory, exist_ok=True)
+        handler = RotatingFileHandler(
+            os.path.join(self.directory, f"{os.getpid()}.log"),
+            maxBytes=self.max_bytes,
+            backupCount=self.backups,
+        )
+        logger = logging.getLogger(f"{__name__}.{os.getpid()}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.handlers = [handler]
+        return logger
+
+
+query_log = (
+    QueryLog(
+        config.SLOW_QUERY_THRESHOLD,
+        config.SLOW_QUERY_LOG_DIR,
+        config.SLOW_QUERY_LOG_MAX_BYTES,
+        config.SLOW_QUERY_LOG_BACKUPS,
+    )
+    if config.SLOW_QUERY_LOG_ENABLED
+    else None
+)
@@ -1,13 +1,22 @@
+from typing import Callable, Optional
+
 from app.courses.course import Course
 
 
 class User:
-    def __init__(self, id_: int, username: str, password: str):
+    def __init__(
+        self,
+        id_: int,
+        username: str,
+        password: str,
+        course_loader: Optional[Callable[[], Course]] = None,
+    ):
         self.__id: int = id_
         self.__username: str = username
         self.__password: str = password
         self.__logged_in: bool = False
-        self.__course: Course = Course()
+        self.__course: Optional[Course] = None
+        self.__course_loader: Optional[Callable[[], Course]] = course_loader
 
     def __repr__(self) -> str:
         return f"User: {self.__id=}, {self.__username=}"
@@ -40,6 +49,15 @@ class User:
     def username(self):
         return self.__username
 
+    def set_course_loader(self, course_loader: Callable[[], Course]):
+        """Set how to load the user's course, it is called on first access"""
+        self.__course_loader = course_loader
+
     @property
-    def course(self):
+    def course(self) -> Course:
+        if self.__course is None:
+            if self.__course_loader is None:
+                self.__course = Course()
+            else:
+                self.__course = self.__course_loader()
         return self.__course
@@ -0,0 +1,289 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.pool import ConnectionPool
+
+# an INSERT statement and its parameters
+Event = Tuple[str, Tuple]
+# errors an event raises however many times it is written, as opposed to ones
+# like the database being locked
+PERMANENT_ERRORS = (
+    sqlite3.IntegrityError,
+    sqlite3.InterfaceError,
+    sqlite3.ProgrammingError,
+    sqlite3.DataError,
+    OverflowError,
+)
+
+
+class WriteBehindBuffer:
+    """Queues fire-and-forget INSERTs, such as ratings and feedback, in memory
+    and writes them in the background, many to a transaction
+
+    A batch is flushed once `batch_size` events are queued or the oldest has
+    waited `flush_interval` seconds, so requests adding events never wait for
+    the database's writer lock or an fsync. At most `max_queue` events are held
+    at a time, past that `add` refuses them and they should be written straight
+    away. Events still queued when the process is killed are lost, `shutdown`
+    writes them before a graceful exit.
+
+    A batch which fails to write is retried as a whole after `flush_interval`
+    seconds, unless one of its events can never be written. Then the events are
+    written one at a time and the ones which fail are logged and dropped, so
+    they do not hold up the events queued after them.
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool,
+        batch_size: int,
+        flush_interval: float,
+        max_queue: int,
+        logger: logging.Logger,
+    ):
+        self.pool: ConnectionPool = pool
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.max_queue: int = max_queue
+        self.logger: logging.Logger = logger
+        self.__condition = threading.Condition()
+        self.__pid: int = os.getpid()
+        self.__thread: Optional[threading.Thread] = None
+        self.__stopping: bool = False
+        # whether every queued event is due, until the queue is empty
+        self.__flush_requested: bool = False
+        # (time queued, event) oldest first
+        self.__events: Deque[Tuple[float, Event]] = deque()
+        self.__flushing: int = 0
+        self.__queued: int = 0
+        self.__refused: int = 0
+        self.__written: int = 0
+        self.__dropped: int = 0
+        self.__flushes: int = 0
+        self.__failed_flushes: int = 0
+        self.__batch_size_max: int = 0
+        self.__flush_time: float = 0.0
+        self.__flush_time_max: float = 0.0
+        self.__queue_wait_max: float = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"<WriteBehindBuffer {self.batch_size=}, {self.flush_interval=}, "
+            f"{self.max_queue=}>"
+        )
+
+    def add(self, statement: str, params: Tuple) -> bool:
+        """Queue an INSERT to be written in the background, starting the flusher
+        on first use. Returns False if the buffer is full or shutting down.
+        """
+        with self.__condition:
+            self.__check_pid()
+            if self.__stopping or len(self.__events) >= self.max_queue:
+                self.__refused += 1
+                return False
+            if self.__thread is None:
+                self.__thread = threading.Thread(
+                    target=self.__flush_forever, name="write-behind", daemon=True
+                )
+                self.__thread.start()
+            self.__events.append((time.time(), (statement, params)))
+            self.__queued += 1
+            # the flusher sleeps until the first event is due or a batch is full
+            if len(self.__events) in (1, self.batch_size):
+                self.__condition.notify()
+            return True
+
+    def flush(self, timeout: Optional[float] = None):
+        """Write every queued event, waiting at most `timeout` seconds for them"""
+        with self.__condition:
+            self.__flush_requested = True
+            self.__condition.notify()
+            self.__condition.wait_for(
+                lambda: self.__thread is None
+                or (not self.__events and not self.__flushing),
+                timeout,
+            )
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """Stop taking events and write the ones still queued"""
+        with self.__condition:
+            self.__stopping = True
+            self.__condition.notify()
+            thread = self.__thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the buffer's depth, counters, batch sizes and the seconds batches
+        took to write and events waited to be written, for monitoring
+        """
+        with self.__condition:
+            oldest = self.__events[0][0] if self.__events else None
+            return {
+                "depth": len(self.__events),
+                "queued": self.__queued,
+                "refused": self.__refused,
+                "written": self.__written,
+                "dropped": self.__dropped,
+                "flushes": self.__flushes,
+                "failed_flushes": self.__failed_flushes,
+                "batch_size_mean": (
+                    self.__written / self.__flushes if self.__flushes else 0.0
+                ),
+                "batch_size_max": self.__batch_size_max,
+                "flush_seconds": self.__flush_time,
+                "flush_seconds_max": self.__flush_time_max,
+                "queue_wait_seconds_max": self.__queue_wait_max,
+                "oldest_event_age_seconds": (
+                    time.time() - oldest if oldest is not None else 0.0
+                ),
+            }
+
+    def __check_pid(self):
+        """Forget the events and flusher inherited from a parent after a fork,
+        the parent writes those events itself
+        """
+        if os.getpid() != self.__pid:
+            self.__pid = os.getpid()
+            self.__events.clear()
+            self.__flushing = 0
+            self.__thread = None
+
+    def __flush_forever(self):
+        """Write batches of events until shut down, then write what is left"""
+        try:
+            self.__flush_batches()
+        finally:
+            with self.__condition:
+                if self.__thread is threading.current_thread():
+                    # a later event starts a new flusher
+                    self.__thread = None
+                self.__condition.notify_all()
+
+    def __flush_batches(self):
+        while True:
+            with self.__condition:
+                if not self.__due():
+                    # woken by new events, so the time to wait is worked out again
+                    self.__condition.wait(self.__time_to_due())
+                    continue
+                if self.__stopping and not self.__events:
+                    return
+                batch = [
+                    self.__events.popleft()
+                    for _ in range(min(self.batch_size, len(self.__events)))
+                ]
+                self.__flushing = len(batch)
+            unwritten = self.__write(batch)
+            with self.__condition:
+                self.__flushing = 0
+                if unwritten:
+                    # keep them in order in front of the ones queued meanwhile
+                    self.__events.extendleft(reversed(unwritten))
+                elif not self.__events:
+                    self.__flush_requested = False
+                self.__condition.notify_all()
+            if unwritten:
+                if self.__stopping:
+                    self.logger.error(
+                        "Lost %d queued events on shutdown", len(self.__events)
+                    )
+                    return
+                time.sleep(self.flush_interval)
+
+    def __due(self) -> bool:
+        """Whether a batch should be written now"""
+        if not self.__events:
+            return self.__stopping
+        return (
+            self.__stopping
+            or self.__flush_requested
+            or len(self.__events) >= self.batch_size
+            or time.time() - self.__events[0][0] >= self.flush_interval
+        )
+
+    def __time_to_due(self) -> Optional[float]:
+        """Seconds until the oldest event has waited `flush_interval` seconds"""
+        if not self.__events:
+            return None
+        return max(0.0, self.__events[0][0] + self.flush_interval - time.time())
+
+    def __write(self, batch: List[Tuple[float, Event]]) -> List[Tuple[float, Event]]:
+        """Write a batch of events in one transaction, or one at a time if one of
+        them can never be written. Returns the events to retry later.
+        """
+        start = time.time()
+        try:
+            self.__write_events(batch)
+            self.__record(batch, start)
+            return []
+        except PERMANENT_ERRORS:
+            pass
+        except sqlite3.Error:
+            self.logger.exception("Could not write %d queued events", len(batch))
+            with self.__condition:
+                self.__failed_flushes += 1
+            return batch
+        # outside the except block, so each event's errors are logged on their own
+        return self.__write_each(batch, start)
+
+    def __write_each(
+        self, batch: List[Tuple[float, Event]], start: float
+    ) -> List[Tuple[float, Event]]:
+        """Write events one at a time, dropping those which can never be
+        written. Returns the events to retry later.
+        """
+        written = []
+        unwritten: List[Tuple[float, Event]] = []
+        for i, event in enumerate(batch):
+            try:
+                self.__write_events([event])
+            except PERMANENT_ERRORS:
+                self.logger.exception(
+                    "Dropped a queued event which cannot be written: %s", event[1][0]
+                )
+                with self.__condition:
+                    self.__dropped += 1
+                continue
+            except sqlite3.Error:
+                self.logger.exception("Could not write %d queued events", len(batch))
+                with self.__condition:
+                    self.__failed_flushes += 1
+                unwritten = batch[i:]
+                break
+            written.append(event)
+        if written:
+            self.__record(written, start)
+        return unwritten
+
+    def __write_events(self, events: List[Tuple[float, Event]]):
+        """Write events in one transaction, running each statement once for all
+        of its parameters
+        """
+        params: Dict[str, List[Tuple]] = {}
+        for _, (statement, event_params) in events:
+            params.setdefault(statement, []).append(event_params)
+        db = self.pool.acquire()
+        try:
+            for statement, rows in params.items():
+                db.executemany(statement, rows)
+        except BaseException as exception:
+            self.pool.release(db, exception)
+            raise
+        self.pool.release(db)
+
+    def __record(self, written: List[Tuple[float, Event]], start: float):
+        """Count a flush of the events written since `start`"""
+        elapsed = time.time() - start
+        with self.__condition:
+            self.__written += len(written)
+            self.__flushes += 1
+            self.__batch_size_max = max(self.__batch_size_max, len(written))
+            self.__flush_time += elapsed
+            self.__flush_time_max = max(self.__flush_time_max, elapsed)
+            self.__queue_wait_max = max(self.__queue_wait_max, start - written[0][0])
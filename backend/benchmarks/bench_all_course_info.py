@@ -0,0 +1,73 @@
+"""Compare peak memory and throughput of building every course of a user into
+one JSON document (as /all_course_info used to) against streaming them
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+import tracemalloc
+from typing import Callable, Tuple
+
+import config
+from benchmarks.common import (
+    use_temporary_database,
+    logged_in_client,
+    seed_courses,
+    load_all_courses,
+)
+
+
+def measure(func: Callable[[], int]) -> Tuple[float, int, int]:
+    """Call `func`, returning the seconds taken, the peak traced memory in bytes
+    and the number of bytes `func` says it produced
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    produced = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, produced
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    use_temporary_database()
+    import app as backend
+    from app.cache import course_cache
+
+    client = logged_in_client(backend.app)
+    user_id = 1
+    db = sqlite3.connect(config.DATABASE)
+    db.row_factory = sqlite3.Row
+    seeded = 0
+
+    def buffered() -> int:
+        body = json.dumps({"courses": load_all_courses(user_id, db.cursor())})
+        return len(body.encode())
+
+    def streamed() -> int:
+        response = client.get("/all_course_info", buffered=False)
+        produced = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return produced
+
+    for size in sorted(args.sizes):
+        seed_courses(db, user_id, size - seeded)
+        seeded = size
+        for label, func in [("buffered", buffered), ("streamed", streamed)]:
+            course_cache.clear()
+            elapsed, peak, produced = measure(func)
+            print(
+                f"{size:>6} courses, {label:>8}: {peak / 2 ** 20:8.2f} MiB peak, "
+                f"{produced / 2 ** 20 / elapsed:8.2f} MiB/s, {size / elapsed:10.1f} "
+                f"courses/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
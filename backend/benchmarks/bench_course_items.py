@@ -0,0 +1,63 @@
+"""Compare items/sec of adding and removing CLOs and assessments with one
+request per item against one /update_course_items request for all of them
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.common import use_temporary_database, logged_in_client, csrf_headers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 60, 500])
+    args = parser.parse_args()
+
+    use_temporary_database()
+    import app as backend
+
+    client = logged_in_client(backend.app)
+
+    def post(route: str, body: dict):
+        response = client.post(
+            route, data=json.dumps(body), headers=csrf_headers(client)
+        )
+        assert json.loads(response.data)["success"], response.data
+
+    post(
+        "/modify_course", {"title": "T", "discipline": "D", "code": "C", "faculty": "F"}
+    )
+    for n in args.items:
+        clos = [{"text": f"Learning outcome {i}"} for i in range(n)]
+        assessments = [{"text": f"Assessment {i}", "weight": i} for i in range(n)]
+
+        def single():
+            for clo in clos:
+                post("/add_clo", clo)
+            for assessment in assessments:
+                post("/add_assessment", assessment)
+            for clo in clos:
+                post("/remove_clo", clo)
+            for assessment in assessments:
+                post("/remove_assessment", assessment)
+
+        def batch():
+            post(
+                "/update_course_items",
+                {"clos": {"add": clos}, "assessments": {"add": assessments}},
+            )
+            post(
+                "/update_course_items",
+                {"clos": {"remove": clos}, "assessments": {"remove": assessments}},
+            )
+
+        for label, run in [("single", single), ("batch", batch)]:
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{n:>5} of each, {label:>6}: {n * 4 / elapsed:10.1f} items/sec")
+
+
+if __name__ == "__main__":
+    main()
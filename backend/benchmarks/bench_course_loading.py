@@ -0,0 +1,89 @@
+"""Compare loading every course of a user one course at a time (N+1 queries)
+against the batched loader of app.database
+"""
+
+import argparse
+import sqlite3
+import time
+
+from app.courses.assessment import Assessment
+from app.courses.clo import Clo
+from app.courses.course import Course
+from benchmarks.common import (
+    create_schema,
+    seed_courses,
+    count_queries,
+    load_all_courses,
+)
+
+
+def load_all_courses_one_by_one(user_id: int, cursor: sqlite3.Cursor):
+    """The previous implementation of load_all_courses"""
+    cursor.execute("SELECT * FROM COURSES WHERE USER_ID=?", (user_id,))
+    courses = []
+    for row in cursor.fetchall():
+        course = Course(
+            row["TITLE"],
+            row["DISCIPLINE"],
+            row["CODE"],
+            row["FACULTY"],
+            row["DESCRIPTION"],
+            id_=row["ID"],
+        )
+        cursor.execute(
+            "SELECT * FROM CLOS WHERE USER_ID=? AND COURSE_ID=?", (user_id, row["ID"])
+        )
+        for clo in cursor.fetchall():
+            course.add_clo(Clo(clo["TEXT"], clo["ID"]))
+        cursor.execute(
+            "SELECT * FROM ASSESSMENTS WHERE USER_ID=? AND COURSE_ID=?",
+            (user_id, row["ID"]),
+        )
+        for assessment in cursor.fetchall():
+            course.add_assessment(
+                Assessment(assessment["TEXT"], assessment["WEIGHT"], assessment["ID"])
+            )
+        courses.append(course.publish())
+    return courses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--max-one-by-one",
+        type=int,
+        default=1000,
+        help="skip the N+1 loader above this many courses, it is quadratic "
+        "on a database without indexes",
+    )
+    args = parser.parse_args()
+
+    db = sqlite3.connect(":memory:")
+    db.row_factory = sqlite3.Row
+    create_schema(db)
+    cursor = db.cursor()
+    # a second user keeps the per-user filtering honest
+    seed_courses(db, 2, max(args.sizes))
+    for user_id, size in enumerate(args.sizes, start=3):
+        seed_courses(db, user_id, size)
+        loaders = [("batched", load_all_courses)]
+        if size <= args.max_one_by_one:
+            expected = load_all_courses_one_by_one(user_id, cursor)
+            assert expected == load_all_courses(user_id, cursor)
+            loaders.insert(0, ("one by one", load_all_courses_one_by_one))
+        for label, loader in loaders:
+            queries = count_queries(db, lambda: loader(user_id, cursor))
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                loader(user_id, cursor)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(
+                f"{size:>6} courses, {label:>10}: "
+                f"{elapsed * 1000:10.2f} ms/load, {queries:>6} queries"
+            )
+
+
+if __name__ == "__main__":
+    main()
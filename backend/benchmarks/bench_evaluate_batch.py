@@ -0,0 +1,56 @@
+"""Compare evaluating the CLOs of a course with one /evaluate request per CLO
+against one /evaluate_batch request for all of them
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.common import use_temporary_database, logged_in_client, csrf_headers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clos", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    import app as backend
+
+    client = logged_in_client(backend.app)
+    description = "Students will learn to design, analyse and build software. " * 20
+    client.post(
+        "/add_desc",
+        data=json.dumps({"text": description}),
+        headers=csrf_headers(client),
+    )
+
+    def post(route: str, inputs):
+        response = client.post(
+            route, data=json.dumps({"inputs": inputs}), headers=csrf_headers(client)
+        )
+        assert json.loads(response.data)["success"], response.data
+
+    # load the evaluator before timing
+    post("/evaluate", "Warm up")
+    for n in args.clos:
+        clos = [f"Analyse the complexity of algorithm number {i}" for i in range(n)]
+        timings = {}
+        for label, run in [
+            ("single", lambda: [post("/evaluate", clo) for clo in clos]),
+            ("batch", lambda: post("/evaluate_batch", clos)),
+        ]:
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                run()
+            timings[label] = (time.perf_counter() - start) / args.repeats
+        print(
+            f"{n:>4} CLOs: {timings['single'] * 1000:9.2f} ms as single requests, "
+            f"{timings['batch'] * 1000:9.2f} ms as a batch, "
+            f"{timings['single'] / timings['batch']:6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
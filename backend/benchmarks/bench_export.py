@@ -0,0 +1,60 @@
+"""Measure how the throughput of exporting courses as a zip archive of PDFs
+scales with the number of render processes
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import config
+from benchmarks.common import use_temporary_database, create_schema, seed_courses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    args = parser.parse_args()
+
+    use_temporary_database()
+    from app.cache import RenderCache
+    from app.courses.io import PDFWriter
+    from app.database import load_courses_from_db
+    from app.export import CourseExporter
+
+    db = sqlite3.connect(config.DATABASE)
+    db.row_factory = sqlite3.Row
+    create_schema(db)
+    seed_courses(db, 1, args.courses)
+    rows = db.execute("SELECT * FROM COURSES WHERE USER_ID=1").fetchall()
+    courses = load_courses_from_db(1, rows, db.cursor())
+    # a cache with no room, so every course is rendered on every run
+    cache = RenderCache(tempfile.mkdtemp(prefix="clog-bench-"), 0)
+
+    logger = logging.getLogger("bench_export")
+
+    print(f"{os.cpu_count()} cpus, {len(courses)} courses")
+    baseline = None
+    for workers in args.workers:
+        exporter = CourseExporter(workers, cache)
+        # start the pool's processes before timing
+        list(exporter.export(courses[: workers * 2], {"pdf": PDFWriter}, logger))
+        start = time.perf_counter()
+        size = sum(
+            len(chunk) for chunk in exporter.export(courses, {"pdf": PDFWriter}, logger)
+        )
+        elapsed = time.perf_counter() - start
+        exporter.shutdown()
+        throughput = len(courses) / elapsed
+        baseline = baseline or throughput
+        print(
+            f"{workers:>3} workers: {throughput:8.1f} courses/s, "
+            f"{throughput / baseline:5.2f}x, {size / 2 ** 20:7.2f} MiB archive"
+        )
+
+
+if __name__ == "__main__":
+    main()
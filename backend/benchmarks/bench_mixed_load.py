@@ -0,0 +1,105 @@
+"""Measure the latency of reads while other threads keep writing, with
+read_only routes served by read-only connections and writes serialised on the
+writer connection, against every route sharing one pool of connections
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from typing import List
+
+import config
+from benchmarks.common import (
+    use_temporary_database,
+    logged_in_client,
+    csrf_headers,
+    percentile,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--route", default="/course_info")
+    args = parser.parse_args()
+
+    use_temporary_database()
+    config.RENDER_CACHE_PREWARM = False
+    import app as backend
+    from app.pool import ConnectionPool
+
+    split = (backend.pool, backend.read_pool, set(backend.READ_ONLY_ENDPOINTS))
+    shared = ConnectionPool(
+        config.DATABASE, config.DATABASE_POOL_SIZE, config.DATABASE_PRAGMAS
+    )
+    # every user writes to their own course, as they would in production
+    clients = [
+        logged_in_client(backend.app, f"bench{i}")
+        for i in range(max(args.readers, args.writers))
+    ]
+    for client in clients:
+        response = client.post(
+            "/modify_course",
+            data=json.dumps(
+                {"title": "T", "discipline": "D", "code": "C", "faculty": "F"}
+            ),
+            headers=csrf_headers(client),
+        )
+        assert json.loads(response.data)["success"], response.data
+
+    def read(client, stop: threading.Event, latencies: List[float]):
+        while not stop.is_set():
+            start = time.perf_counter()
+            response = client.get(args.route)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.data
+
+    def write(client, stop: threading.Event, writes: List[int]):
+        items = {"clos": [{"text": f"Outcome {i}"} for i in range(5)]}
+        while not stop.is_set():
+            for change in ["add", "remove"]:
+                response = client.post(
+                    "/update_course_items",
+                    data=json.dumps({"clos": {change: items["clos"]}}),
+                    headers=csrf_headers(client),
+                )
+                assert json.loads(response.data)["success"], response.data
+                writes.append(1)
+
+    for label in ["shared pool", "read/write split"]:
+        if label == "shared pool":
+            backend.pool = backend.read_pool = shared
+            backend.READ_ONLY_ENDPOINTS.clear()
+        else:
+            backend.pool, backend.read_pool = split[:2]
+            backend.READ_ONLY_ENDPOINTS.update(split[2])
+        stop = threading.Event()
+        latencies: List[float] = []
+        writes: List[int] = []
+        threads = [
+            threading.Thread(target=read, args=(clients[i], stop, latencies))
+            for i in range(args.readers)
+        ] + [
+            threading.Thread(target=write, args=(clients[i], stop, writes))
+            for i in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        print(
+            f"{label:>16}: {args.route} p50 {statistics.median(latencies) * 1000:7.2f}"
+            f" ms, p95 {percentile(latencies, 95) * 1000:7.2f} ms, p99 "
+            f"{percentile(latencies, 99) * 1000:7.2f} ms over {len(latencies)} reads"
+            f", {len(writes) / args.seconds:7.1f} writes/sec"
+        )
+
+
+if __name__ == "__main__":
+    main()
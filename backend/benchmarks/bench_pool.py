@@ -0,0 +1,37 @@
+"""Compare requests/sec with and without the database connection pool"""
+
+import argparse
+
+import config
+from benchmarks.common import use_temporary_database, logged_in_client, rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    # a read_only route, served by the read pool
+    parser.add_argument("--route", default="/login_status")
+    args = parser.parse_args()
+
+    use_temporary_database()
+    import app as backend
+    from app.pool import ConnectionPool
+
+    client = logged_in_client(backend.app)
+    # the unpooled baseline also skips the pragmas, as connect_db used to
+    for label, size, pragmas in [
+        ("open/close per request", 0, None),
+        ("pooled", config.DATABASE_POOL_SIZE, config.DATABASE_PRAGMAS),
+    ]:
+        backend.read_pool.close()
+        backend.read_pool = ConnectionPool(
+            config.DATABASE, size, pragmas, read_only=pragmas is not None
+        )
+        # warm up
+        rate(lambda: client.get(args.route), 50)
+        result = rate(lambda: client.get(args.route), args.requests)
+        print(f"{label:>24}: {result:10.1f} requests/sec on {args.route}")
+
+
+if __name__ == "__main__":
+    main()
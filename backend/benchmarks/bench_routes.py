@@ -0,0 +1,516 @@
+"""Load test every route of the app with concurrent clients against a database
+seeded with synthetic users, courses, CLOs, assessments and ratings, reporting
+each route's throughput, p50/p95/p99 latency and queries per request
+
+Each route is loaded on its own, by every client at once, in the order of
+SCENARIOS. `--output` writes the results as JSON, and `--baseline` compares them
+with the JSON written for another commit, e.g.
+
+    python -m benchmarks.bench_routes --output before.json
+    git checkout my-branch
+    python -m benchmarks.bench_routes --baseline before.json
+"""
+
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import config
+from benchmarks.common import (
+    use_temporary_database,
+    logged_in_client,
+    csrf_headers,
+    percentile,
+    counted_queries,
+    seed_courses,
+    seed_ratings,
+)
+
+RATINGS = ["positive", "neutral", "negative", 5]
+
+
+class Session:
+    """A client logged in as one of the seeded users, and what its requests made
+    which later requests use
+    """
+
+    def __init__(self, number: int, client, course_ids: List[int]):
+        self.number: int = number
+        self.client = client
+        self.course_ids: List[int] = course_ids
+        self.job_ids: List[str] = []
+
+    def username(self) -> str:
+        return f"load{self.number}"
+
+
+class Scenario(NamedTuple):
+    """A route to load, and how to make a session's `i`th request to it"""
+
+    name: str
+    method: str
+    # (path, JSON body) of the `i`th request
+    make: Callable[[Session, int], Tuple[str, Optional[dict]]]
+    # statuses of successful responses
+    statuses: Tuple[int, ...] = (200,)
+    # called untimed with each response
+    after: Optional[Callable[[Session, int, object], None]] = None
+    # whether a 200 saying "success": false is an error
+    check_success: bool = True
+
+
+def get(path: str) -> Callable[[Session, int], Tuple[str, Optional[dict]]]:
+    return lambda session, i: (path, None)
+
+
+def remember_job(session: Session, i: int, response):
+    if response.status_code == 202:
+        session.job_ids.append(json.loads(response.data)["result"])
+
+
+def job_id(session: Session, i: int) -> str:
+    """One of the session's render jobs, a missing one if all were refused"""
+    if not session.job_ids:
+        return "missing"
+    return session.job_ids[i % len(session.job_ids)]
+
+
+def log_back_in(session: Session, i: int, response):
+    credentials = {"username": session.username(), "password": "benchmark"}
+    session.client.post("/login", data=json.dumps(credentials))
+
+
+def clos(session: Session, i: int) -> List[dict]:
+    return [{"text": f"Load outcome {session.number} {i} {n}"} for n in range(5)]
+
+
+def course(session: Session, i: int) -> dict:
+    return {
+        "title": f"Course {i}",
+        "discipline": "Computing",
+        "code": f"COMP{i:04}",
+        "faculty": "Engineering",
+    }
+
+
+def uploaded_course(session: Session, i: int) -> dict:
+    data = {
+        **course(session, i),
+        "description": f"An uploaded course {i}",
+        "clos": [{"text": f"Uploaded outcome {n}"} for n in range(5)],
+        "assessments": [
+            {"text": f"Uploaded assessment {n}", "weight": 20} for n in range(5)
+        ],
+    }
+    return {"file": json.dumps(data)}
+
+
+# routes which start new courses or log the client out go last
+SCENARIOS: List[Scenario] = [
+    Scenario("/health", "GET", get("/health")),
+    Scenario("/ready", "GET", get("/ready")),
+    Scenario("/login_status", "GET", get("/login_status")),
+    Scenario(
+        "/login",
+        "POST",
+        lambda session, i: (
+            "/login",
+            {"username": session.username(), "password": "benchmark"},
+        ),
+    ),
+    Scenario(
+        "/evaluate",
+        "POST",
+        lambda session, i: ("/evaluate", {"inputs": f"Analyse algorithm {i}"}),
+        (200, 503),
+    ),
+    Scenario(
+        "/evaluate_batch",
+        "POST",
+        lambda session, i: (
+            "/evaluate_batch",
+            {"inputs": [f"Design system {i} part {n}" for n in range(10)]},
+        ),
+        (200, 503),
+    ),
+    Scenario("/evaluator_stats", "GET", get("/evaluator_stats")),
+    Scenario("/write_buffer_stats", "GET", get("/write_buffer_stats")),
+    Scenario("/cache_stats", "GET", get("/cache_stats")),
+    Scenario("/render_job_stats", "GET", get("/render_job_stats")),
+    Scenario(
+        "/add_desc",
+        "POST",
+        lambda session, i: ("/add_desc", {"text": f"A course description {i}"}),
+    ),
+    Scenario("/modify_course", "POST", lambda s, i: ("/modify_course", course(s, i))),
+    Scenario(
+        "/add_clo",
+        "POST",
+        lambda session, i: ("/add_clo", {"text": f"Load outcome {session.number} {i}"}),
+    ),
+    Scenario(
+        "/remove_clo",
+        "POST",
+        lambda session, i: (
+            "/remove_clo",
+            {"text": f"Load outcome {session.number} {i}"},
+        ),
+    ),
+    Scenario(
+        "/add_assessment",
+        "POST",
+        lambda session, i: (
+            "/add_assessment",
+            {"text": f"Load assessment {session.number} {i}", "weight": 10},
+        ),
+    ),
+    Scenario(
+        "/remove_assessment",
+        "POST",
+        lambda session, i: (
+            "/remove_assessment",
+            {"text": f"Load assessment {session.number} {i}", "weight": 10},
+        ),
+    ),
+    Scenario(
+        "/update_course_items",
+        "POST",
+        lambda session, i: (
+            "/update_course_items",
+            {"clos": {"add": clos(session, i), "remove": clos(session, i - 1)}},
+        ),
+    ),
+    Scenario(
+        "/set_clo_rating",
+        "POST",
+        lambda session, i: (
+            "/set_clo_rating",
+            {"text": f"Learning outcome {i % 5}", "rating": RATINGS[i % 4]},
+        ),
+    ),
+    Scenario(
+        "/set_assessment_rating",
+        "POST",
+        lambda session, i: (
+            "/set_assessment_rating",
+            {"text": f"Assessment {i % 3}", "weight": 33, "rating": RATINGS[i % 4]},
+        ),
+    ),
+    Scenario("/rating_stats", "GET", get("/rating_stats")),
+    Scenario(
+        "/rating_stats?text",
+        "GET",
+        lambda session, i: (f"/rating_stats?text=Learning%20outcome%20{i % 5}", None),
+    ),
+    Scenario("/send_message", "POST", lambda s, i: ("/send_message", {"text": "Hi"})),
+    Scenario(
+        "/question",
+        "POST",
+        lambda session, i: (
+            "/question",
+            {"answers": [{"desc": f"Outcome {n}", "qual": "apply"} for n in range(5)]},
+        ),
+    ),
+    Scenario("/course_info", "GET", get("/course_info")),
+    Scenario("/all_course_info", "GET", get("/all_course_info")),
+    Scenario("/courses", "GET", get("/courses")),
+    Scenario("/download/json", "GET", get("/download/json")),
+    Scenario("/download/pdf", "GET", get("/download/pdf")),
+    Scenario(
+        "/download/pdf/<course_id>",
+        "GET",
+        lambda session, i: (
+            f"/download/pdf/{session.course_ids[i % len(session.course_ids)]}",
+            None,
+        ),
+    ),
+    Scenario(
+        "/download/json?job=1",
+        "GET",
+        get("/download/json?job=1"),
+        (202, 503),
+        remember_job,
+    ),
+    Scenario(
+        "/render_jobs/<job_id>",
+        "GET",
+        lambda session, i: (f"/render_jobs/{job_id(session, i)}", None),
+        (200, 202),
+    ),
+    Scenario("/export", "GET", get("/export")),
+    Scenario("/upload", "POST", lambda s, i: ("/upload", uploaded_course(s, i))),
+    Scenario("/save_course", "GET", get("/save_course")),
+    Scenario(
+        "/register",
+        "POST",
+        lambda session, i: (
+            "/register",
+            {
+                "username": f"registered{session.number}-{i}",
+                "password": "benchmark",
+                "password_confirm": "benchmark",
+            },
+        ),
+    ),
+    # the user /logoff loads is never marked as logged in, so it never succeeds
+    Scenario("/logoff", "GET", get("/logoff"), after=log_back_in, check_success=False),
+]
+
+
+class Result(NamedTuple):
+    """Timings of every request a scenario made"""
+
+    latencies: List[float]
+    queries: List[int]
+    statuses: Counter
+    errors: int
+    seconds: float
+
+    def summary(self) -> Dict[str, object]:
+        latencies = self.latencies or [0.0]
+        return {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "statuses": {str(status): n for status, n in self.statuses.items()},
+            "seconds": self.seconds,
+            "requests_per_second": len(self.latencies) / self.seconds,
+            "latency_ms": {
+                "mean": statistics.mean(latencies) * 1000,
+                "p50": percentile(latencies, 50) * 1000,
+                "p95": percentile(latencies, 95) * 1000,
+                "p99": percentile(latencies, 99) * 1000,
+                "max": max(latencies) * 1000,
+            },
+            "queries_per_request": {
+                "mean": statistics.mean(self.queries or [0]),
+                "max": max(self.queries or [0]),
+            },
+        }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed(backend, args) -> List[Session]:
+    """Register the users, log in a client as each of the first `clients` of
+    them, and give every user their courses and ratings
+    """
+    clients = [
+        logged_in_client(backend.app, f"load{n}") for n in range(max(args.users, 1))
+    ]
+    db = sqlite3.connect(config.DATABASE)
+    sessions = []
+    for n, client in enumerate(clients):
+        user_id = db.execute(
+            "SELECT ID FROM USERS WHERE USERNAME=?", (f"load{n}",)
+        ).fetchone()[0]
+        seed_courses(db, user_id, args.courses, args.clos, args.assessments)
+        seed_ratings(db, user_id, args.ratings)
+        course_ids = [
+            row[0]
+            for row in db.execute("SELECT ID FROM COURSES WHERE USER_ID=?", (user_id,))
+        ]
+        sessions.append(Session(n, client, course_ids))
+    db.close()
+    return sessions[: args.clients]
+
+
+def succeeded(scenario: Scenario, response) -> bool:
+    """Whether a response has one of the scenario's statuses, and is not a 200
+    saying it did not succeed
+    """
+    if response.status_code not in scenario.statuses:
+        return False
+    if not scenario.check_success or response.status_code != 200:
+        return True
+    if not response.data.startswith(b"{"):
+        return True
+    # most routes answer JSON without saying so
+    try:
+        body = json.loads(response.data)
+    except ValueError:
+        return True
+    return body.get("success", True) is not False
+
+
+def run(scenario: Scenario, sessions: List[Session], requests: int, traced) -> Result:
+    """Make `requests` requests to a scenario's route from every session at
+    once, counting the queries `traced` records on each thread
+    """
+    latencies: List[float] = []
+    queries: List[int] = []
+    statuses: Counter = Counter()
+    errors = [0]
+    lock = threading.Lock()
+
+    def load(session: Session):
+        traced.statements = []
+        for i in range(requests):
+            path, body = scenario.make(session, i)
+            traced.statements.clear()
+            start = time.perf_counter()
+            response = session.client.open(
+                path,
+                method=scenario.method,
+                data=None if body is None else json.dumps(body),
+                headers=csrf_headers(session.client),
+            )
+            # streamed responses only run their queries as the body is read
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                queries.append(len(counted_queries(traced.statements)))
+                statuses[response.status_code] += 1
+                if not succeeded(scenario, response):
+                    errors[0] += 1
+            if scenario.after is not None:
+                scenario.after(session, i, response)
+
+    threads = [threading.Thread(target=load, args=(s,)) for s in sessions]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Result(latencies, queries, statuses, errors[0], time.perf_counter() - start)
+
+
+def trace_queries(backend):
+    """Swap the app's pools for ones recording each statement on the thread
+    running it, which is the thread serving the request
+    """
+    from app.pool import ConnectionPool
+
+    traced = threading.local()
+
+    class TracingPool(ConnectionPool):
+        def connect(self):
+            db = super().connect()
+            db.set_trace_callback(
+                lambda statement: getattr(traced, "statements", []).append(statement)
+            )
+            return db
+
+    backend.pool = TracingPool(
+        config.DATABASE,
+        1,
+        config.DATABASE_PRAGMAS,
+        max_open=1,
+        timeout=config.DATABASE_WRITER_TIMEOUT,
+        factory=backend.CONNECTION_CLASS,
+    )
+    backend.read_pool = TracingPool(
+        config.DATABASE,
+        config.DATABASE_POOL_SIZE,
+        config.DATABASE_PRAGMAS,
+        read_only=True,
+        factory=backend.CONNECTION_CLASS,
+    )
+    return traced
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict]):
+    """Print how each route's throughput, p99 and queries changed from the
+    baseline's
+    """
+    print(f"\n{'route':<28} {'req/s':>15} {'p99 ms':>17} {'queries':>13}")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        speedup = result["requests_per_second"] / old["requests_per_second"]
+        print(
+            f"{name:<28} {speedup:>14.2f}x"
+            f" {old['latency_ms']['p99']:>7.2f} -> {result['latency_ms']['p99']:<7.2f}"
+            f" {old['queries_per_request']['mean']:>5.1f} -> "
+            f"{result['queries_per_request']['mean']:<5.1f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=20, help="users to seed")
+    parser.add_argument("--courses", type=int, default=10, help="courses per user")
+    parser.add_argument("--clos", type=int, default=10, help="CLOs per course")
+    parser.add_argument("--assessments", type=int, default=5, help="per course")
+    parser.add_argument("--ratings", type=int, default=100, help="of each per user")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=25, help="per client")
+    parser.add_argument(
+        "--routes", nargs="*", help="only load routes whose name contains these"
+    )
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--baseline", help="JSON written by an earlier run")
+    args = parser.parse_args()
+    args.courses = max(args.courses, 1)
+    args.clients = min(args.clients, args.users)
+
+    use_temporary_database()
+    # background renders would run their queries while others are being counted
+    config.RENDER_CACHE_PREWARM = False
+    import app as backend
+
+    sessions = seed(backend, args)
+    traced = trace_queries(backend)
+    # load the evaluator and reportlab before timing
+    backend.warm_up().join()
+
+    results: Dict[str, dict] = {}
+    failed = False
+    print(
+        f"{'route':<28} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'queries':>8} {'errors':>7}"
+    )
+    for scenario in SCENARIOS:
+        if args.routes and not any(route in scenario.name for route in args.routes):
+            continue
+        result = run(scenario, sessions, args.requests, traced).summary()
+        results[scenario.name] = {"method": scenario.method, **result}
+        failed = failed or result["errors"] > 0
+        latency = result["latency_ms"]
+        print(
+            f"{scenario.name:<28} {result['requests_per_second']:>9.1f} "
+            f"{latency['p50']:>9.2f} {latency['p95']:>9.2f} {latency['p99']:>9.2f} "
+            f"{result['queries_per_request']['mean']:>8.1f} {result['errors']:>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "sqlite": sqlite3.sqlite_version,
+                    "parameters": vars(args),
+                    "routes": results,
+                },
+                f,
+                indent=2,
+            )
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f)["routes"])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Measure how long a fresh process takes to import the app and how long a
+fresh server takes to answer its first request.
+
+Exits with a non-zero status if the median of either goes over its threshold,
+or if a module which should be loaded lazily is imported with the app.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import List
+
+# modules which must only be imported when first used
+LAZY_MODULES = ["reportlab", "app.evaluation.evaluator"]
+
+IMPORT_APP = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+RUN_SERVER = """
+import sys
+import config
+config.DATABASE = sys.argv[1]
+from app import app, warm_up
+warm_up()
+app.run(port=int(sys.argv[2]), debug=False, use_reloader=False)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_import() -> dict:
+    """Import the app in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_APP], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output)
+
+
+def time_first_response(database: str, timeout: float = 30) -> float:
+    """Start a server in a fresh interpreter and poll it until it answers,
+    returning the seconds from starting the interpreter to the first response
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/login_status"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-c", RUN_SERVER, database, str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(url, timeout=timeout).read()
+                return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise TimeoutError(f"The server did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-import-seconds", type=float, default=1.0)
+    parser.add_argument("--max-first-response-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    failed = False
+    imports: List[float] = []
+    for _ in range(args.repeats):
+        result = time_import()
+        imports.append(result["seconds"])
+        for module in LAZY_MODULES:
+            if module in result["modules"]:
+                print(f"FAIL  {module} is imported along with the app")
+                failed = True
+
+    first_responses: List[float] = []
+    for _ in range(args.repeats):
+        # a new database each time, so the first request also creates the tables
+        database = os.path.join(tempfile.mkdtemp(prefix="clog-bench-"), "clog.sqlite")
+        first_responses.append(time_first_response(database))
+
+    for label, times, threshold in [
+        ("import app", imports, args.max_import_seconds),
+        ("first response", first_responses, args.max_first_response_seconds),
+    ]:
+        median = statistics.median(times)
+        ok = median <= threshold
+        failed = failed or not ok
+        print(
+            f"{'OK' if ok else 'FAIL':<5} {label:<15} median {median:6.3f}s, "
+            f"min {min(times):6.3f}s, max {max(times):6.3f}s "
+            f"(threshold {threshold}s)"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
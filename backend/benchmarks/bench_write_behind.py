@@ -0,0 +1,77 @@
+"""Compare requests/sec of /set_clo_rating and /send_message with each insert
+committed by its request against queueing them in the write-behind buffer
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+
+import config
+from benchmarks.common import use_temporary_database, logged_in_client, csrf_headers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument(
+        "--synchronous",
+        default=config.DATABASE_PRAGMAS["synchronous"],
+        help="SQLite synchronous pragma, FULL fsyncs on every commit",
+    )
+    args = parser.parse_args()
+
+    use_temporary_database()
+    config.DATABASE_PRAGMAS = {
+        **config.DATABASE_PRAGMAS,
+        "synchronous": args.synchronous,
+    }
+    config.RENDER_CACHE_PREWARM = False
+    import app as backend
+
+    clients = [logged_in_client(backend.app) for _ in range(args.threads)]
+
+    def send(client, n: int):
+        for i in range(n):
+            route, body = (
+                ("/set_clo_rating", {"text": f"Outcome {i % 50}", "rating": "positive"})
+                if i % 10
+                else ("/send_message", {"text": f"Feedback {i}"})
+            )
+            response = client.post(
+                route, data=json.dumps(body), headers=csrf_headers(client)
+            )
+            assert json.loads(response.data)["success"], response.data
+
+    for enabled in [False, True]:
+        config.WRITE_BEHIND_ENABLED = enabled
+        per_thread = args.requests // args.threads
+        threads = [
+            threading.Thread(target=send, args=(client, per_thread))
+            for client in clients
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        backend.write_buffer.flush()
+        drained = time.perf_counter() - start
+        stats = backend.write_buffer.stats()
+        print(
+            f"write-behind {'on ' if enabled else 'off'}: "
+            f"{per_thread * args.threads / elapsed:8.1f} requests/sec, "
+            f"all written after {drained:6.2f}s, "
+            f"{stats['flushes']} flushes of {stats['batch_size_mean']:.1f} events"
+        )
+    db = sqlite3.connect(config.DATABASE)
+    ratings = db.execute("SELECT COUNT(*) FROM CLO_RATINGS").fetchone()[0]
+    messages = db.execute("SELECT COUNT(*) FROM FEEDBACK").fetchone()[0]
+    print(f"{ratings} ratings and {messages} messages in the database")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Drive the app's routes through the Flask test client and check how many SQL
+statements each request runs against a per-route budget.
+
+Exits with a non-zero status if any route goes over its budget.
+"""
+
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from werkzeug.test import TestResponse
+
+import config
+from benchmarks.common import (
+    use_temporary_database,
+    logged_in_client,
+    csrf_headers,
+    counted_queries,
+)
+
+# (method, route, body, maximum number of statements)
+# routes which only need current_user.id must not load the user's course
+BUDGETS: List[Tuple[str, str, Optional[dict], int]] = [
+    ("GET", "/login_status", None, 1),
+    ("POST", "/add_clo", {"text": "An outcome"}, 3),
+    ("POST", "/remove_clo", {"text": "An outcome"}, 3),
+    ("POST", "/add_assessment", {"text": "Exam", "weight": 50}, 3),
+    ("POST", "/remove_assessment", {"text": "Exam", "weight": 50}, 3),
+    (
+        "POST",
+        "/update_course_items",
+        {
+            "clos": {"add": [{"text": "A"}, {"text": "B"}], "remove": [{"text": "A"}]},
+            "assessments": {"add": [{"text": "Quiz", "weight": 10}]},
+        },
+        6,
+    ),
+    ("POST", "/set_clo_rating", {"text": "An outcome", "rating": 5}, 2),
+    (
+        "POST",
+        "/set_assessment_rating",
+        {"text": "Exam", "weight": 50, "rating": 5},
+        2,
+    ),
+    ("POST", "/send_message", {"text": "Feedback"}, 2),
+    ("GET", "/rating_stats", None, 3),
+    ("GET", "/rating_stats?type=assessment&order=count", None, 3),
+    ("GET", "/rating_stats?type=clo&text=An%20outcome", None, 3),
+    ("GET", "/course_info", None, 5),
+    ("GET", "/all_course_info", None, 4),
+    ("GET", "/download/json", None, 5),
+    ("GET", "/logoff", None, 1),
+]
+# (route, maximum number of statements) of routes that answer a request with a
+# current If-None-Match with a 304, without loading or rendering the course
+CONDITIONAL_BUDGETS: List[Tuple[str, int]] = [
+    ("/course_info", 2),
+    ("/download/json", 2),
+    ("/download/pdf", 2),
+    ("/download/pdf/1", 2),
+]
+# routes which must not even take a database connection, /ready answers 503 until
+# the worker has warmed up
+NO_DB_ROUTES: List[str] = [
+    "/health",
+    "/ready",
+    "/cache_stats",
+    "/evaluator_stats",
+    "/write_buffer_stats",
+    "/render_job_stats",
+]
+
+
+def main() -> int:
+    use_temporary_database()
+    # background renders would run their queries while others are being counted
+    config.RENDER_CACHE_PREWARM = False
+    import app as backend
+    from app.courses.io import Writer
+    from app.pool import ConnectionPool
+
+    statements: List[str] = []
+    renders: List[Writer] = []
+    acquired: List[ConnectionPool] = []
+
+    class TracingPool(ConnectionPool):
+        def acquire(self):
+            acquired.append(self)
+            return super().acquire()
+
+        def connect(self):
+            db = super().connect()
+            db.set_trace_callback(statements.append)
+            return db
+
+    def counting(save):
+        def wrapper(self, path):
+            renders.append(self)
+            return save(self, path)
+
+        return wrapper
+
+    backend.pool = TracingPool(
+        config.DATABASE,
+        1,
+        config.DATABASE_PRAGMAS,
+        max_open=1,
+        timeout=config.DATABASE_WRITER_TIMEOUT,
+        factory=backend.CONNECTION_CLASS,
+    )
+    backend.read_pool = TracingPool(
+        config.DATABASE,
+        config.DATABASE_POOL_SIZE,
+        config.DATABASE_PRAGMAS,
+        read_only=True,
+        factory=backend.CONNECTION_CLASS,
+    )
+    for writer_class in Writer.__subclasses__():
+        writer_class.save = counting(writer_class.save)
+    client = logged_in_client(backend.app)
+
+    def request(
+        method: str,
+        route: str,
+        body: Optional[dict] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[TestResponse, List[str]]:
+        """Make a request, returning the response and the statements it ran"""
+        statements.clear()
+        renders.clear()
+        acquired.clear()
+        response = client.open(
+            route,
+            method=method,
+            data=None if body is None else json.dumps(body),
+            headers={**csrf_headers(client), **(headers or {})},
+        )
+        # streamed responses only run their queries as the body is read
+        response.get_data()
+        return response, counted_queries(statements)
+
+    def report(ok: bool, method: str, route: str, status: int, queries, budget: int):
+        print(
+            f"{'OK' if ok else 'FAIL':<5} {method:<4} {route:<24} "
+            f"{len(queries):>3} queries (budget {budget}), status {status}"
+        )
+        if not ok:
+            for query in queries:
+                print(f"{'':<10}{' '.join(query.split())[:100]}")
+
+    request(
+        "POST",
+        "/modify_course",
+        {"title": "Title", "discipline": "D", "code": "C", "faculty": "F"},
+    )
+
+    failed = False
+    for method, route, body, budget in BUDGETS:
+        response, queries = request(method, route, body)
+        ok = response.status_code == 200 and len(queries) <= budget
+        failed = failed or not ok
+        report(ok, method, route, response.status_code, queries, budget)
+
+    # /logoff above cleared the cookies
+    request("POST", "/login", {"username": "bench", "password": "benchmark"})
+    for route, budget in CONDITIONAL_BUDGETS:
+        etag = request("GET", route)[0].headers["ETag"]
+        response, queries = request("GET", route, headers={"If-None-Match": etag})
+        ok = response.status_code == 304 and len(queries) <= budget and not renders
+        failed = failed or not ok
+        report(ok, "GET", f"{route} (cached)", response.status_code, queries, budget)
+
+    for route in NO_DB_ROUTES:
+        response, queries = request("GET", route)
+        ok = response.status_code in (200, 503) and not acquired
+        failed = failed or not ok
+        print(
+            f"{'OK' if ok else 'FAIL':<5} GET  {route:<24} "
+            f"{len(acquired):>3} connections (budget 0), status {response.status_code}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
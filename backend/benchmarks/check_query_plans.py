@@ -0,0 +1,201 @@
+"""Run every function in app.database against a seeded database and check the
+query plan of each statement they execute, failing on any full table scan.
+
+Exits with a non-zero status if a statement scans a table or if a function in
+app.database is not exercised here, so new queries are checked too.
+"""
+
+import inspect
+import re
+import sqlite3
+import sys
+from typing import Callable, Dict, List, Set
+
+import app.database as database
+from app.cache import course_cache
+from app.courses.assessment import Assessment
+from app.courses.clo import Clo
+from app.courses.course import Course
+from benchmarks.common import create_schema, seed_courses, seed_ratings
+
+USER_ID = 1
+# statements which have a query plan worth checking
+PLANNED_STATEMENTS = ("SELECT", "UPDATE", "DELETE")
+
+
+def calls(cursor: sqlite3.Cursor) -> Dict[str, Callable[[], object]]:
+    """Calls exercising each function in app.database, keyed by function name"""
+    course = Course(
+        "Title",
+        "Discipline",
+        "CODE1234",
+        "Faculty",
+        "Description",
+        [Clo("Learning outcome 0"), Clo("A new outcome")],
+        [Assessment("Assessment 1", 33)],
+    )
+    rows = cursor.execute(
+        "SELECT * FROM COURSES WHERE USER_ID=?", (USER_ID,)
+    ).fetchall()
+    return {
+        "get_cached_course_from_db": lambda: database.get_cached_course_from_db(
+            USER_ID, 1, cursor
+        ),
+        "get_course_version_from_db": lambda: (
+            database.get_course_version_from_db(USER_ID, 1, cursor),
+            database.get_course_version_from_db(USER_ID, None, cursor),
+        ),
+        "list_courses_from_db": lambda: database.list_courses_from_db(
+            USER_ID, 100, 20, cursor
+        ),
+        "page_cached_courses_from_db": lambda: database.page_cached_courses_from_db(
+            USER_ID, 100, 20, cursor
+        ),
+        "iter_cached_courses_from_db": lambda: list(
+            database.iter_cached_courses_from_db(USER_ID, 200, cursor)
+        ),
+        "iter_courses_from_db": lambda: list(
+            database.iter_courses_from_db(USER_ID, 200, cursor)
+        ),
+        "update_course_in_db": lambda: database.update_course_in_db(
+            USER_ID, 1, course, cursor
+        ),
+        "get_last_course_from_db": lambda: database.get_last_course_from_db(
+            USER_ID, cursor
+        ),
+        "get_cached_last_course_from_db": lambda: (
+            database.get_cached_last_course_from_db(USER_ID, cursor)
+        ),
+        "get_cached_courses_from_db": lambda: database.get_cached_courses_from_db(
+            USER_ID, rows[:2], cursor
+        ),
+        "load_courses_from_db": lambda: (
+            database.load_courses_from_db(USER_ID, rows[:1], cursor),
+            database.load_courses_from_db(USER_ID, rows, cursor),
+        ),
+        "get_user_from_db": lambda: database.get_user_from_db("user", cursor),
+        "get_course_id_from_db": lambda: database.get_course_id_from_db(
+            USER_ID, cursor
+        ),
+        "add_clo_to_db": lambda: database.add_clo_to_db(
+            USER_ID, 1, Clo("Another outcome"), cursor
+        ),
+        "delete_clo_from_db": lambda: (
+            database.delete_clo_from_db(USER_ID, 1, Clo("Another outcome"), cursor),
+            database.delete_clo_from_db(USER_ID, 1, Clo("", 1), cursor),
+        ),
+        "add_clos_to_db": lambda: database.add_clos_to_db(
+            USER_ID, 1, [Clo("Another outcome"), Clo("A new outcome")], cursor
+        ),
+        "delete_clos_from_db": lambda: database.delete_clos_from_db(
+            USER_ID, 1, [Clo("Another outcome"), Clo("Missing outcome", 2)], cursor
+        ),
+        "add_assessments_to_db": lambda: database.add_assessments_to_db(
+            USER_ID, 1, [Assessment("Another assessment", 10)], cursor
+        ),
+        "delete_assessments_from_db": lambda: database.delete_assessments_from_db(
+            USER_ID, 1, [Assessment("Another assessment", 10)], cursor
+        ),
+        "add_assessment_to_db": lambda: database.add_assessment_to_db(
+            USER_ID, 1, Assessment("Another assessment", 10), cursor
+        ),
+        "delete_assessment_from_db": lambda: (
+            database.delete_assessment_from_db(
+                USER_ID, 1, Assessment("Another assessment", 10), cursor
+            ),
+            database.delete_assessment_from_db(
+                USER_ID, 1, Assessment("", 0, 1), cursor
+            ),
+        ),
+        "add_course_to_db": lambda: database.add_course_to_db(USER_ID, course, cursor),
+        "add_evaluations_to_db": lambda: database.add_evaluations_to_db(
+            "1", {"a": "[]", "b": "{}"}, cursor
+        ),
+        "prune_evaluations_from_db": lambda: database.prune_evaluations_from_db(
+            "2", cursor
+        ),
+        "get_evaluations_from_db": lambda: database.get_evaluations_from_db(
+            ["a", "c"], cursor
+        ),
+        "get_clo_rating_stats_from_db": lambda: database.get_clo_rating_stats_from_db(
+            " Learning Outcome 0", cursor
+        ),
+        "get_top_clo_rating_stats_from_db": lambda: [
+            database.get_top_clo_rating_stats_from_db(10, order, cursor)
+            for order in database.RATING_STATS_ORDERS
+        ],
+        "get_assessment_rating_stats_from_db": lambda: (
+            database.get_assessment_rating_stats_from_db("Assessment 1", 33, cursor)
+        ),
+        "get_top_assessment_rating_stats_from_db": lambda: [
+            database.get_top_assessment_rating_stats_from_db(10, order, cursor)
+            for order in database.RATING_STATS_ORDERS
+        ],
+    }
+
+
+def full_scans(db: sqlite3.Connection, statement: str) -> List[str]:
+    """Get the steps of a statement's query plan that scan a whole table
+
+    A scan of an index which gives the rows in the statement's order is not a
+    full scan when the statement has a LIMIT, as it stops after that many rows
+    """
+    plan = db.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    details = [row["detail"] for row in plan]
+    limited = re.search(r"\bLIMIT\b", statement, re.IGNORECASE) and not any(
+        detail.startswith("USE TEMP B-TREE") for detail in details
+    )
+    return [
+        detail
+        for detail in details
+        if detail.startswith("SCAN ") and not (limited and " USING " in detail)
+    ]
+
+
+def main() -> int:
+    db = sqlite3.connect(":memory:")
+    db.row_factory = sqlite3.Row
+    create_schema(db)
+    db.execute("INSERT INTO USERS (USERNAME, PASSWORD) VALUES ('user', 'password')")
+    # enough courses to exercise both branches of load_courses_from_db
+    seed_courses(db, USER_ID, database.MAX_COURSES_PER_QUERY + 1)
+    seed_courses(db, USER_ID + 1, 10)
+    seed_ratings(db, USER_ID, 100)
+    cursor = db.cursor()
+
+    failed = False
+    functions: Set[str] = {
+        name
+        for name, function in inspect.getmembers(database, inspect.isfunction)
+        if function.__module__ == database.__name__ and not name.startswith("_")
+    }
+    to_call = calls(cursor)
+    for name in sorted(functions - set(to_call)):
+        print(f"MISSING  {name} is not exercised by {__name__}")
+        failed = True
+
+    for name, call in to_call.items():
+        # make every call go to the database
+        course_cache.clear()
+        statements: List[str] = []
+        db.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            db.set_trace_callback(None)
+        # trigger programs are traced with the statement that fired them
+        for statement in dict.fromkeys(statements):
+            if not statement.lstrip().upper().startswith(PLANNED_STATEMENTS):
+                continue
+            scans = full_scans(db, statement)
+            status = "SCAN" if scans else "OK"
+            failed = failed or bool(scans)
+            print(f"{status:<8} {name}: {' '.join(statement.split())[:100]}")
+            for detail in scans:
+                print(f"{'':<8}   {detail}")
+    db.rollback()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
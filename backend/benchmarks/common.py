@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import config
+
+COUNTED_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def use_temporary_database() -> str:
+    """Point the app at a fresh database file, render cache, metrics and slow query
+    log, must be called before importing app
+    """
+    directory = tempfile.mkdtemp(prefix="clog-bench-")
+    config.DATABASE = os.path.join(directory, "clog.sqlite")
+    config.RENDER_CACHE_DIR = os.path.join(directory, "render_cache")
+    config.METRICS_DIR = os.path.join(directory, "metrics")
+    config.SLOW_QUERY_LOG_DIR = os.path.join(directory, "slow_queries")
+    return config.DATABASE
+
+
+def logged_in_client(flask_app, username: str = "bench", password: str = "benchmark"):
+    """Register and login a user, returning a test client holding their cookies"""
+    client = flask_app.test_client()
+    credentials = {
+        "username": username,
+        "password": password,
+        "password_confirm": password,
+    }
+    client.post("/register", data=json.dumps(credentials))
+    client.post("/login", data=json.dumps(credentials))
+    return client
+
+
+def csrf_headers(client) -> Dict[str, str]:
+    """Headers needed to POST to a `jwt_required` route with the given client"""
+    for cookie in client.cookie_jar:
+        if cookie.name == "csrf_access_token":
+            return {"X-CSRF-TOKEN": cookie.value}
+    return {}
+
+
+def rate(func: Callable[[], object], iterations: int) -> float:
+    """Call `func` `iterations` times and return the number of calls per second"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - start)
+
+
+def percentile(times: List[float], p: float) -> float:
+    """Get the `p`th percentile of the given times, by nearest rank"""
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def counted_queries(statements: List[str]) -> List[str]:
+    """Get the queries among statements traced with set_trace_callback, leaving
+    out transaction control and pragmas
+    """
+    # trigger programs are traced again with the statement that fired them
+    return [
+        statement
+        for i, statement in enumerate(statements)
+        if statement.lstrip().upper().startswith(COUNTED_STATEMENTS)
+        and (i == 0 or statement != statements[i - 1])
+    ]
+
+
+def create_schema(db: sqlite3.Connection):
+    """Create the app's tables in the given database at the latest schema version"""
+    # importing anything from app creates the app, which has to happen after
+    # use_temporary_database is called
+    from app.migrations import migrate
+
+    with open(config.CREATE_TABLES_SQL) as f:
+        db.executescript(f.read())
+    migrate(db, config.MIGRATIONS_DIR)
+
+
+def seed_courses(
+    db: sqlite3.Connection,
+    user_id: int,
+    courses: int,
+    clos: int = 5,
+    assessments: int = 3,
+):
+    """Insert `courses` synthetic courses, each with `clos` course learning
+    outcomes and `assessments` assessments, for the given user
+    """
+    for n in range(courses):
+        course_id = db.execute(
+            """
+            INSERT INTO COURSES (USER_ID, TITLE, DISCIPLINE, CODE, FACULTY, DESCRIPTION)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                user_id,
+                f"Course {n}",
+                "Computing",
+                f"COMP{n:04}",
+                "Engineering",
+                f"A synthetic course description for course {n}",
+            ),
+        ).lastrowid
+        db.executemany(
+            "INSERT INTO CLOS (USER_ID, COURSE_ID, TEXT) VALUES (?, ?, ?)",
+            [(user_id, course_id, f"Learning outcome {i}") for i in range(clos)],
+        )
+        db.executemany(
+            """
+            INSERT INTO ASSESSMENTS (USER_ID, COURSE_ID, TEXT, WEIGHT)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (user_id, course_id, f"Assessment {i}", 100 // assessments)
+                for i in range(assessments)
+            ],
+        )
+    db.commit()
+
+
+def seed_ratings(db: sqlite3.Connection, user_id: int, ratings: int):
+    """Insert `ratings` synthetic ratings of each of the clos and assessments
+    seed_courses inserts, for the given user
+    """
+    choices = ["positive", "neutral", "negative", 5]
+    db.executemany(
+        "INSERT INTO CLO_RATINGS VALUES (?, ?, ?)",
+        [
+            (user_id, f"Learning outcome {i % 5}", choices[i % len(choices)])
+            for i in range(ratings)
+        ],
+    )
+    db.executemany(
+        "INSERT INTO ASSESSMENT_RATINGS VALUES (?, ?, ?, ?)",
+        [
+            (user_id, f"Assessment {i % 3}", 33, choices[i % len(choices)])
+            for i in range(ratings)
+        ],
+    )
+    db.commit()
+
+
+def count_queries(db: sqlite3.Connection, func: Callable[[], object]) -> int:
+    """Call `func` and return the number of statements it ran on `db`"""
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        db.set_trace_callback(None)
+    return len(statements)
+
+
+def load_all_courses(user_id: int, cursor: sqlite3.Cursor) -> List[str]:
+    """Get all of a user's courses published as JSON, in one list, as the app
+    did before /all_course_info was streamed
+    """
+    from app.database import get_cached_courses_from_db
+
+    cursor.execute("SELECT * FROM COURSES WHERE USER_ID=?", (user_id,))
+    rows = cursor.fetchall()
+    return [
+        cached.payload for cached in get_cached_courses_from_db(user_id, rows, cursor)
+    ]
@@ -0,0 +1,114 @@
+"""Add up the slow statements every worker logged to SLOW_QUERY_LOG_DIR, with
+the slow query log enabled, and print the ones which took the most time in total.
+
+Statements are grouped by their normalised SQL, so one query run once per row
+(an N+1 pattern) shows up as a single statement run many times. Those whose
+query plan scans a whole table are marked as missing an index.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from typing import Dict, Iterable, List
+
+import config
+
+
+def read_records(paths: Iterable[str]) -> Iterable[dict]:
+    """Read the records in the given log files, skipping lines which are not"""
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def scans(plan: List[str]) -> bool:
+    """Whether a query plan reads a whole table rather than using an index"""
+    return any(
+        line.strip().startswith("SCAN ") and " USING " not in line for line in plan
+    )
+
+
+def aggregate(records: Iterable[dict]) -> List[dict]:
+    """Add up the records by their SQL, most total seconds first"""
+    statements: Dict[str, dict] = {}
+    for record in records:
+        statement = statements.setdefault(
+            record["sql"],
+            {
+                "sql": record["sql"],
+                "count": 0,
+                "rows": 0,
+                "total_seconds": 0.0,
+                "max_seconds": 0.0,
+                "callers": {},
+                "parameters": record["parameters"],
+                "plan": None,
+                "last_seen": 0.0,
+            },
+        )
+        statement["count"] += 1
+        statement["rows"] += record["rows"]
+        statement["total_seconds"] += record["seconds"]
+        statement["max_seconds"] = max(statement["max_seconds"], record["seconds"])
+        callers = statement["callers"]
+        callers[record["caller"]] = callers.get(record["caller"], 0) + 1
+        if record["time"] >= statement["last_seen"]:
+            # the latest plan, which is the one the data has grown into
+            statement["last_seen"] = record["time"]
+            statement["plan"] = record["plan"]
+    for statement in statements.values():
+        statement["mean_seconds"] = statement["total_seconds"] / statement["count"]
+        statement["missing_index"] = scans(statement["plan"] or [])
+    return sorted(statements.values(), key=lambda s: s["total_seconds"], reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--directory",
+        default=config.SLOW_QUERY_LOG_DIR,
+        help="directory the workers logged to",
+    )
+    parser.add_argument("--limit", type=int, default=20, help="statements to print")
+    parser.add_argument("--output", help="file to write every statement to as JSON")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "*.log*")))
+    if not paths:
+        print(f"No slow query logs in {args.directory}", file=sys.stderr)
+        return 1
+    statements = aggregate(read_records(paths))
+
+    print(f"{len(statements)} slow statements logged in {len(paths)} files\n")
+    for rank, statement in enumerate(statements[: args.limit], start=1):
+        flag = "  [missing index?]" if statement["missing_index"] else ""
+        print(
+            f"{rank}. {statement['total_seconds'] * 1000:.1f} ms total, "
+            f"{statement['count']} runs, {statement['mean_seconds'] * 1000:.2f} ms "
+            f"mean, {statement['max_seconds'] * 1000:.2f} ms max{flag}"
+        )
+        print(f"   {statement['sql']}")
+        print(f"   parameters: {', '.join(statement['parameters']) or 'none'}")
+        top_callers = sorted(statement["callers"].items(), key=lambda c: -c[1])
+        for caller, count in top_callers[:3]:
+            print(f"   {count:>6} from {caller}")
+        for line in statement["plan"] or []:
+            print(f"   | {line}")
+        print()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(statements, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
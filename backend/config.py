@@ -1,3 +1,108 @@
 DATABASE = "clog.sqlite"
 CREATE_TABLES_SQL = "scripts/create_tables.sql"
+MIGRATIONS_DIR = "scripts/migrations"
 ERROR_MESSAGE = dict(success=False, result="Unknown error")
+# address the production server listens on, see gunicorn.conf.py, and the number
+# of worker processes it forks, each serving requests with this many threads
+SERVER_BIND = "0.0.0.0:5000"
+SERVER_WORKERS = 4
+SERVER_THREADS = 4
+# a worker is replaced after serving this many requests, plus up to the jitter so
+# workers are not all replaced at once
+SERVER_MAX_REQUESTS = 10000
+SERVER_MAX_REQUESTS_JITTER = 1000
+# seconds a silent worker lives before it is killed, and seconds a worker gets to
+# finish its requests when it is stopped or replaced
+SERVER_TIMEOUT = 60
+SERVER_GRACEFUL_TIMEOUT = 30
+# number of idle read-only connections each worker keeps open, 0 opens one per
+# request. Each worker writes with a single connection, one request at a time.
+DATABASE_POOL_SIZE = 4
+# seconds a request waits for its worker's writer connection
+DATABASE_WRITER_TIMEOUT = 5
+# applied once to every new connection
+DATABASE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # in KiB
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 5000,  # in ms
+}
+# bounds on the in-process cache of courses, sizes are in bytes of published JSON
+COURSE_CACHE_MAX_ENTRIES = 1024
+COURSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# number of courses returned by /courses by default and at most
+COURSES_PAGE_SIZE = 20
+COURSES_MAX_PAGE_SIZE = 100
+# number of courses read from the database at a time by /all_course_info
+COURSES_STREAM_PAGE_SIZE = 100
+# directory shared by every worker to cache rendered downloads in, and its bound
+RENDER_CACHE_DIR = "render_cache"
+RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# render changed courses into the render cache in the background
+RENDER_CACHE_PREWARM = True
+# processes rendering downloads requested as jobs, the most jobs which may be
+# queued or running at a time, seconds a job may take from being submitted and
+# seconds a finished job's status is kept
+RENDER_JOB_WORKERS = 2
+RENDER_JOB_MAX_QUEUE = 32
+RENDER_JOB_TIMEOUT = 30
+RENDER_JOB_RESULT_TTL = 5 * 60
+# seconds clients are told to wait before asking about a job again
+RENDER_JOB_RETRY_AFTER = 1
+# processes rendering courses in parallel for /export, 0 renders them in the
+# worker serving the request
+EXPORT_WORKERS = 4
+# how processes rendering jobs and exports and running the evaluator are
+# started, one of "forkserver", "spawn" or "fork"
+PROCESS_START_METHOD = "forkserver"
+# most CLOs /evaluate_batch evaluates in one request
+EVALUATE_BATCH_MAX_SIZE = 100
+# number of evaluator results each worker remembers in memory, in front of the
+# results remembered in the database
+EVALUATION_CACHE_MAX_ENTRIES = 10000
+# processes running the evaluator, 0 runs it in the worker serving the request,
+# the most evaluations which may be queued or running at a time, seconds an
+# evaluation may take from being submitted and seconds clients are told to wait
+# before trying again when the evaluator is busy
+EVALUATOR_WORKERS = 2
+EVALUATOR_MAX_QUEUE = 16
+EVALUATOR_TIMEOUT = 10
+EVALUATOR_RETRY_AFTER = 1
+# most CLOs and assessments /update_course_items changes in one request
+COURSE_ITEMS_BATCH_MAX_SIZE = 1000
+# number of top CLOs or assessments /rating_stats gets by default, and at most
+RATING_STATS_DEFAULT_LIMIT = 10
+RATING_STATS_MAX_LIMIT = 100
+# queue ratings and feedback in memory and write them in batches in the
+# background, a crash loses the ones not yet written
+WRITE_BEHIND_ENABLED = False
+# a batch is written once this many are queued, or the oldest has waited this
+# many seconds
+WRITE_BEHIND_BATCH_SIZE = 256
+WRITE_BEHIND_FLUSH_INTERVAL = 0.5
+# most events queued at once, past this they are written by the request
+WRITE_BEHIND_MAX_QUEUE = 10000
+# seconds a graceful shutdown waits for the queued events to be written
+WRITE_BEHIND_SHUTDOWN_TIMEOUT = 10
+# time every request and SQL statement for /metrics, which always has the render
+# and evaluator times
+METRICS_ENABLED = True
+# directory shared by every worker to write its metrics to, so /metrics adds up
+# those of every worker, and seconds between a worker's writes. The master adds
+# up the files of workers which exited into one. None only reports the metrics
+# of the worker answering.
+METRICS_DIR = "metrics"
+METRICS_WRITE_INTERVAL = 5
+# time every SQL statement, add them up by query for /query_stats and log the
+# ones taking at least SLOW_QUERY_THRESHOLD seconds, with their query plans, to
+# a file per worker in SLOW_QUERY_LOG_DIR, rotated after
+# SLOW_QUERY_LOG_MAX_BYTES keeping SLOW_QUERY_LOG_BACKUPS old files
+SLOW_QUERY_LOG_ENABLED = False
+SLOW_QUERY_THRESHOLD = 0.05
+SLOW_QUERY_LOG_DIR = "slow_queries"
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+# number of queries /query_stats gets by default, and at most
+QUERY_STATS_DEFAULT_LIMIT = 20
+QUERY_STATS_MAX_LIMIT = 200
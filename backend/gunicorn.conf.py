@@ -0,0 +1,60 @@
+"""Settings of the production server, run from the backend directory with
+
+    gunicorn -c gunicorn.conf.py run:app
+
+The master process imports the app, migrates the database and imports the slow
+dependencies once, then forks the workers, which open their own connections and
+start their own evaluator processes. Workers are replaced after serving about
+`max_requests` requests, letting each finish the requests it is serving first.
+
+Send the master SIGHUP to replace every worker with a fresh one without dropping
+requests, picking up changes to this file. New code needs a new master: send the
+old master SIGUSR2 to start one next to it, then SIGTERM once the new workers are
+up. SIGTERM stops gracefully, SIGINT at once. `WEB_CONCURRENCY` overrides the
+number of workers and `BIND` the address listened on.
+"""
+
+import os
+
+# gunicorn takes every name here as a setting, and has one called config
+import config as app_config
+
+bind = os.environ.get("BIND", app_config.SERVER_BIND)
+workers = int(os.environ.get("WEB_CONCURRENCY", app_config.SERVER_WORKERS))
+worker_class = "gthread"
+threads = app_config.SERVER_THREADS
+preload_app = True
+max_requests = app_config.SERVER_MAX_REQUESTS
+max_requests_jitter = app_config.SERVER_MAX_REQUESTS_JITTER
+timeout = app_config.SERVER_TIMEOUT
+graceful_timeout = app_config.SERVER_GRACEFUL_TIMEOUT
+accesslog = "-"
+
+
+def when_ready(server):
+    """Warm up once in the master, after the app is imported and before any
+    worker is forked
+    """
+    from app import prepare_server
+
+    prepare_server()
+    server.log.info("Prepared the app, forking %d workers", server.num_workers)
+
+
+def post_fork(server, worker):
+    from app import init_worker
+
+    init_worker()
+    server.log.info("Worker %d is serving", worker.pid)
+
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+
+    shutdown_worker()
+
+
+def child_exit(server, worker):
+    from app import retire_worker
+
+    retire_worker(worker.pid)
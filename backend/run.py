@@ -1,3 +1,5 @@
-from app import app
+from app import app, warm_up
 
-app.run(debug=True)
+if __name__ == "__main__":
+    warm_up()
+    app.run(debug=True)
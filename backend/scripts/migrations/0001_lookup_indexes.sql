@@ -0,0 +1,9 @@
+-- Indexes for the lookups in app/database.py, every one of them filters on
+-- USER_ID and most also on COURSE_ID
+CREATE INDEX IF NOT EXISTS COURSES_USER_ID_ID ON COURSES (USER_ID, ID);
+CREATE INDEX IF NOT EXISTS CLOS_USER_ID_COURSE_ID_TEXT ON CLOS (USER_ID, COURSE_ID, TEXT);
+CREATE INDEX IF NOT EXISTS ASSESSMENTS_USER_ID_COURSE_ID_TEXT_WEIGHT
+    ON ASSESSMENTS (USER_ID, COURSE_ID, TEXT, WEIGHT);
+CREATE INDEX IF NOT EXISTS CLO_RATINGS_TEXT ON CLO_RATINGS (TEXT);
+CREATE INDEX IF NOT EXISTS ASSESSMENT_RATINGS_TEXT_WEIGHT
+    ON ASSESSMENT_RATINGS (TEXT, WEIGHT);
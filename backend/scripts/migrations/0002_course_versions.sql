@@ -0,0 +1,39 @@
+-- Every change to a course or its children bumps the course's VERSION, so
+-- anything derived from a course can be checked for staleness with one lookup
+ALTER TABLE COURSES ADD COLUMN VERSION INTEGER NOT NULL DEFAULT 0;
+
+CREATE TRIGGER IF NOT EXISTS COURSES_VERSION_ON_UPDATE
+AFTER UPDATE OF TITLE, DISCIPLINE, CODE, FACULTY, DESCRIPTION ON COURSES
+BEGIN
+    UPDATE COURSES SET VERSION = VERSION + 1 WHERE ID = NEW.ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CLOS_VERSION_ON_INSERT AFTER INSERT ON CLOS
+BEGIN
+    UPDATE COURSES SET VERSION = VERSION + 1 WHERE ID = NEW.COURSE_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CLOS_VERSION_ON_UPDATE AFTER UPDATE ON CLOS
+BEGIN
+    UPDATE COURSES SET VERSION = VERSION + 1 WHERE ID IN (OLD.COURSE_ID, NEW.COURSE_ID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS CLOS_VERSION_ON_DELETE AFTER DELETE ON CLOS
+BEGIN
+    UPDATE COURSES SET VERSION = VERSION + 1 WHERE ID = OLD.COURSE_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ASSESSMENTS_VERSION_ON_INSERT AFTER INSERT ON ASSESSMENTS
+BEGIN
+    UPDATE COURSES SET VERSION = VERSION + 1 WHERE ID = NEW.COURSE_ID;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ASSESSMENTS_VERSION_ON_UPDATE AFTER UPDATE ON ASSESSMENTS
+BEGIN
+    UPDATE COURSES SET VERSION = VERSION + 1 WHERE ID IN (OLD.COURSE_ID, NEW.COURSE_ID);
+END;
+
+CREATE TRIGGER IF NOT EXISTS ASSESSMENTS_VERSION_ON_DELETE AFTER DELETE ON ASSESSMENTS
+BEGIN
+    UPDATE COURSES SET VERSION = VERSION + 1 WHERE ID = OLD.COURSE_ID;
+END;
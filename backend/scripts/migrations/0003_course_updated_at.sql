@@ -0,0 +1,66 @@
+-- Record when each course last changed, as unix time, alongside its VERSION
+ALTER TABLE COURSES ADD COLUMN UPDATED_AT INTEGER;
+UPDATE COURSES SET UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER);
+
+CREATE TRIGGER IF NOT EXISTS COURSES_UPDATED_AT_ON_INSERT AFTER INSERT ON COURSES
+BEGIN
+    UPDATE COURSES SET UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID = NEW.ID;
+END;
+
+DROP TRIGGER IF EXISTS COURSES_VERSION_ON_UPDATE;
+CREATE TRIGGER COURSES_VERSION_ON_UPDATE
+AFTER UPDATE OF TITLE, DISCIPLINE, CODE, FACULTY, DESCRIPTION ON COURSES
+BEGIN
+    UPDATE COURSES
+    SET VERSION = VERSION + 1, UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID = NEW.ID;
+END;
+
+DROP TRIGGER IF EXISTS CLOS_VERSION_ON_INSERT;
+CREATE TRIGGER CLOS_VERSION_ON_INSERT AFTER INSERT ON CLOS
+BEGIN
+    UPDATE COURSES
+    SET VERSION = VERSION + 1, UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID = NEW.COURSE_ID;
+END;
+
+DROP TRIGGER IF EXISTS CLOS_VERSION_ON_UPDATE;
+CREATE TRIGGER CLOS_VERSION_ON_UPDATE AFTER UPDATE ON CLOS
+BEGIN
+    UPDATE COURSES
+    SET VERSION = VERSION + 1, UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID IN (OLD.COURSE_ID, NEW.COURSE_ID);
+END;
+
+DROP TRIGGER IF EXISTS CLOS_VERSION_ON_DELETE;
+CREATE TRIGGER CLOS_VERSION_ON_DELETE AFTER DELETE ON CLOS
+BEGIN
+    UPDATE COURSES
+    SET VERSION = VERSION + 1, UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID = OLD.COURSE_ID;
+END;
+
+DROP TRIGGER IF EXISTS ASSESSMENTS_VERSION_ON_INSERT;
+CREATE TRIGGER ASSESSMENTS_VERSION_ON_INSERT AFTER INSERT ON ASSESSMENTS
+BEGIN
+    UPDATE COURSES
+    SET VERSION = VERSION + 1, UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID = NEW.COURSE_ID;
+END;
+
+DROP TRIGGER IF EXISTS ASSESSMENTS_VERSION_ON_UPDATE;
+CREATE TRIGGER ASSESSMENTS_VERSION_ON_UPDATE AFTER UPDATE ON ASSESSMENTS
+BEGIN
+    UPDATE COURSES
+    SET VERSION = VERSION + 1, UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID IN (OLD.COURSE_ID, NEW.COURSE_ID);
+END;
+
+DROP TRIGGER IF EXISTS ASSESSMENTS_VERSION_ON_DELETE;
+CREATE TRIGGER ASSESSMENTS_VERSION_ON_DELETE AFTER DELETE ON ASSESSMENTS
+BEGIN
+    UPDATE COURSES
+    SET VERSION = VERSION + 1, UPDATED_AT = CAST(strftime('%s', 'now') AS INTEGER)
+    WHERE ID = OLD.COURSE_ID;
+END;
@@ -0,0 +1,11 @@
+-- Results of the evaluator shared by every worker, keyed by a hash of the
+-- evaluator's version and its normalised inputs, see app/evaluations.py
+CREATE TABLE IF NOT EXISTS EVALUATIONS (
+    KEY TEXT PRIMARY KEY,
+    RESULT TEXT NOT NULL
+) WITHOUT ROWID;
+-- The version of the evaluator whose results are in EVALUATIONS
+CREATE TABLE IF NOT EXISTS EVALUATOR_VERSION (
+    ID INTEGER PRIMARY KEY CHECK (ID = 1),
+    VERSION TEXT NOT NULL
+);
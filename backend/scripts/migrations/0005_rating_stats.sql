@@ -0,0 +1,155 @@
+-- Aggregates of CLO_RATINGS and ASSESSMENT_RATINGS, keyed by the rated text
+-- normalised as lower(trim(TEXT)) (and the weight for assessments). Triggers
+-- keep them up to date in the same transaction as each rating, so reading the
+-- statistics of an item never scans the ratings. Ratings of 'positive',
+-- 'neutral' and 'negative' score 1, 0 and -1 in SUM and MEAN, numbers score
+-- themselves. RATING_COUNTS hold how many times each rating was given.
+CREATE TABLE IF NOT EXISTS CLO_RATING_STATS (
+    TEXT TEXT PRIMARY KEY,
+    COUNT INTEGER NOT NULL,
+    SUM INTEGER NOT NULL,
+    MEAN REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS CLO_RATING_STATS_MEAN ON CLO_RATING_STATS (MEAN, COUNT);
+CREATE INDEX IF NOT EXISTS CLO_RATING_STATS_COUNT ON CLO_RATING_STATS (COUNT, MEAN);
+CREATE TABLE IF NOT EXISTS CLO_RATING_COUNTS (
+    TEXT TEXT NOT NULL,
+    RATING NOT NULL,
+    COUNT INTEGER NOT NULL,
+    PRIMARY KEY (TEXT, RATING)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ASSESSMENT_RATING_STATS (
+    TEXT TEXT NOT NULL,
+    WEIGHT INTEGER NOT NULL,
+    COUNT INTEGER NOT NULL,
+    SUM INTEGER NOT NULL,
+    MEAN REAL,
+    PRIMARY KEY (TEXT, WEIGHT)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ASSESSMENT_RATING_STATS_MEAN
+    ON ASSESSMENT_RATING_STATS (MEAN, COUNT);
+CREATE INDEX IF NOT EXISTS ASSESSMENT_RATING_STATS_COUNT
+    ON ASSESSMENT_RATING_STATS (COUNT, MEAN);
+CREATE TABLE IF NOT EXISTS ASSESSMENT_RATING_COUNTS (
+    TEXT TEXT NOT NULL,
+    WEIGHT INTEGER NOT NULL,
+    RATING NOT NULL,
+    COUNT INTEGER NOT NULL,
+    PRIMARY KEY (TEXT, WEIGHT, RATING)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS CLO_RATINGS_INSERT AFTER INSERT ON CLO_RATINGS
+BEGIN
+    INSERT INTO CLO_RATING_STATS (TEXT, COUNT, SUM, MEAN)
+    SELECT lower(trim(NEW.TEXT)), 1, SCORE, SCORE
+    FROM (
+        SELECT CASE NEW.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE NEW.RATING
+        END AS SCORE
+    ) WHERE true
+    ON CONFLICT (TEXT) DO UPDATE SET
+        COUNT = COUNT + 1,
+        SUM = SUM + excluded.SUM,
+        MEAN = (SUM + excluded.SUM) * 1.0 / (COUNT + 1);
+    INSERT INTO CLO_RATING_COUNTS (TEXT, RATING, COUNT)
+    VALUES (lower(trim(NEW.TEXT)), NEW.RATING, 1)
+    ON CONFLICT (TEXT, RATING) DO UPDATE SET COUNT = COUNT + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS CLO_RATINGS_DELETE AFTER DELETE ON CLO_RATINGS
+BEGIN
+    UPDATE CLO_RATING_STATS SET
+        COUNT = COUNT - 1,
+        SUM = SUM - SCORE,
+        MEAN = CASE WHEN COUNT > 1 THEN (SUM - SCORE) * 1.0 / (COUNT - 1) END
+    FROM (
+        SELECT CASE OLD.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE OLD.RATING
+        END AS SCORE
+    )
+    WHERE TEXT = lower(trim(OLD.TEXT));
+    DELETE FROM CLO_RATING_STATS WHERE TEXT = lower(trim(OLD.TEXT)) AND COUNT = 0;
+    UPDATE CLO_RATING_COUNTS SET COUNT = COUNT - 1
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND RATING = OLD.RATING;
+    DELETE FROM CLO_RATING_COUNTS
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND RATING = OLD.RATING AND COUNT = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ASSESSMENT_RATINGS_INSERT
+AFTER INSERT ON ASSESSMENT_RATINGS
+BEGIN
+    INSERT INTO ASSESSMENT_RATING_STATS (TEXT, WEIGHT, COUNT, SUM, MEAN)
+    SELECT lower(trim(NEW.TEXT)), NEW.WEIGHT, 1, SCORE, SCORE
+    FROM (
+        SELECT CASE NEW.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE NEW.RATING
+        END AS SCORE
+    ) WHERE true
+    ON CONFLICT (TEXT, WEIGHT) DO UPDATE SET
+        COUNT = COUNT + 1,
+        SUM = SUM + excluded.SUM,
+        MEAN = (SUM + excluded.SUM) * 1.0 / (COUNT + 1);
+    INSERT INTO ASSESSMENT_RATING_COUNTS (TEXT, WEIGHT, RATING, COUNT)
+    VALUES (lower(trim(NEW.TEXT)), NEW.WEIGHT, NEW.RATING, 1)
+    ON CONFLICT (TEXT, WEIGHT, RATING) DO UPDATE SET COUNT = COUNT + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS ASSESSMENT_RATINGS_DELETE
+AFTER DELETE ON ASSESSMENT_RATINGS
+BEGIN
+    UPDATE ASSESSMENT_RATING_STATS SET
+        COUNT = COUNT - 1,
+        SUM = SUM - SCORE,
+        MEAN = CASE WHEN COUNT > 1 THEN (SUM - SCORE) * 1.0 / (COUNT - 1) END
+    FROM (
+        SELECT CASE OLD.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE OLD.RATING
+        END AS SCORE
+    )
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT;
+    DELETE FROM ASSESSMENT_RATING_STATS
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT AND COUNT = 0;
+    UPDATE ASSESSMENT_RATING_COUNTS SET COUNT = COUNT - 1
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT
+        AND RATING = OLD.RATING;
+    DELETE FROM ASSESSMENT_RATING_COUNTS
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT
+        AND RATING = OLD.RATING AND COUNT = 0;
+END;
+
+-- the ratings given before the triggers existed
+INSERT OR IGNORE INTO CLO_RATING_COUNTS (TEXT, RATING, COUNT)
+SELECT lower(trim(TEXT)), RATING, COUNT(*) FROM CLO_RATINGS
+WHERE TEXT IS NOT NULL AND RATING IS NOT NULL
+GROUP BY lower(trim(TEXT)), RATING;
+INSERT OR IGNORE INTO CLO_RATING_STATS (TEXT, COUNT, SUM, MEAN)
+SELECT TEXT, SUM(COUNT), SUM(SCORE * COUNT), SUM(SCORE * COUNT) * 1.0 / SUM(COUNT)
+FROM (
+    SELECT TEXT, COUNT, CASE RATING
+        WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+        ELSE RATING
+    END AS SCORE
+    FROM CLO_RATING_COUNTS
+)
+GROUP BY TEXT;
+INSERT OR IGNORE INTO ASSESSMENT_RATING_COUNTS (TEXT, WEIGHT, RATING, COUNT)
+SELECT lower(trim(TEXT)), WEIGHT, RATING, COUNT(*) FROM ASSESSMENT_RATINGS
+WHERE TEXT IS NOT NULL AND WEIGHT IS NOT NULL AND RATING IS NOT NULL
+GROUP BY lower(trim(TEXT)), WEIGHT, RATING;
+INSERT OR IGNORE INTO ASSESSMENT_RATING_STATS (TEXT, WEIGHT, COUNT, SUM, MEAN)
+SELECT
+    TEXT, WEIGHT, SUM(COUNT), SUM(SCORE * COUNT),
+    SUM(SCORE * COUNT) * 1.0 / SUM(COUNT)
+FROM (
+    SELECT TEXT, WEIGHT, COUNT, CASE RATING
+        WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+        ELSE RATING
+    END AS SCORE
+    FROM ASSESSMENT_RATING_COUNTS
+)
+GROUP BY TEXT, WEIGHT;
@@ -0,0 +1,13 @@
+-- Record the evaluator version of each result, so old and new workers running
+-- side by side during a reload each keep their own results, and stale versions
+-- are pruned once when the server starts rather than by whichever worker first
+-- sees a different version. The results stored so far have no version and are
+-- only a cache, so they are dropped.
+DROP TABLE IF EXISTS EVALUATIONS;
+DROP TABLE IF EXISTS EVALUATOR_VERSION;
+CREATE TABLE EVALUATIONS (
+    KEY TEXT PRIMARY KEY,
+    RESULT TEXT NOT NULL,
+    VERSION TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX EVALUATIONS_VERSION ON EVALUATIONS (VERSION);
@@ -0,0 +1,93 @@
+-- Ratings with no text, weight or rating were accepted before the rating
+-- statistics existed. They cannot be keyed in the statistics, so the triggers
+-- leave them out, as the backfill in 0005 did, rather than failing the insert.
+DROP TRIGGER IF EXISTS CLO_RATINGS_INSERT;
+CREATE TRIGGER CLO_RATINGS_INSERT AFTER INSERT ON CLO_RATINGS
+WHEN NEW.TEXT IS NOT NULL AND NEW.RATING IS NOT NULL
+BEGIN
+    INSERT INTO CLO_RATING_STATS (TEXT, COUNT, SUM, MEAN)
+    SELECT lower(trim(NEW.TEXT)), 1, SCORE, SCORE
+    FROM (
+        SELECT CASE NEW.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE NEW.RATING
+        END AS SCORE
+    ) WHERE true
+    ON CONFLICT (TEXT) DO UPDATE SET
+        COUNT = COUNT + 1,
+        SUM = SUM + excluded.SUM,
+        MEAN = (SUM + excluded.SUM) * 1.0 / (COUNT + 1);
+    INSERT INTO CLO_RATING_COUNTS (TEXT, RATING, COUNT)
+    VALUES (lower(trim(NEW.TEXT)), NEW.RATING, 1)
+    ON CONFLICT (TEXT, RATING) DO UPDATE SET COUNT = COUNT + 1;
+END;
+
+DROP TRIGGER IF EXISTS CLO_RATINGS_DELETE;
+CREATE TRIGGER CLO_RATINGS_DELETE AFTER DELETE ON CLO_RATINGS
+WHEN OLD.TEXT IS NOT NULL AND OLD.RATING IS NOT NULL
+BEGIN
+    UPDATE CLO_RATING_STATS SET
+        COUNT = COUNT - 1,
+        SUM = SUM - SCORE,
+        MEAN = CASE WHEN COUNT > 1 THEN (SUM - SCORE) * 1.0 / (COUNT - 1) END
+    FROM (
+        SELECT CASE OLD.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE OLD.RATING
+        END AS SCORE
+    )
+    WHERE TEXT = lower(trim(OLD.TEXT));
+    DELETE FROM CLO_RATING_STATS WHERE TEXT = lower(trim(OLD.TEXT)) AND COUNT = 0;
+    UPDATE CLO_RATING_COUNTS SET COUNT = COUNT - 1
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND RATING = OLD.RATING;
+    DELETE FROM CLO_RATING_COUNTS
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND RATING = OLD.RATING AND COUNT = 0;
+END;
+
+DROP TRIGGER IF EXISTS ASSESSMENT_RATINGS_INSERT;
+CREATE TRIGGER ASSESSMENT_RATINGS_INSERT AFTER INSERT ON ASSESSMENT_RATINGS
+WHEN NEW.TEXT IS NOT NULL AND NEW.WEIGHT IS NOT NULL
+    AND NEW.RATING IS NOT NULL
+BEGIN
+    INSERT INTO ASSESSMENT_RATING_STATS (TEXT, WEIGHT, COUNT, SUM, MEAN)
+    SELECT lower(trim(NEW.TEXT)), NEW.WEIGHT, 1, SCORE, SCORE
+    FROM (
+        SELECT CASE NEW.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE NEW.RATING
+        END AS SCORE
+    ) WHERE true
+    ON CONFLICT (TEXT, WEIGHT) DO UPDATE SET
+        COUNT = COUNT + 1,
+        SUM = SUM + excluded.SUM,
+        MEAN = (SUM + excluded.SUM) * 1.0 / (COUNT + 1);
+    INSERT INTO ASSESSMENT_RATING_COUNTS (TEXT, WEIGHT, RATING, COUNT)
+    VALUES (lower(trim(NEW.TEXT)), NEW.WEIGHT, NEW.RATING, 1)
+    ON CONFLICT (TEXT, WEIGHT, RATING) DO UPDATE SET COUNT = COUNT + 1;
+END;
+
+DROP TRIGGER IF EXISTS ASSESSMENT_RATINGS_DELETE;
+CREATE TRIGGER ASSESSMENT_RATINGS_DELETE AFTER DELETE ON ASSESSMENT_RATINGS
+WHEN OLD.TEXT IS NOT NULL AND OLD.WEIGHT IS NOT NULL
+    AND OLD.RATING IS NOT NULL
+BEGIN
+    UPDATE ASSESSMENT_RATING_STATS SET
+        COUNT = COUNT - 1,
+        SUM = SUM - SCORE,
+        MEAN = CASE WHEN COUNT > 1 THEN (SUM - SCORE) * 1.0 / (COUNT - 1) END
+    FROM (
+        SELECT CASE OLD.RATING
+            WHEN 'positive' THEN 1 WHEN 'neutral' THEN 0 WHEN 'negative' THEN -1
+            ELSE OLD.RATING
+        END AS SCORE
+    )
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT;
+    DELETE FROM ASSESSMENT_RATING_STATS
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT AND COUNT = 0;
+    UPDATE ASSESSMENT_RATING_COUNTS SET COUNT = COUNT - 1
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT
+        AND RATING = OLD.RATING;
+    DELETE FROM ASSESSMENT_RATING_COUNTS
+    WHERE TEXT = lower(trim(OLD.TEXT)) AND WEIGHT = OLD.WEIGHT
+        AND RATING = OLD.RATING AND COUNT = 0;
+END;
@@ -38,7 +38,7 @@ const Styles = styled.div`
 
 /**
  * Given a filetype, and a course id
- * download that course id as a given filetype
+ * download the course with that id as a given filetype
  * @param filetype
  * @param courseId
  * @returns {Promise<void>}
@@ -178,7 +178,7 @@ const HistoryPage = () => {
                 height="60px"
                 fontSize="24px"
                 onClick={() => {
-                  download('pdf', cell.row.index);
+                  download('pdf', cell.row.original.id);
                 }}
               />
               <Button
@@ -188,7 +188,7 @@ const HistoryPage = () => {
                 height="60px"
                 fontSize="24px"
                 onClick={() => {
-                  download('json', cell.row.index);
+                  download('json', cell.row.original.id);
                 }}
               />
             </>
@@ -203,7 +203,7 @@ const HistoryPage = () => {
     const resultJSON = await result.json();
     const { courses } = resultJSON;
     for (let i = 0; i < courses.length; ++i) {
-      const course = JSON.parse(courses[i]);
+      const course = courses[i];
       course.clos = course.clos.map((clo) => (`${clo.text}`));
       course.assessments = course.assessments.map((assessment) => (`${assessment.text} (${assessment.weight})`));
       courses[i] = course;